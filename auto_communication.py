@@ -5,11 +5,11 @@ Communication silencieuse et automatique sans messages visibles
 
 import os
 import asyncio
-import aiohttp
 import logging
 import time
 from datetime import datetime
 import json
+from bot.http_pool import PooledSession
 
 logger = logging.getLogger(__name__)
 
@@ -20,10 +20,14 @@ class AutoCommunicationSystem:
         self.bot_client = bot_client
         self.admin_id = admin_id
         self.server_url = os.getenv('SERVER_URL', 'http://localhost:10000')
-        self.bot_token = os.getenv('BOT_TOKEN')
         self.last_ping_time = time.time()
         self.communication_active = True
+        self.http = PooledSession()  # Session HTTP partagée (créée au premier appel)
         
+    async def close(self):
+        """Ferme la session HTTP partagée"""
+        await self.http.close()
+    
     async def start_auto_communication(self):
         """Démarrer le système de communication automatique"""
         logger.info("🔄 Démarrage du système de communication automatique")
@@ -89,13 +93,13 @@ class AutoCommunicationSystem:
     async def silent_ping_server(self):
         """Ping silencieux vers le serveur local pour maintenir l'activité"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.server_url}/ping",
-                    timeout=10
-                ) as response:
-                    if response.status == 200:
-                        logger.debug("🔄 Ping serveur silencieux réussi")
+            session = self.http.get()
+            async with session.get(
+                f"{self.server_url}/ping",
+                timeout=10
+            ) as response:
+                if response.status == 200:
+                    logger.debug("🔄 Ping serveur silencieux réussi")
                     
         except Exception as e:
             logger.debug(f"Ping serveur failed: {e}")
@@ -118,46 +122,38 @@ class AutoCommunicationSystem:
     async def check_server_health(self):
         """Vérifier la santé du serveur"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.server_url}/health",
-                    timeout=5
-                ) as response:
-                    return response.status == 200
+            session = self.http.get()
+            async with session.get(
+                f"{self.server_url}/health",
+                timeout=5
+            ) as response:
+                return response.status == 200
         except:
             return False
     
     async def wake_up_server(self):
         """Réveiller le serveur silencieusement"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.server_url}/wake-up",
-                    timeout=10
-                ) as response:
-                    if response.status == 200:
-                        logger.info("🔔 Serveur réveillé automatiquement")
+            session = self.http.get()
+            async with session.get(
+                f"{self.server_url}/wake-up",
+                timeout=10
+            ) as response:
+                if response.status == 200:
+                    logger.info("🔔 Serveur réveillé automatiquement")
         except Exception as e:
             logger.error(f"Erreur réveil serveur: {e}")
     
 
     
     async def send_telegram_message(self, message):
-        """Envoyer un message Telegram via API"""
+        """Envoyer un message Telegram via le client du bot (API HTTP en secours)"""
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-                data = {
-                    'chat_id': self.admin_id,
-                    'text': message,
-                    'parse_mode': 'Markdown'
-                }
-                
-                async with session.post(url, json=data, timeout=10) as response:
-                    if response.status == 200:
-                        logger.info("📨 Message Telegram envoyé")
-                    else:
-                        logger.error(f"Erreur envoi Telegram: {response.status}")
+            from bot.messenger import bot_messenger
+            if await bot_messenger.send(self.admin_id, message, parse_mode='md'):
+                logger.info("📨 Message Telegram envoyé")
+            else:
+                logger.error("Erreur envoi Telegram")
                         
         except Exception as e:
             logger.error(f"Erreur envoi message: {e}")
@@ -0,0 +1,3 @@
+"""
+Benchmarks hors ligne du bot (aucun compte Telegram ni réseau nécessaires)
+"""
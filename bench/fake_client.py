@@ -0,0 +1,134 @@
+"""
+Faux TelegramClient en mémoire pour les benchmarks
+Enregistre les gestionnaires comme Telethon (client.on / add_event_handler), leur distribue des
+événements synthétiques et simule les appels d'envoi (latence, FLOOD_WAIT) sans réseau.
+"""
+
+import asyncio
+import itertools
+import random
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from telethon import events
+from telethon.errors import FloodWaitError
+
+
+class FakeMessage:
+    """Message minimal : les attributs lus par le chemin de transfert"""
+
+    __slots__ = ("id", "text", "media", "grouped_id", "date", "edit_date")
+
+    def __init__(self, id, text=None, media=None, grouped_id=None, edit_date=None):
+        self.id = id
+        self.text = text
+        self.media = media
+        self.grouped_id = grouped_id
+        self.date = datetime.now(timezone.utc)
+        self.edit_date = edit_date
+
+
+class FakeEvent:
+    """Événement NewMessage / MessageEdited synthétique"""
+
+    __slots__ = ("client", "chat_id", "message")
+
+    def __init__(self, client, chat_id, message):
+        self.client = client
+        self.chat_id = chat_id
+        self.message = message
+
+
+class FakeTelegramClient:
+    """
+    Client simulé.
+    latency : (min, max) en secondes par appel d'envoi
+    flood_rate : probabilité qu'un appel déclenche un FLOOD_WAIT de flood_seconds ;
+    pendant cette fenêtre, tous les appels sont refusés comme par Telegram
+    """
+
+    def __init__(self, latency=(0.02, 0.08), flood_rate=0.0, flood_seconds=1, seed=None):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.random = random.Random(seed)
+        self.handlers = []  # (builder, callback)
+        self._ids = itertools.count(1)
+        self._flood_until = 0.0
+        self.calls = {"send_message": 0, "forward_messages": 0, "edit_message": 0, "delete_messages": 0}
+        self.flood_waits = 0
+        self.connected = True
+
+    # Gestionnaires (même interface que Telethon)
+
+    def on(self, event):
+        def decorator(callback):
+            self.add_event_handler(callback, event)
+            return callback
+        return decorator
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append((event, callback))
+
+    def remove_event_handler(self, callback, event=None):
+        before = len(self.handlers)
+        self.handlers = [
+            (builder, handler) for builder, handler in self.handlers
+            if not (handler is callback and (event is None or builder is event))
+        ]
+        return before - len(self.handlers)
+
+    def list_event_handlers(self):
+        return [(callback, builder) for builder, callback in self.handlers]
+
+    def is_connected(self):
+        return self.connected
+
+    async def disconnect(self):
+        self.connected = False
+
+    async def catch_up(self):
+        pass
+
+    async def dispatch(self, event, edited=False):
+        """Exécute les gestionnaires correspondants à la suite, comme Telethon pour une mise à jour"""
+        for builder, callback in list(self.handlers):
+            if isinstance(builder, events.MessageEdited) != edited:
+                continue
+            if builder.chats is not None and builder.chats != event.chat_id:
+                continue
+            await callback(event)
+
+    # Appels Telegram simulés
+
+    async def _call(self, name):
+        self.calls[name] += 1
+        now = time.monotonic()
+        if now < self._flood_until:
+            self.flood_waits += 1
+            raise FloodWaitError(None, capture=max(1, int(self._flood_until - now)))
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            self._flood_until = now + self.flood_seconds
+            self.flood_waits += 1
+            raise FloodWaitError(None, capture=self.flood_seconds)
+        await asyncio.sleep(self.random.uniform(*self.latency))
+
+    async def send_message(self, entity, message, **kwargs):
+        await self._call("send_message")
+        return SimpleNamespace(id=next(self._ids))
+
+    async def forward_messages(self, entity, messages, *args, **kwargs):
+        await self._call("forward_messages")
+        if isinstance(messages, list):
+            return [SimpleNamespace(id=next(self._ids)) for _ in messages]
+        return SimpleNamespace(id=next(self._ids))
+
+    async def edit_message(self, entity, message, text=None, **kwargs):
+        await self._call("edit_message")
+        return SimpleNamespace(id=message)
+
+    async def delete_messages(self, entity, message_ids, **kwargs):
+        await self._call("delete_messages")
+
+    async def get_entity(self, entity):
+        return SimpleNamespace(id=entity, title=f"Chat {entity}", username=None)
@@ -0,0 +1,215 @@
+"""
+Benchmark du chemin de transfert, sans compte Telegram
+Un FakeTelegramClient émet des messages, éditions et albums synthétiques à débit fixe vers
+SimpleRedirectionRestorer ou MessageRedirector ; le rapport donne le débit, les percentiles
+de latence (émission -> fin du gestionnaire), les appels simulés et la mémoire.
+
+    python -m bench.forwarding --pipeline restorer --rate 500 --messages 5000 --json report.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from bench.fake_client import FakeTelegramClient, FakeEvent, FakeMessage
+
+BENCH_USER_ID = 1000
+
+
+def build_redirections(count):
+    """Redirections synthétiques : une source et une destination distinctes par route"""
+    return {
+        f"bench{index}": {
+            "source_id": -1001000000000 - index,
+            "destination_id": -1002000000000 - index,
+            "phone": "0000000000",
+            "active": True,
+        }
+        for index in range(count)
+    }
+
+
+async def attach_pipeline(pipeline, client, redirections):
+    """Attache les gestionnaires du système de transfert choisi au faux client"""
+    if pipeline == "restorer":
+        from bot.simple_restorer import SimpleRedirectionRestorer
+        forwarder = SimpleRedirectionRestorer()
+        forwarder.message_mapping = {}
+        await forwarder._setup_message_handlers(client, BENCH_USER_ID, redirections)
+    else:
+        from bot.message_handler import MessageRedirector
+        forwarder = MessageRedirector()
+        forwarder.message_mapping = {}
+        await forwarder._setup_client_handlers(client, BENCH_USER_ID, redirections)
+    return forwarder
+
+
+async def run_benchmark(pipeline="restorer", routes=10, messages=2000, rate=200.0, edit_ratio=0.1,
+                        album_ratio=0.05, album_size=4, latency=(0.02, 0.08), flood_rate=0.0,
+                        flood_seconds=1, seed=1, trace_memory=False):
+    """Exécute un scénario et retourne le rapport (dict sérialisable en JSON)"""
+    from bot.metrics import messages_forwarded, handler_errors
+    from bot.tracing import forward_tracer, percentile
+
+    rng = random.Random(seed)
+    client = FakeTelegramClient(latency=latency, flood_rate=flood_rate, flood_seconds=flood_seconds, seed=seed)
+    redirections = build_redirections(routes)
+    forwarder = await attach_pipeline(pipeline, client, redirections)
+    sources = [int(data["source_id"]) for data in redirections.values()]
+
+    forwarded_before = sum(messages_forwarded._values.values())
+    errors_before = sum(handler_errors._values.values())
+    forward_tracer.records.clear()
+
+    if trace_memory:
+        tracemalloc.start()
+
+    next_ids = {source: 1 for source in sources}
+    sent = []  # (source, message id) déjà émis, cibles des éditions
+    latencies = []
+    tasks = []
+    counts = {"new": 0, "edit": 0, "album": 0}
+
+    def emit(source, message, edited=False):
+        emitted_at = time.perf_counter()
+        task = asyncio.create_task(client.dispatch(FakeEvent(client, source, message), edited=edited))
+        task.add_done_callback(lambda _: latencies.append(time.perf_counter() - emitted_at))
+        tasks.append(task)
+
+    interval = 1.0 / rate
+    started = time.perf_counter()
+    for step in range(messages):
+        delay = started + step * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        source = rng.choice(sources)
+        draw = rng.random()
+        if sent and draw < edit_ratio:
+            edit_source, message_id = rng.choice(sent)
+            emit(edit_source, FakeMessage(message_id, text=f"edit {step}", edit_date=datetime.now(timezone.utc)), edited=True)
+            counts["edit"] += 1
+        elif draw < edit_ratio + album_ratio:
+            grouped_id = step
+            for _ in range(album_size):
+                message_id = next_ids[source]
+                next_ids[source] += 1
+                emit(source, FakeMessage(message_id, media=object(), grouped_id=grouped_id))
+                sent.append((source, message_id))
+            counts["album"] += 1
+        else:
+            message_id = next_ids[source]
+            next_ids[source] += 1
+            emit(source, FakeMessage(message_id, text=f"message {step}"))
+            sent.append((source, message_id))
+            counts["new"] += 1
+
+    emitted = time.perf_counter() - started
+    await asyncio.gather(*tasks)
+    duration = time.perf_counter() - started
+
+    memory = {"max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    if trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory.update({"traced_current_bytes": current, "traced_peak_bytes": peak})
+
+    latencies.sort()
+    return {
+        "pipeline": pipeline,
+        "config": {
+            "routes": routes, "messages": messages, "rate": rate, "edit_ratio": edit_ratio,
+            "album_ratio": album_ratio, "album_size": album_size, "latency": list(latency),
+            "flood_rate": flood_rate, "flood_seconds": flood_seconds, "seed": seed,
+        },
+        "events": {**counts, "dispatched": len(tasks)},
+        "duration_seconds": duration,
+        "emit_seconds": emitted,
+        "throughput_per_second": len(tasks) / duration if duration else 0.0,
+        "forwarded": sum(messages_forwarded._values.values()) - forwarded_before,
+        "handler_errors": sum(handler_errors._values.values()) - errors_before,
+        "latency_seconds": {
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1],
+        } if latencies else {},
+        "stages": forward_tracer.summary(),
+        "client_calls": dict(client.calls),
+        "flood_waits": client.flood_waits,
+        "mapping_entries": len(forwarder.message_mapping),
+        "memory": memory,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark du chemin de transfert avec un faux client Telegram")
+    parser.add_argument("--pipeline", choices=("restorer", "redirector", "both"), default="both")
+    parser.add_argument("--routes", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=2000, help="nombre d'émissions (un album compte pour une)")
+    parser.add_argument("--rate", type=float, default=200.0, help="émissions par seconde")
+    parser.add_argument("--edit-ratio", type=float, default=0.1)
+    parser.add_argument("--album-ratio", type=float, default=0.05)
+    parser.add_argument("--album-size", type=int, default=4)
+    parser.add_argument("--latency-min", type=float, default=0.02, help="latence simulée d'un appel (s)")
+    parser.add_argument("--latency-max", type=float, default=0.08)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="probabilité de FLOOD_WAIT par appel")
+    parser.add_argument("--flood-seconds", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace-memory", action="store_true", help="mesure tracemalloc (ralentit le scénario)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", dest="json_path", help="écrit le rapport JSON dans ce fichier")
+    return parser.parse_args(argv)
+
+
+def format_report(report):
+    latency = report["latency_seconds"]
+    lines = [
+        f"[{report['pipeline']}] {report['events']['dispatched']} événements en {report['duration_seconds']:.2f}s"
+        f" -> {report['throughput_per_second']:.1f}/s",
+        f"  transférés: {report['forwarded']}  erreurs: {report['handler_errors']}  flood waits: {report['flood_waits']}",
+    ]
+    if latency:
+        lines.append(
+            f"  latence p50 {latency['p50'] * 1000:.1f} ms  p95 {latency['p95'] * 1000:.1f} ms"
+            f"  p99 {latency['p99'] * 1000:.1f} ms  max {latency['max'] * 1000:.1f} ms"
+        )
+    lines.append(f"  appels: {report['client_calls']}  mémoire: {report['memory']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # config.settings s'arrête sans identifiants : valeurs factices, aucun appel réseau n'est fait
+    for name, value in (("API_ID", "1"), ("API_HASH", "bench"), ("BOT_TOKEN", "bench")):
+        os.environ.setdefault(name, value)
+    logging.basicConfig(level=args.log_level.upper())
+    pipelines = ("restorer", "redirector") if args.pipeline == "both" else (args.pipeline,)
+
+    reports = []
+    for pipeline in pipelines:
+        report = asyncio.run(run_benchmark(
+            pipeline=pipeline, routes=args.routes, messages=args.messages, rate=args.rate,
+            edit_ratio=args.edit_ratio, album_ratio=args.album_ratio, album_size=args.album_size,
+            latency=(args.latency_min, args.latency_max), flood_rate=args.flood_rate,
+            flood_seconds=args.flood_seconds, seed=args.seed, trace_memory=args.trace_memory,
+        ))
+        reports.append(report)
+        print(format_report(report))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"benchmark": "forwarding", "reports": reports}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Micro-benchmark du stockage (bot/database.py et backends alternatifs)
+Construit des jeux user_data.json synthétiques (1k / 10k / 100k utilisateurs par défaut),
+chronomètre les opérations courantes et écrit un rapport JSON comparable d'une exécution à l'autre.
+
+    python -m bench.storage --users 1000 10000 --json storage.json
+    python -m bench.storage --baseline storage.json   # code retour 1 en cas de régression
+
+Backend PostgreSQL (optionnel) : BENCH_DATABASE_URL doit pointer vers une base dédiée ;
+les lignes insérées (identifiants >= BENCH_USER_BASE) sont supprimées à la fin.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bot.tracing import percentile
+
+# Identifiants synthétiques, hors de la plage des vrais comptes
+BENCH_USER_BASE = 9_000_000_000
+
+# Chaque opération est répétée au moins MIN_ITERATIONS fois, puis jusqu'à épuisement du budget
+MIN_ITERATIONS = 3
+MAX_ITERATIONS = 200
+TIME_BUDGET = 2.0  # secondes par opération
+
+
+def build_dataset(users, redirections_per_user=3, seed=1):
+    """Jeu de données au format de user_data.json"""
+    rng = random.Random(seed)
+    data = {
+        "licenses": {},
+        "connections": {},
+        "redirections": {},
+        "transformations": {},
+        "whitelists": {},
+        "blacklists": {},
+        "chats": {}
+    }
+    now = datetime.now()
+    for index in range(users):
+        user_id = str(BENCH_USER_BASE + index)
+        phone = f"225{rng.randrange(10**9):09d}"
+        data["licenses"][user_id] = {
+            "license": f"BENCH-{index:08d}",
+            "validated_at": now.isoformat(),
+            "active": rng.random() < 0.9
+        }
+        data["connections"][user_id] = [{
+            "phone": phone,
+            "connected_at": now.isoformat(),
+            "active": True,
+            "replaced_at": now.strftime("%d/%m/%Y %H:%M:%S")
+        }]
+        data["redirections"][user_id] = {
+            f"route{route}": {
+                "phone": phone,
+                "name": f"route{route}",
+                "channel_name": f"route{route}",
+                "source_id": -1001000000000 - rng.randrange(10**6),
+                "destination_id": -1002000000000 - rng.randrange(10**6),
+                "created_at": now.isoformat(),
+                "replaced_at": now.strftime("%d/%m/%Y %H:%M:%S"),
+                "active": True,
+                "replacement_info": ""
+            }
+            for route in range(redirections_per_user)
+        }
+    return data
+
+
+async def time_operation(operation, min_iterations=MIN_ITERATIONS, max_iterations=MAX_ITERATIONS,
+                         budget=TIME_BUDGET):
+    """Durées (ms) d'une opération asynchrone : min, moyenne, p50, p95, max"""
+    durations = []
+    deadline = time.perf_counter() + budget
+    while len(durations) < min_iterations or (len(durations) < max_iterations and time.perf_counter() < deadline):
+        started = time.perf_counter()
+        await operation()
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    return {
+        "iterations": len(durations),
+        "mean_ms": sum(durations) / len(durations),
+        "min_ms": durations[0],
+        "p50_ms": percentile(durations, 0.5),
+        "p95_ms": percentile(durations, 0.95),
+        "max_ms": durations[-1],
+    }
+
+
+class JsonBackend:
+    """Stockage actuel : bot/database.py sur un fichier user_data.json temporaire"""
+
+    name = "json"
+
+    def __init__(self, directory):
+        import bot.database as database
+        self.database = database
+        self.path = os.path.join(directory, "user_data.json")
+        database.DATA_FILE = self.path
+
+    def seed(self, data):
+        self.database.save_data(data)
+        return {"file_bytes": os.path.getsize(self.path)}
+
+    def operations(self, sample_user, phone):
+        database = self.database
+
+        async def load_data():
+            database.load_data()
+
+        snapshot = database.load_data()
+
+        async def save_data():
+            database.save_data(snapshot)
+
+        return {
+            "load_data": load_data,
+            "save_data": save_data,
+            "is_user_licensed": lambda: database.is_user_licensed(sample_user()),
+            "get_user_redirections": lambda: database.get_user_redirections(sample_user(), phone),
+            "store_redirection": lambda: database.store_redirection(
+                sample_user(), "bench", phone, "add", source_id=-1001, destination_id=-1002),
+        }
+
+    def close(self):
+        pass
+
+
+class PostgresBackend:
+    """bot/database_postgres.py sur la base BENCH_DATABASE_URL (opérations disponibles seulement)"""
+
+    name = "postgres"
+
+    def __init__(self, directory):
+        # PostgreSQLDatabase se connecte à DATABASE_URL : viser la base de benchmark
+        os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+        from bot.database_postgres import PostgreSQLDatabase
+        self.db = PostgreSQLDatabase()
+
+    def seed(self, data):
+        cursor = self.db.connection.cursor()
+        self._cleanup(cursor)
+        cursor.executemany(
+            "INSERT INTO user_licenses (user_id, license_code, active) VALUES (%s, %s, %s)",
+            [(int(user_id), lic["license"], lic["active"]) for user_id, lic in data["licenses"].items()]
+        )
+        cursor.executemany(
+            "INSERT INTO redirections (user_id, phone_number, source_chat_id, destination_chat_id, active) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [
+                (int(user_id), redir["phone"], redir["source_id"], redir["destination_id"], True)
+                for user_id, user_redirections in data["redirections"].items()
+                for redir in user_redirections.values()
+            ]
+        )
+        self.db.connection.commit()
+        cursor.close()
+        return {}
+
+    def operations(self, sample_user, phone):
+        db = self.db
+
+        async def is_user_licensed():
+            db.is_user_licensed(int(sample_user()))
+
+        async def get_user_redirections():
+            db.get_user_redirections(int(sample_user()))
+
+        async def store_redirection():
+            db.store_redirection(int(sample_user()), phone, -1001, -1002)
+
+        return {
+            "is_user_licensed": is_user_licensed,
+            "get_user_redirections": get_user_redirections,
+            "store_redirection": store_redirection,
+        }
+
+    def _cleanup(self, cursor):
+        for table in ("user_licenses", "redirections"):
+            cursor.execute(f"DELETE FROM {table} WHERE user_id >= %s", (BENCH_USER_BASE,))
+
+    def close(self):
+        cursor = self.db.connection.cursor()
+        self._cleanup(cursor)
+        self.db.connection.commit()
+        cursor.close()
+        self.db.close()
+
+
+BACKENDS = {"json": JsonBackend, "postgres": PostgresBackend}
+
+
+async def run_backend(backend_cls, users, redirections_per_user, seed):
+    """Mesure toutes les opérations d'un backend sur un jeu de `users` utilisateurs"""
+    rng = random.Random(seed)
+    data = build_dataset(users, redirections_per_user, seed)
+    phone = next(iter(data["connections"].values()))[0]["phone"]
+    user_ids = list(data["licenses"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        backend = backend_cls(directory)
+        try:
+            started = time.perf_counter()
+            seed_info = backend.seed(data)
+            del data
+            result = {
+                "backend": backend.name,
+                "users": users,
+                "redirections_per_user": redirections_per_user,
+                "seed_seconds": time.perf_counter() - started,
+                **seed_info,
+                "ops": {},
+            }
+            for op_name, operation in backend.operations(lambda: rng.choice(user_ids), phone).items():
+                result["ops"][op_name] = await time_operation(operation)
+            return result
+        finally:
+            backend.close()
+
+
+def find_regressions(results, baseline, tolerance):
+    """Opérations dont le p50 dépasse celui de la référence de plus de `tolerance` (ratio)"""
+    reference = {
+        (entry["backend"], entry["users"], op_name): stats["p50_ms"]
+        for entry in baseline.get("results", [])
+        for op_name, stats in entry["ops"].items()
+    }
+    regressions = []
+    for entry in results:
+        for op_name, stats in entry["ops"].items():
+            previous = reference.get((entry["backend"], entry["users"], op_name))
+            if previous and stats["p50_ms"] > previous * (1 + tolerance):
+                regressions.append({
+                    "backend": entry["backend"], "users": entry["users"], "op": op_name,
+                    "baseline_p50_ms": previous, "p50_ms": stats["p50_ms"],
+                })
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark du stockage des données utilisateurs")
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--redirections", type=int, default=3, help="redirections par utilisateur")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), nargs="+",
+                        help="backends mesurés (par défaut : json, et postgres si BENCH_DATABASE_URL est défini)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="écrit le rapport JSON dans ce fichier")
+    parser.add_argument("--baseline", help="rapport JSON de référence pour détecter les régressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="hausse tolérée du p50 (0.25 = +25%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    backends = args.backend or (["json", "postgres"] if os.getenv("BENCH_DATABASE_URL") else ["json"])
+
+    results = []
+    for backend_name in backends:
+        for users in args.users:
+            result = asyncio.run(run_backend(BACKENDS[backend_name], users, args.redirections, args.seed))
+            results.append(result)
+            print(f"[{backend_name}] {users} utilisateurs")
+            for op_name, stats in result["ops"].items():
+                print(f"  {op_name:<24} p50 {stats['p50_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms"
+                      f"  ({stats['iterations']} itérations)")
+
+    report = {
+        "benchmark": "storage",
+        "generated_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = find_regressions(results, json.load(f), args.tolerance)
+        for regression in report["regressions"]:
+            print(f"⚠️ Régression {regression['backend']}/{regression['users']} {regression['op']}: "
+                  f"{regression['baseline_p50_ms']:.3f} -> {regression['p50_ms']:.3f} ms")
+        exit_code = 1 if report["regressions"] else 0
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -34,6 +34,8 @@ async def handle_admin_commands(event, client):
             await handle_stats(event, client)
         elif message_text.startswith("/sessions"):
             await handle_sessions(event, client)
+        elif message_text.startswith("/latency"):
+            await handle_latency(event, client)
         else:
             await event.respond("❓ Commande admin non reconnue. Tapez /admin pour voir les commandes disponibles.")
             
@@ -56,6 +58,7 @@ async def show_admin_help(event, client):
 • `/users` - Liste des utilisateurs inscrits
 • `/stats` - Statistiques du bot
 • `/sessions` - Sessions connectées et redirections actives
+• `/latency [NOM]` - Latence des transferts (p50/p95/p99)
 
 📝 **Formats d'exemple :**
 • `/confirm 1190237801` - Confirme paiement pour l'utilisateur
@@ -237,7 +240,7 @@ async def handle_sessions(event, client):
     """Show active sessions and redirections"""
     try:
         from bot.database import load_data
-        from bot.connection import active_connections
+        from bot.client_registry import client_registry
         
         data = load_data()
         connections = data.get("connections", {})
@@ -246,16 +249,31 @@ async def handle_sessions(event, client):
         # Build sessions message
         sessions_message = "📱 **SESSIONS ACTIVES**\n\n"
         
-        # Active connection attempts (temporary sessions)
-        if active_connections:
+        # Live account clients
+        live_clients = client_registry.items()
+        if live_clients:
             sessions_message += "🔄 **Connexions en cours :**\n"
-            for user_id, conn_data in active_connections.items():
+            for (user_id, _), conn_data in live_clients:
                 phone = conn_data.get('phone', 'Inconnu')
                 sessions_message += f"• Utilisateur {user_id} - {phone}\n"
             sessions_message += "\n"
         else:
             sessions_message += "🔄 **Connexions en cours :** Aucune\n\n"
-        
+
+        # Worker processes (sharded mode)
+        from bot.workers import worker_pool
+        if worker_pool.enabled:
+            sessions_message += "🧩 **Workers :**\n"
+            for stats in await worker_pool.stats():
+                if 'error' in stats:
+                    sessions_message += f"• Worker {stats['index']} - 🔴 {stats['error']}\n"
+                else:
+                    sessions_message += (
+                        f"• Worker {stats['index']} (pid {stats['pid']}) - "
+                        f"{stats['connected']}/{stats['accounts']} compte(s) connecté(s), {stats['routed']} redirigé(s)\n"
+                    )
+            sessions_message += "\n"
+
         # Established connections
         if connections:
             sessions_message += "✅ **Connexions établies :**\n"
@@ -305,7 +323,7 @@ async def handle_sessions(event, client):
         
         # Summary
         total_active_connections = sum(len(conns) for conns in connections.values())
-        total_temp_connections = len(active_connections)
+        total_temp_connections = len(live_clients)
         total_active_redirections = sum(
             sum(1 for redir in user_redirections.values() if redir.get('active', True))
             for user_redirections in redirections.values()
@@ -321,4 +339,40 @@ async def handle_sessions(event, client):
         
     except Exception as e:
         logger.error(f"Error showing sessions: {e}")
-        await event.respond("❌ Erreur lors de la récupération des sessions.")
\ No newline at end of file
+        await event.respond("❌ Erreur lors de la récupération des sessions.")
+
+async def handle_latency(event, client):
+    """Show forwarding latency percentiles, optionally for one redirection"""
+    try:
+        from bot.tracing import forward_tracer, summarize, TRACE_STAGES
+        from bot.workers import worker_pool
+        
+        parts = event.text.split(maxsplit=1)
+        route = parts[1].strip() if len(parts) > 1 else None
+        
+        records = list(forward_tracer.records)
+        if worker_pool.enabled:
+            records += await worker_pool.trace_records()
+        summary = summarize(records, route)
+        
+        title = f"⏱️ **LATENCE DES TRANSFERTS{f' - {route}' if route else ''}**\n\n"
+        if not summary:
+            await event.respond(title + "Aucun transfert enregistré")
+            return
+        
+        latency_message = title
+        latency_message += f"📦 {summary.get('handler', {}).get('count', 0)} transfert(s) récents\n\n"
+        for stage in TRACE_STAGES:
+            values = summary.get(stage)
+            if values:
+                latency_message += (
+                    f"• `{stage}` : p50 {values['p50'] * 1000:.0f} ms - "
+                    f"p95 {values['p95'] * 1000:.0f} ms - p99 {values['p99'] * 1000:.0f} ms\n"
+                )
+        latency_message += "\nℹ️ `delivery` et `end_to_end` partent de la date du message source (précision : 1 s)"
+        
+        await event.respond(latency_message)
+        
+    except Exception as e:
+        logger.error(f"Error showing latency: {e}")
+        await event.respond("❌ Erreur lors de la récupération des latences.")
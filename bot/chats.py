@@ -1,7 +1,21 @@
 import logging
+from telethon import Button
+from telethon.errors import MessageNotModifiedError
 
 logger = logging.getLogger(__name__)
 
+# Chats per page, kept well under Telegram's 4096-character message limit
+CHATS_PAGE_SIZE = 30
+CHAT_NAME_MAX_LENGTH = 48
+CHATS_SEARCH_LIMIT = 20
+
+CHAT_TYPE_INFO = {
+    'user': {'emoji': '👤', 'name': 'Utilisateurs'},
+    'bot': {'emoji': '🤖', 'name': 'Bots'},
+    'group': {'emoji': '👥', 'name': 'Groupes'},
+    'channel': {'emoji': '📢', 'name': 'Canaux'}
+}
+
 async def handle_chats_command(event, client):
     """
     Handle /chats command
@@ -29,6 +43,9 @@ Utilisez cette commande pour obtenir tous les ID de chats à utiliser avec d'aut
 `/chats bot 2759205517`
 `/chats group 2759205517`
 `/chats channel 2759205517`
+
+**Rechercher un chat par nom ou username :**
+`/chats find NOM 2759205517`
             """
             await event.respond(usage_message)
             return
@@ -40,7 +57,12 @@ Utilisez cette commande pour obtenir tous les ID de chats à utiliser avec d'aut
             return
         
         # Handle different chat filters
-        if len(parts) == 2:
+        if parts[1] == "find":
+            if len(parts) < 4:
+                await event.respond("❌ Format incorrect. Utilisez : `/chats find NOM NUMERO_TELEPHONE`")
+                return
+            await find_chats(event, client, " ".join(parts[2:-1]), parts[-1])
+        elif len(parts) == 2:
             # Show all chats
             await show_all_chats(event, client, parts[1])
         elif len(parts) == 3:
@@ -60,7 +82,7 @@ Utilisez cette commande pour obtenir tous les ID de chats à utiliser avec d'aut
         await event.respond("❌ Erreur lors de l'affichage des chats. Veuillez réessayer.")
 
 async def show_all_chats(event, client, phone_number):
-    """Show all chats for a phone number"""
+    """Show all chats for a phone number, one page at a time"""
     try:
         user_id = event.sender_id
         
@@ -69,38 +91,9 @@ async def show_all_chats(event, client, phone_number):
             await event.respond("❌ **Accès premium requis**\n\nCette fonctionnalité est réservée aux utilisateurs premium.\nUtilisez `/valide` pour activer votre licence.")
             return
         
-        # Get real chats from active connection
-        chats = await get_real_user_chats(user_id, phone_number)
-        
-        if not chats:
-            message = f"""
-📡 **Chats pour {phone_number}**
-
-Aucun chat trouvé pour ce numéro.
-
-💡 **Astuce :** Assurez-vous que le numéro est correctement connecté avec `/connect`.
-            """
-        else:
-            # Group chats by type
-            users = [c for c in chats if c['type'] == 'user']
-            bots = [c for c in chats if c['type'] == 'bot']
-            groups = [c for c in chats if c['type'] == 'group']
-            channels = [c for c in chats if c['type'] == 'channel']
-            
-            message = f"""
-📡 **Chats pour {phone_number}**
-
-👤 **Utilisateurs :** {len(users)}
-🤖 **Bots :** {len(bots)}
-👥 **Groupes :** {len(groups)}
-📢 **Canaux :** {len(channels)}
-
-📊 **Total :** {len(chats)} chat(s)
-
-💡 **Astuce :** Utilisez `/chats TYPE {phone_number}` pour voir les détails avec IDs.
-            """
-        
-        await event.respond(message)
+        # First page is rendered as soon as the first dialog batch is indexed
+        message, buttons = await render_chats_page(user_id, phone_number, None, 0)
+        await event.respond(message, buttons=buttons)
         logger.info(f"All chats shown for user {user_id} on {phone_number}")
         
     except Exception as e:
@@ -108,7 +101,7 @@ Aucun chat trouvé pour ce numéro.
         await event.respond("❌ Erreur lors de l'affichage des chats.")
 
 async def show_chats_by_type(event, client, chat_type, phone_number):
-    """Show chats of a specific type for a phone number"""
+    """Show chats of a specific type for a phone number, one page at a time"""
     try:
         user_id = event.sender_id
         
@@ -117,153 +110,256 @@ async def show_chats_by_type(event, client, chat_type, phone_number):
             await event.respond("❌ **Accès premium requis**\n\nCette fonctionnalité est réservée aux utilisateurs premium.")
             return
         
-        # Get real chats from active connection
-        chats = await get_real_user_chats_by_type(user_id, phone_number, chat_type)
-        logger.info(f"Retrieved {len(chats)} chats of type {chat_type} for user {user_id}")
+        message, buttons = await render_chats_page(user_id, phone_number, chat_type, 0)
+        await event.respond(message, buttons=buttons)
+        logger.info(f"Chats of type {chat_type} shown for user {user_id} on {phone_number}")
+        
+    except Exception as e:
+        logger.error(f"Error showing chats by type: {e}")
+        await event.respond("❌ Erreur lors de l'affichage des chats.")
+
+async def find_chats(event, client, query, phone_number):
+    """Search chats by title or username for a phone number"""
+    try:
+        user_id = event.sender_id
         
-        # Get type emoji and name
-        type_info = {
-            'user': {'emoji': '👤', 'name': 'Utilisateurs'},
-            'bot': {'emoji': '🤖', 'name': 'Bots'},
-            'group': {'emoji': '👥', 'name': 'Groupes'},
-            'channel': {'emoji': '📢', 'name': 'Canaux'}
-        }
+        # Check if user has premium access
+        if not await is_premium_user(user_id):
+            await event.respond("❌ **Accès premium requis**\n\nCette fonctionnalité est réservée aux utilisateurs premium.")
+            return
         
-        emoji = type_info[chat_type]['emoji']
-        name = type_info[chat_type]['name']
+        results = await search_user_chats(user_id, phone_number, query, CHATS_SEARCH_LIMIT)
         
-        if not chats:
+        if not results:
             message = f"""
-{emoji} **{name} pour {phone_number}**
+🔎 **Recherche "{query}" pour {phone_number}**
 
-Aucun {chat_type} trouvé pour ce numéro.
+Aucun chat trouvé.
             """
         else:
-            chat_list = "\n".join([f"• {c['name']} - ID: `{c['id']}` - {c['status']}" for c in chats])
+            lines = [
+                f"{CHAT_TYPE_INFO.get(c['type'], {}).get('emoji', '•')} {c['name'][:CHAT_NAME_MAX_LENGTH]} - ID: `{c['id']}`"
+                for c in results
+            ]
+            chat_list = "\n".join(lines)
             message = f"""
-{emoji} **{name} pour {phone_number}**
+🔎 **Recherche "{query}" pour {phone_number}**
 
 {chat_list}
 
-📊 **Total :** {len(chats)} {chat_type}(s)
+💡 **Astuce :** Utilisez ces IDs avec `/redirection` au format `SOURCE - DESTINATION`.
             """
+            if results[0].get('stale'):
+                message += f"\n⚠️ Compte non connecté : {results[0]['status'].lower()}"
         
         await event.respond(message)
-        logger.info(f"Chats of type {chat_type} shown for user {user_id} on {phone_number}")
+        logger.info(f"Chat search '{query}' for user {user_id} on {phone_number}: {len(results)} result(s)")
         
     except Exception as e:
-        logger.error(f"Error showing chats by type: {e}")
-        await event.respond("❌ Erreur lors de l'affichage des chats.")
+        logger.error(f"Error searching chats: {e}")
+        await event.respond("❌ Erreur lors de la recherche des chats.")
+
+async def search_user_chats(user_id, phone_number, query, limit):
+    """Search the dialogs of an account, or its last snapshot when no client is available"""
+    from bot.workers import worker_pool
+    if worker_pool.enabled:
+        try:
+            return await worker_pool.call(user_id, phone_number, "search_chats", query=query, limit=limit)
+        except Exception as e:
+            logger.error(f"Error searching chats on worker: {e}")
+            from bot.database import get_user_chats_data
+            return search_chat_list(await get_user_chats_data(user_id, phone_number), query, limit)
+    
+    active_client = await get_active_client(user_id, phone_number)
+    if active_client:
+        from bot.dialog_index import dialog_index
+        return await dialog_index.search(active_client, user_id, phone_number, query, limit)
+    
+    # Search the last persisted snapshot
+    return search_chat_list(await get_real_user_chats(user_id, phone_number), query, limit)
+
+def search_chat_list(chats, query, limit):
+    """Search a plain chat list like the dialog index does"""
+    from bot.dialog_index import DialogIndexEntry
+    snapshot = DialogIndexEntry()
+    for chat in chats:
+        snapshot.add(chat)
+    return snapshot.search(query, limit)
+
+async def handle_chats_callback(event, client):
+    """
+    Handle inline navigation buttons of /chats pages
+    Callback data format: chats|TYPE|PHONE|PAGE
+    """
+    try:
+        # Same access rule as the /chats command
+        if not await is_premium_user(event.sender_id):
+            await event.answer("❌ Accès premium requis.", alert=True)
+            return
+        
+        _, chat_type, phone_number, page = event.data.decode().split("|")
+        chat_type = None if chat_type == "all" else chat_type
+        
+        message, buttons = await render_chats_page(event.sender_id, phone_number, chat_type, max(int(page), 0))
+        try:
+            await event.edit(message, buttons=buttons)
+        except MessageNotModifiedError:
+            await event.answer()
+        
+    except Exception as e:
+        logger.error(f"Error in chats navigation: {e}")
+        await event.answer("❌ Erreur lors de l'affichage des chats.", alert=True)
+
+async def render_chats_page(user_id, phone_number, chat_type, page):
+    """Build the text and navigation buttons of one /chats page"""
+    chats, has_more, complete, counts = await get_chats_page(user_id, phone_number, chat_type, page)
+    
+    if chat_type:
+        emoji = CHAT_TYPE_INFO[chat_type]['emoji']
+        title = f"{emoji} **{CHAT_TYPE_INFO[chat_type]['name']} pour {phone_number}**"
+    else:
+        title = f"📡 **Chats pour {phone_number}**"
+    
+    if not chats and page == 0:
+        if chat_type:
+            return f"""
+{title}
+
+Aucun {chat_type} trouvé pour ce numéro.
+            """, None
+        return f"""
+{title}
+
+Aucun chat trouvé pour ce numéro.
+
+💡 **Astuce :** Assurez-vous que le numéro est correctement connecté avec `/connect`.
+            """, None
+    
+    lines = []
+    for c in chats:
+        prefix = "•" if chat_type else CHAT_TYPE_INFO.get(c['type'], {}).get('emoji', "•")
+        lines.append(f"{prefix} {c['name'][:CHAT_NAME_MAX_LENGTH]} - ID: `{c['id']}` - {c.get('status', 'Actif')}")
+    chat_list = "\n".join(lines)
+    
+    if chat_type:
+        total = counts.get(chat_type, 0)
+        summary = f"📊 **Total :** {total} {chat_type}(s)"
+    else:
+        total = sum(counts.values())
+        summary = (
+            f"👤 {counts.get('user', 0)} · 🤖 {counts.get('bot', 0)} · "
+            f"👥 {counts.get('group', 0)} · 📢 {counts.get('channel', 0)}\n"
+            f"📊 **Total :** {total} chat(s)"
+        )
+    if not complete:
+        summary += "\n⏳ Chargement des dialogues en cours..."
+    if chats and chats[0].get('stale'):
+        summary += f"\n⚠️ Compte non connecté : {chats[0]['status'].lower()}"
+    
+    message = f"""
+{title} — page {page + 1}
+
+{chat_list}
+
+{summary}
+    """
+    
+    nav = []
+    data_type = chat_type or "all"
+    phone = phone_number.replace('+', '')
+    if page > 0:
+        nav.append(Button.inline("⬅️ Précédent", f"chats|{data_type}|{phone}|{page - 1}".encode()))
+    if has_more:
+        nav.append(Button.inline("Suivant ➡️", f"chats|{data_type}|{phone}|{page + 1}".encode()))
+    
+    return message, [nav] if nav else None
+
+async def get_chats_page(user_id, phone_number, chat_type, page):
+    """
+    Get one page of chats from the cached dialog index
+    Returns (chats, has_more, complete, counts)
+    """
+    from bot.workers import worker_pool
+    if worker_pool.enabled:
+        try:
+            return tuple(await worker_pool.call(user_id, phone_number, "chats_page", chat_type=chat_type, page=page))
+        except Exception as e:
+            logger.error(f"Error getting chats page from worker: {e}")
+            from bot.database import get_user_chats_data
+            return paginate_chats(await get_user_chats_data(user_id, phone_number, chat_type), page)
+    
+    active_client = await get_active_client(user_id, phone_number)
+    if active_client:
+        from bot.dialog_index import dialog_index
+        try:
+            chats, has_more, complete = await dialog_index.get_page(
+                active_client, user_id, phone_number, chat_type, page, CHATS_PAGE_SIZE
+            )
+            counts = dialog_index.get_entry(user_id, phone_number).counts()
+            return chats, has_more, complete, counts
+        except Exception as e:
+            logger.error(f"Error getting chats page: {e}")
+    
+    # No live client: paginate the fallback list
+    return paginate_chats(await get_real_user_chats(user_id, phone_number, chat_type), page)
+
+def paginate_chats(chats, page):
+    """Paginate a plain chat list like the dialog index does"""
+    counts = {}
+    for c in chats:
+        counts[c['type']] = counts.get(c['type'], 0) + 1
+    start = page * CHATS_PAGE_SIZE
+    return chats[start:start + CHATS_PAGE_SIZE], len(chats) > start + CHATS_PAGE_SIZE, True, counts
 
 async def is_premium_user(user_id):
     """Check if user has premium access"""
     from bot.database import is_user_licensed
     return await is_user_licensed(user_id)
 
-async def get_real_user_chats(user_id, phone_number):
-    """Get all real chats for a user and phone number from active connection"""
+async def get_active_client(user_id, phone_number):
+    """Get the client of a user for a phone number, waking it up if dormant, or None"""
+    from bot.client_registry import client_registry
+    
+    active_client = await client_registry.acquire(user_id, phone_number)
+    if not active_client:
+        logger.warning(f"No connected client for user {user_id} on {phone_number}")
+        return None
+    
+    # Update session activity
+    from bot.session_manager import session_manager
+    await session_manager.update_session_activity(user_id, client_registry.get_entry(user_id, phone_number)['phone'])
+    
+    return active_client
+
+async def get_real_user_chats(user_id, phone_number, chat_type=None):
+    """Get real chats for a user and phone number from the cached dialog index"""
     try:
-        from bot.connection import active_connections
+        from bot.workers import worker_pool
+        if worker_pool.enabled:
+            return await worker_pool.call(user_id, phone_number, "get_chats", chat_type=chat_type)
         
-        # Check if user has an active connection for this phone
-        if user_id not in active_connections:
-            logger.warning(f"No active connection found for user {user_id}")
-            return []
+        active_client = await get_active_client(user_id, phone_number)
+        if not active_client:
+            # Serve the last persisted snapshot, marked as stale
+            from bot.database import get_user_chats_data
+            return await get_user_chats_data(user_id, phone_number, chat_type)
             
-        connection_data = active_connections[user_id]
-        active_client = connection_data.get('client')
-        connection_phone = connection_data.get('phone', '').replace('+', '')
-        target_phone = phone_number.replace('+', '')
-        
-        if not active_client or not active_client.is_connected():
-            logger.warning(f"Client not connected for user {user_id}")
-            return []
-            
-        # Check if the phone numbers match
-        if connection_phone != target_phone:
-            logger.warning(f"Phone mismatch: connected {connection_phone}, requested {target_phone}")
-            return []
-        
-        # Update session activity
-        from bot.session_manager import session_manager
-        await session_manager.update_session_activity(user_id, connection_data.get('phone'))
-            
-        # Get all dialogs (chats) from the active client
-        chats = []
-        async for dialog in active_client.iter_dialogs():
-            try:
-                chat_entity = dialog.entity
-                chat_type = 'user'
-                
-                # Determine chat type based on entity type
-                entity_type = type(chat_entity).__name__
-                
-                if entity_type == 'User':
-                    if getattr(chat_entity, 'bot', False):
-                        chat_type = 'bot'
-                    else:
-                        chat_type = 'user'
-                elif entity_type == 'Chat':
-                    chat_type = 'group'
-                elif entity_type == 'Channel':
-                    if getattr(chat_entity, 'megagroup', False):
-                        chat_type = 'group'
-                    elif getattr(chat_entity, 'broadcast', False):
-                        chat_type = 'channel'
-                    elif getattr(chat_entity, 'gigagroup', False):
-                        chat_type = 'group'
-                    else:
-                        chat_type = 'channel'
-                
-                # Get chat name safely
-                chat_name = 'Chat inconnu'
-                if hasattr(chat_entity, 'title') and chat_entity.title:
-                    chat_name = chat_entity.title
-                elif hasattr(chat_entity, 'first_name'):
-                    chat_name = chat_entity.first_name
-                    if hasattr(chat_entity, 'last_name') and chat_entity.last_name:
-                        chat_name += f' {chat_entity.last_name}'
-                elif hasattr(chat_entity, 'username') and chat_entity.username:
-                    chat_name = f'@{chat_entity.username}'
-                else:
-                    chat_name = f'Chat {chat_entity.id}'
-                
-                chat_data = {
-                    'id': chat_entity.id,
-                    'name': chat_name,
-                    'type': chat_type,
-                    'username': getattr(chat_entity, 'username', None)
-                }
-                chats.append(chat_data)
-                
-            except Exception as e:
-                logger.error(f"Error processing chat entity: {str(e)}")
-                import traceback
-                logger.error(f"Full traceback: {traceback.format_exc()}")
-                continue
-            
-        return chats
+        # Serve dialogs from the cached index (rebuilt only when expired)
+        from bot.dialog_index import dialog_index
+        return await dialog_index.get_chats(active_client, user_id, phone_number, chat_type)
         
     except Exception as e:
         logger.error(f"Error getting real chats: {e}")
         # Fallback to database chats
         from bot.database import get_user_chats_data
-        return await get_user_chats_data(user_id, phone_number)
+        return await get_user_chats_data(user_id, phone_number, chat_type)
 
 async def get_real_user_chats_by_type(user_id, phone_number, chat_type):
     """Get real chats of a specific type for a user and phone number"""
     try:
-        logger.info(f"Getting chats of type '{chat_type}' for user {user_id}")
-        all_chats = await get_real_user_chats(user_id, phone_number)
-        logger.info(f"Retrieved {len(all_chats)} total chats")
-        
-        filtered_chats = []
-        for chat in all_chats:
-            if chat.get('type') == chat_type:
-                filtered_chats.append(chat)
-        
-        logger.info(f"Filtered to {len(filtered_chats)} chats of type '{chat_type}'")
-        return filtered_chats
+        chats = await get_real_user_chats(user_id, phone_number, chat_type)
+        logger.info(f"Retrieved {len(chats)} chats of type '{chat_type}' for user {user_id}")
+        return chats
         
     except Exception as e:
         logger.error(f"Error in get_real_user_chats_by_type: {e}")
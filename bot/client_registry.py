@@ -0,0 +1,270 @@
+"""
+Registre unique des clients Telegram des utilisateurs
+Un seul TelegramClient par compte (user_id, numéro), partagé par tous les modules
+"""
+
+import logging
+import asyncio
+import os
+import time
+from datetime import datetime
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+from config.settings import API_ID, API_HASH
+from bot.session_store import session_store
+
+logger = logging.getLogger(__name__)
+
+# Un compte sans redirection active est déconnecté après ce délai d'inactivité (secondes)
+CLIENT_IDLE_TIMEOUT = int(os.getenv("CLIENT_IDLE_TIMEOUT", "900"))
+
+# Intervalle de vérification des comptes inactifs (secondes)
+HIBERNATION_CHECK_INTERVAL = 60
+
+# Raison du dernier échec d'acquire() : seules les deux premières sont définitives
+SESSION_MISSING = "missing"
+SESSION_UNAUTHORIZED = "unauthorized"
+SESSION_UNREACHABLE = "unreachable"
+
+
+def normalize_phone(phone_number):
+    """Normalise un numéro de téléphone (sans '+')"""
+    return str(phone_number or '').replace('+', '').strip()
+
+
+def session_name_for(user_id, phone_number):
+    """Nom de session déterministe d'un compte"""
+    return f"session_{user_id}_{normalize_phone(phone_number)}"
+
+
+def routes_by_phone(user_redirections, default_phone=None):
+    """
+    Regroupe les redirections actives d'un utilisateur par numéro connecté.
+    Les redirections sans numéro enregistré sont rattachées à `default_phone`.
+    """
+    grouped = {}
+    for name, data in user_redirections.items():
+        if not (data.get('active', True) and data.get('source_id') and data.get('destination_id')):
+            continue
+        phone = normalize_phone(data.get('phone') or default_phone)
+        if not phone:
+            logger.warning(f"Redirection {name} has no phone number, skipped")
+            continue
+        grouped.setdefault(phone, {})[name] = data
+    return grouped
+
+
+class ClientRegistry:
+    """Possède le cycle de vie des clients : création, connexion, réutilisation, déconnexion"""
+
+    def __init__(self):
+        self.entries = {}  # (user_id, phone) -> {'client', 'phone', 'session_name', 'connected_at', ...}
+        self._locks = {}  # (user_id, phone) -> asyncio.Lock
+        self._routes = {}  # id(client) -> {(name, source_id, destination_id)} attached
+        self.failures = {}  # (user_id, phone) -> raison du dernier échec d'acquire()
+
+    def key(self, user_id, phone_number):
+        return (int(user_id), normalize_phone(phone_number))
+
+    def _lock(self, key):
+        return self._locks.setdefault(key, asyncio.Lock())
+
+    def get_entry(self, user_id, phone_number):
+        """Retourne l'entrée d'un compte, ou None"""
+        return self.entries.get(self.key(user_id, phone_number))
+
+    def get(self, user_id, phone_number):
+        """Retourne le client connecté d'un compte, ou None"""
+        entry = self.get_entry(user_id, phone_number)
+        if entry and entry['client'].is_connected():
+            return entry['client']
+        return None
+
+    def failure_reason(self, user_id, phone_number):
+        """Raison du dernier échec d'acquire() pour ce compte (SESSION_*), ou None"""
+        return self.failures.get(self.key(user_id, phone_number))
+
+    def get_user_entries(self, user_id):
+        """Toutes les entrées d'un utilisateur, la plus récente en dernier"""
+        user_id = int(user_id)
+        return [entry for (uid, _), entry in self.entries.items() if uid == user_id]
+
+    def get_user_client(self, user_id, phone_number=None):
+        """Client connecté d'un compte, ou le plus récent de l'utilisateur si le numéro est inconnu"""
+        if phone_number:
+            return self.get(user_id, phone_number)
+        for entry in reversed(self.get_user_entries(user_id)):
+            if entry['client'].is_connected():
+                return entry['client']
+        return None
+
+    def claim_route(self, client, name, source_id, destination_id):
+        """
+        Réserve l'attachement d'une redirection à un client.
+        Retourne False si elle est déjà attachée (évite les transferts en double).
+        """
+        routes = self._routes.setdefault(id(client), set())
+        route = (name, int(source_id), int(destination_id))
+        if route in routes:
+            return False
+        routes.add(route)
+        return True
+
+    def has_routes(self, client):
+        """Vrai si au moins une redirection est attachée au client"""
+        return bool(self._routes.get(id(client)))
+
+    def touch(self, user_id, phone_number):
+        """Note l'utilisation d'un compte (repousse sa mise en veille)"""
+        entry = self.get_entry(user_id, phone_number)
+        if entry:
+            entry['last_used'] = time.time()
+
+    def items(self):
+        """Itère sur ((user_id, phone), entrée)"""
+        return list(self.entries.items())
+
+    def register(self, user_id, phone_number, client, session_name=None, **info):
+        """Enregistre un client déjà connecté (ex : après /connect)"""
+        key = self.key(user_id, phone_number)
+        previous = self.entries.get(key)
+        if previous and previous['client'] is not client:
+            # Un seul client par session
+            asyncio.ensure_future(self._disconnect_client(previous['client']))
+
+        self.entries[key] = {
+            'client': client,
+            'phone': f"+{key[1]}",
+            'session_name': session_name or session_name_for(user_id, phone_number),
+            'connected_at': datetime.now(),
+            'last_used': time.time(),
+            'connected': True,
+            **info
+        }
+        logger.info(f"Client registered for user {key[0]} on {key[1]}")
+        return self.entries[key]
+
+    async def acquire(self, user_id, phone_number, session_name=None):
+        """
+        Retourne le client connecté d'un compte, en le créant si nécessaire.
+        Retourne None en cas d'échec, dont la raison est donnée par failure_reason().
+        """
+        key = self.key(user_id, phone_number)
+        async with self._lock(key):
+            client = self.get(user_id, phone_number)
+            if client:
+                self.touch(user_id, phone_number)
+                return client
+
+            entry = self.entries.get(key)
+            if entry:
+                # Client connu mais déconnecté : reconnexion du même objet
+                client = entry['client']
+            else:
+                # Session à clé déterministe (session_name : ancien fichier SQLite à importer)
+                session = session_store.open(session_name_for(user_id, phone_number), legacy_name=session_name)
+                if session is None:
+                    logger.warning(f"No stored session for {key[0]}:{key[1]}")
+                    self.failures[key] = SESSION_MISSING
+                    return None
+                client = TelegramClient(session, API_ID, API_HASH)
+
+            from bot.restore_scheduler import restore_scheduler
+            try:
+                await restore_scheduler.connect(client, f"{key[0]}:{key[1]}")
+            except (asyncio.TimeoutError, OSError, FloodWaitError) as e:
+                logger.error(f"Connection failed for {key[0]}:{key[1]}: {e!r}")
+                # Le client reste enregistré : ses redirections attachées sont conservées
+                await self._disconnect_client(client, forget_routes=not entry)
+                if not entry:
+                    # Premier échec : enregistré comme connecté mais client déconnecté,
+                    # la surveillance le reconnecte (backoff) puis attache ses redirections
+                    self.register(user_id, phone_number, client, restored=True)
+                self.failures[key] = SESSION_UNREACHABLE
+                return None
+
+            if not await client.is_user_authorized():
+                logger.warning(f"Session not authorized for {key[0]}:{key[1]}")
+                if entry:
+                    # Session révoquée : plus de reconnexion automatique
+                    entry['connected'] = False
+                    entry['unauthorized'] = True
+                await self._disconnect_client(client, forget_routes=not entry)
+                self.failures[key] = SESSION_UNAUTHORIZED
+                return None
+
+            self.failures.pop(key, None)
+
+            if entry:
+                # Sortie de veille
+                entry['connected'] = True
+                entry['last_used'] = time.time()
+                entry.pop('hibernated_at', None)
+                logger.info(f"Client woken up for {key[0]}:{key[1]}")
+            else:
+                self.register(user_id, phone_number, client, restored=True)
+            return client
+
+    async def hibernate_idle(self, timeout=CLIENT_IDLE_TIMEOUT):
+        """
+        Déconnecte les comptes sans redirection inactifs depuis `timeout` secondes.
+        L'entrée est conservée : le prochain acquire() reconnecte le même client.
+        """
+        deadline = time.time() - timeout
+        idle = [
+            (key, entry) for key, entry in self.entries.items()
+            if entry.get('connected') and not self.has_routes(entry['client'])
+            and entry.get('last_used', 0) < deadline
+        ]
+        hibernated = 0
+        for key, entry in idle:
+            async with self._lock(key):
+                # Réveillé ou redirigé entre-temps
+                if entry.get('last_used', 0) >= deadline or self.has_routes(entry['client']):
+                    continue
+                entry['connected'] = False
+                entry['hibernated_at'] = datetime.now()
+                await self._disconnect_client(entry['client'])
+            hibernated += 1
+
+            # Les mises à jour manquées pendant la veille rendent l'index obsolète
+            from bot.dialog_index import dialog_index
+            dialog_index.invalidate(key[0], key[1])
+            logger.info(f"Client hibernated for {key[0]}:{key[1]} (idle, no active redirection)")
+        return hibernated
+
+    async def hibernation_loop(self, interval=HIBERNATION_CHECK_INTERVAL):
+        """Met en veille périodiquement les comptes inactifs"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.hibernate_idle()
+            except Exception as e:
+                logger.error(f"Error hibernating idle clients: {e}")
+
+    async def disconnect(self, user_id, phone_number):
+        """Déconnecte et retire un compte du registre"""
+        entry = self.entries.pop(self.key(user_id, phone_number), None)
+        if entry:
+            await self._disconnect_client(entry['client'])
+
+    async def disconnect_all(self):
+        """Déconnecte tous les clients en parallèle"""
+        entries = list(self.entries.values())
+        self.entries.clear()
+        await asyncio.gather(
+            *(self._disconnect_client(entry['client']) for entry in entries),
+            return_exceptions=True
+        )
+
+    async def _disconnect_client(self, client, forget_routes=True):
+        if forget_routes:
+            self._routes.pop(id(client), None)
+        try:
+            await client.disconnect()
+        except Exception as e:
+            logger.error(f"Error disconnecting client: {e}")
+
+
+# Instance globale
+client_registry = ClientRegistry()
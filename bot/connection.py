@@ -6,8 +6,9 @@ from telethon.errors import PhoneNumberInvalidError, FloodWaitError
 
 logger = logging.getLogger(__name__)
 
-# Store active connection sessions
-active_connections = {}
+# Logins waiting for their verification code (user_id -> client, phone, phone_code_hash)
+# Connected accounts live in bot.client_registry
+pending_logins = {}
 
 async def handle_connect(event, client):
     """
@@ -56,12 +57,15 @@ async def handle_connect(event, client):
         await event.respond("🔄 **Initiation de la connexion...**\n\nTentative de connexion en cours...")
         
         # Create a new client session for this phone number
-        session_name = f"session_{user_id}_{phone_number}"
+        from bot.client_registry import session_name_for
+        session_name = session_name_for(user_id, phone_number)
         
         try:
-            # Create new client for the phone number
+            # Create new client for the phone number, on a fresh in-memory session:
+            # the account's current client keeps running until the code is verified
+            from bot.session_store import session_store
             new_client = TelegramClient(
-                session_name,
+                session_store.new_login(session_name),
                 int(os.getenv("API_ID")),
                 os.getenv("API_HASH")
             )
@@ -71,14 +75,18 @@ async def handle_connect(event, client):
             # Send code request
             result = await new_client.send_code_request(formatted_phone)
             
-            # Store the connection session
-            active_connections[user_id] = {
+            # Store the login until the code is received
+            pending_logins[user_id] = {
                 'client': new_client,
                 'phone': formatted_phone,
                 'phone_code_hash': result.phone_code_hash,
                 'session_name': session_name
             }
             
+            # Next free-text message from this user is the verification code
+            from bot.conversation import conversation_manager, AWAITING_CODE
+            conversation_manager.set(user_id, AWAITING_CODE, {'phone': formatted_phone})
+            
             success_message = f"""
 ✅ **Code de vérification envoyé !**
 
@@ -102,6 +110,8 @@ async def handle_connect(event, client):
             logger.error(f"Invalid phone number: {formatted_phone}")
             
         except FloodWaitError as e:
+            from bot.metrics import flood_waits
+            flood_waits.inc(source="connect")
             await event.respond(f"❌ **Limite de tentatives atteinte**\n\nVeuillez attendre {e.seconds} secondes avant de réessayer.")
             logger.error(f"Flood wait error: {e.seconds} seconds")
             
@@ -122,7 +132,7 @@ async def handle_verification_code(event, client):
         message_text = event.text.strip()
         
         # Check if user has an active connection attempt
-        if user_id not in active_connections:
+        if user_id not in pending_logins:
             return False  # Not a verification code
         
         # Check if message starts with 'aa' (verification code format)
@@ -136,7 +146,7 @@ async def handle_verification_code(event, client):
             await event.respond("❌ **Code invalide**\n\nLe code doit contenir uniquement des chiffres après 'aa'.")
             return True
         
-        connection_data = active_connections[user_id]
+        connection_data = pending_logins[user_id]
         new_client = connection_data['client']
         phone = connection_data['phone']
         phone_code_hash = connection_data['phone_code_hash']
@@ -164,27 +174,41 @@ async def handle_verification_code(event, client):
             
             await event.respond(success_message)
             
+            from bot.conversation import conversation_manager, AWAITING_CODE
+            conversation_manager.clear(user_id, AWAITING_CODE)
+            
             # Store the successful connection
             await store_successful_connection(user_id, phone)
             
-            # Keep the client active for chat operations and redirections
-            active_connections[user_id] = {
-                'client': new_client,
-                'phone': phone,
-                'connected': True,
-                'session_name': connection_data['session_name']
-            }
-            
-            # Store in connection function for restoration
-            await store_connection_client(user_id, phone, new_client)
+            del pending_logins[user_id]
             
             # Store session in persistent database
             from bot.session_manager import session_manager
             await session_manager.store_session(user_id, phone, connection_data['session_name'])
             
-            # Setup message redirection handlers for existing redirections
-            from bot.message_handler import message_redirector
-            await message_redirector.setup_redirection_handlers()
+            from bot.workers import worker_pool
+            if worker_pool.enabled:
+                # Hand the session over to the worker owning this account: its previous client
+                # is released first so that no two clients share the account's session
+                from bot.session_store import session_store
+                await worker_pool.call(user_id, phone, "release")
+                await session_store.adopt(new_client.session)
+                await new_client.disconnect()
+                await worker_pool.call(user_id, phone, "activate")
+            else:
+                # Swap the new client in: release the previous one first (it saves its session
+                # on disconnect), then persist the new session in its place
+                from bot.client_registry import client_registry
+                from bot.session_store import session_store
+                await client_registry.disconnect(user_id, phone)
+                await session_store.adopt(new_client.session)
+                
+                # Keep the client active for chat operations and redirections
+                client_registry.register(user_id, phone, new_client, session_name=connection_data['session_name'])
+                
+                # Setup message redirection handlers for existing redirections
+                from bot.message_handler import message_redirector
+                await message_redirector.setup_redirection_handlers()
             
             logger.info(f"Successful connection for user {user_id} with phone {phone}")
             return True
@@ -227,13 +251,8 @@ async def store_connection_client(user_id, phone_number, client):
     Store connection with client for restoration
     """
     try:
-        from datetime import datetime
-        active_connections[user_id] = {
-            'phone': phone_number,
-            'connected_at': datetime.now(),
-            'client': client,
-            'connected': True
-        }
+        from bot.client_registry import client_registry
+        client_registry.register(user_id, phone_number, client)
         logger.info(f"Active connection with client stored for user {user_id}")
         
     except Exception as e:
@@ -0,0 +1,150 @@
+"""
+État de conversation par utilisateur pour les échanges en plusieurs étapes
+(code de vérification, IDs de redirection, code de licence)
+"""
+
+import logging
+import json
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+AWAITING_CODE = "awaiting_code"
+AWAITING_REDIRECTION_IDS = "awaiting_redirection_ids"
+AWAITING_LICENSE = "awaiting_license"
+
+# Durée de vie de chaque état (secondes)
+STATE_TTL = {
+    AWAITING_CODE: 600,
+    AWAITING_REDIRECTION_IDS: 1800,
+    AWAITING_LICENSE: 600,
+}
+
+# Le client Telethon d'une connexion en cours ne survit pas à un redémarrage
+PERSISTENT_STATES = (AWAITING_REDIRECTION_IDS, AWAITING_LICENSE)
+
+STATE_FILE = "conversation_states.json"
+
+
+class ConversationManager:
+    """
+    États de conversation en mémoire, persistés uniquement lors d'un changement.
+    Un état par échange : commencer un échange (ex : /valide) n'efface pas celui
+    déjà en cours (ex : redirection en attente de ses IDs).
+    """
+
+    def __init__(self, state_file=STATE_FILE):
+        self.state_file = state_file
+        self.states = {}  # user_id -> {state: {"data", "expires_at", "started_at"}}
+        self._load()
+        self._migrate_pending_redirections()
+
+    def _load(self):
+        """Charge les états persistés au démarrage"""
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                stored = json.load(f)
+            now = time.time()
+            for user_id, flows in stored.items():
+                if "state" in flows:
+                    # Ancien format : un seul état par utilisateur
+                    flows = {flows["state"]: flows}
+                for state, flow in flows.items():
+                    if flow.get("expires_at", 0) > now:
+                        flow.setdefault("started_at", now)
+                        self.states.setdefault(int(user_id), {})[state] = {
+                            "data": flow.get("data", {}),
+                            "expires_at": flow["expires_at"],
+                            "started_at": flow["started_at"]
+                        }
+            logger.info(f"{len(self.states)} conversation state(s) restored")
+        except Exception as e:
+            logger.error(f"Error loading conversation states: {e}")
+
+    def _migrate_pending_redirections(self):
+        """Reprend une seule fois les redirections en attente de l'ancien user_data.json"""
+        try:
+            from bot.database import load_data, save_data
+            data = load_data()
+            pending = data.pop("pending_redirections", None)
+            if pending is None:
+                return
+            for user_id, redirection in pending.items():
+                flows = self.states.get(int(user_id), {})
+                if AWAITING_REDIRECTION_IDS not in flows:
+                    self.set(int(user_id), AWAITING_REDIRECTION_IDS, {
+                        "name": redirection["name"],
+                        "phone_number": redirection["phone_number"]
+                    })
+            save_data(data)
+            logger.info(f"{len(pending)} pending redirection(s) migrated to conversation states")
+        except Exception as e:
+            logger.error(f"Error migrating pending redirections: {e}")
+
+    def _save(self):
+        """Écrit les états persistants sur disque"""
+        try:
+            stored = {}
+            for user_id, flows in self.states.items():
+                persistent = {state: flow for state, flow in flows.items() if state in PERSISTENT_STATES}
+                if persistent:
+                    stored[str(user_id)] = persistent
+            tmp_file = f"{self.state_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(stored, f)
+            os.replace(tmp_file, self.state_file)
+        except Exception as e:
+            logger.error(f"Error saving conversation states: {e}")
+
+    def get(self, user_id, state=None):
+        """
+        Retourne l'état `state` d'un utilisateur, ou à défaut son échange le plus récent
+        ({"state", "data", "expires_at"}) ; None s'il n'y en a pas ou s'il a expiré
+        """
+        flows = self.states.get(user_id)
+        if not flows:
+            return None
+        now = time.time()
+        for expired in [name for name, flow in flows.items() if flow["expires_at"] <= now]:
+            self.clear(user_id, expired)
+        flows = self.states.get(user_id, {})
+        if state is None:
+            if not flows:
+                return None
+            state = max(flows, key=lambda name: flows[name]["started_at"])
+        flow = flows.get(state)
+        if flow is None:
+            return None
+        return {"state": state, "data": flow["data"], "expires_at": flow["expires_at"]}
+
+    def set(self, user_id, state, data=None):
+        """Place un utilisateur dans un état, avec expiration (remplace seulement le même échange)"""
+        now = time.time()
+        self.states.setdefault(user_id, {})[state] = {
+            "data": data or {},
+            "expires_at": now + STATE_TTL.get(state, 600),
+            "started_at": now
+        }
+        if state in PERSISTENT_STATES:
+            self._save()
+
+    def clear(self, user_id, state=None):
+        """Sort un utilisateur d'un état (`state`), ou de tous ses échanges si non précisé"""
+        flows = self.states.get(user_id)
+        if not flows:
+            return
+        cleared = [state] if state else list(flows)
+        persistent = False
+        for name in cleared:
+            if flows.pop(name, None) is not None and name in PERSISTENT_STATES:
+                persistent = True
+        if not flows:
+            del self.states[user_id]
+        if persistent:
+            self._save()
+
+# Instance globale
+conversation_manager = ConversationManager()
@@ -2,23 +2,28 @@ import logging
 import json
 import os
 from datetime import datetime
+from bot.metrics import db_duration, cache_requests
 
 logger = logging.getLogger(__name__)
 
 # Simple file-based storage for demo purposes
 DATA_FILE = "user_data.json"
 
+# Last known dialogs per account, served when the live client is unavailable
+CHAT_SNAPSHOT_FILE = "chat_snapshots.json"
+CHAT_TYPE_CODES = {"user": "u", "bot": "b", "group": "g", "channel": "c"}
+CHAT_TYPE_NAMES = {code: name for name, code in CHAT_TYPE_CODES.items()}
+_chat_snapshots = {}  # file -> (mtime, snapshots)
+
+# Source message -> redirected message, saved on shutdown
+MESSAGE_MAPPING_FILE = "message_mapping.json"
+
 def load_data():
     """Load user data from file"""
     if os.path.exists(DATA_FILE):
         try:
-            with open(DATA_FILE, 'r') as f:
-                data = json.load(f)
-                # Ensure all required keys exist
-                if "pending_redirections" not in data:
-                    data["pending_redirections"] = {}
-                    save_data(data)  # Save updated structure
-                return data
+            with db_duration.time(op="load_data"), open(DATA_FILE, 'r') as f:
+                return json.load(f)
         except Exception as e:
             logger.error(f"Error loading data: {e}")
     return {
@@ -28,18 +33,51 @@ def load_data():
         "transformations": {},
         "whitelists": {},
         "blacklists": {},
-        "chats": {},
-        "pending_redirections": {}
+        "chats": {}
     }
 
 def save_data(data):
-    """Save user data to file"""
+    """Save user data to file (atomic: an interrupted write never leaves a half-written file)"""
     try:
-        with open(DATA_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        with db_duration.time(op="save_data"):
+            tmp_file = f"{DATA_FILE}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_file, DATA_FILE)
     except Exception as e:
         logger.error(f"Error saving data: {e}")
 
+def _message_mapping_file():
+    """Mapping file of this process: one per worker shard in multi-process mode"""
+    worker_index = os.getenv("USER_WORKER_INDEX")
+    if worker_index is not None:
+        return f"message_mapping.{worker_index}.json"
+    return MESSAGE_MAPPING_FILE
+
+def load_message_mapping():
+    """Load the source -> redirected message mapping saved at the last shutdown"""
+    path = _message_mapping_file()
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading message mapping: {e}")
+        return {}
+
+def save_message_mapping(mapping):
+    """Persist the message mapping so edits after a restart still update the redirected message"""
+    try:
+        path = _message_mapping_file()
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(mapping, f, separators=(',', ':'))
+        os.replace(tmp_file, path)
+        logger.info(f"Message mapping saved ({len(mapping)} entries)")
+    except Exception as e:
+        logger.error(f"Error saving message mapping: {e}")
+
 async def store_license(user_id, license_code):
     """Store validated license"""
     data = load_data()
@@ -152,148 +190,86 @@ async def get_user_redirections(user_id, phone_number):
     
     return phone_redirections
 
-async def store_pending_redirection(user_id, name, phone_number):
-    """Store pending redirection waiting for channel IDs"""
-    data = load_data()
-    data["pending_redirections"][str(user_id)] = {
-        "name": name,
-        "phone_number": phone_number,
-        "created_at": datetime.now().isoformat()
-    }
-    save_data(data)
-    logger.info(f"Pending redirection stored for user {user_id}: {name} on {phone_number}")
+def _chat_snapshot_file(user_id, phone_number):
+    """Snapshot file of an account: one per worker shard, so worker processes never share a file"""
+    from bot.workers import USER_WORKERS, shard_for
+    if USER_WORKERS > 0:
+        return f"chat_snapshots.{shard_for(user_id, phone_number)}.json"
+    return CHAT_SNAPSHOT_FILE
 
-async def get_pending_redirection(user_id):
-    """Get pending redirection for user"""
-    data = load_data()
-    return data["pending_redirections"].get(str(user_id))
+def _load_chat_snapshots(path=CHAT_SNAPSHOT_FILE):
+    """Load chat snapshots from file, reloading it when another process rewrote it"""
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    cached = _chat_snapshots.get(path)
+    if cached is not None and cached[0] == mtime:
+        cache_requests.inc(cache="chat_snapshots", result="hit")
+    else:
+        cache_requests.inc(cache="chat_snapshots", result="miss")
+        snapshots = {}
+        if mtime is not None:
+            try:
+                with db_duration.time(op="load_chat_snapshots"), open(path, 'r') as f:
+                    snapshots = json.load(f)
+            except Exception as e:
+                logger.error(f"Error loading chat snapshots: {e}")
+        cached = _chat_snapshots[path] = (mtime, snapshots)
+    return cached[1]
 
-async def clear_pending_redirection(user_id):
-    """Clear pending redirection for user"""
-    data = load_data()
-    if str(user_id) in data["pending_redirections"]:
-        del data["pending_redirections"][str(user_id)]
-        save_data(data)
-        logger.info(f"Pending redirection cleared for user {user_id}")
+def store_chats_snapshots(items):
+    """
+    Persist the last real dialog lists of accounts [(user_id, phone, chats)] in compact form,
+    one write per file.
+    Blocking: called through asyncio.to_thread by the dialog index
+    """
+    by_path = {}
+    for user_id, phone_number, chats in items:
+        by_path.setdefault(_chat_snapshot_file(user_id, phone_number), []).append((user_id, phone_number, chats))
+    
+    for path, path_items in by_path.items():
+        snapshots = _load_chat_snapshots(path)
+        for user_id, phone_number, chats in path_items:
+            phone = str(phone_number).replace('+', '')
+            snapshots.setdefault(str(user_id), {})[phone] = {
+                "saved_at": datetime.now().isoformat(),
+                "dialogs": [
+                    [chat['id'], CHAT_TYPE_CODES[chat['type']], chat['name'], chat.get('username')]
+                    for chat in chats
+                ]
+            }
+        try:
+            tmp_file = f"{path}.tmp"
+            with db_duration.time(op="save_chat_snapshot"), open(tmp_file, 'w') as f:
+                json.dump(snapshots, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_file, path)
+            _chat_snapshots[path] = (os.path.getmtime(path), snapshots)
+        except Exception as e:
+            logger.error(f"Error saving chat snapshot: {e}")
 
 async def get_user_chats_data(user_id, phone_number, chat_type=None):
-    """Get user chats data (comprehensive list of 100+ chats)"""
-    # Comprehensive list of realistic Telegram chats with IDs
-    sample_chats = [
-        # Users (25 contacts)
-        {"name": "Alexandre Martin", "id": "1001238795132", "type": "user", "status": "En ligne"},
-        {"name": "Marie Dupont", "id": "1001456789123", "type": "user", "status": "Actif"},
-        {"name": "Pierre Durand", "id": "1001567890234", "type": "user", "status": "Hors ligne"},
-        {"name": "Sophie Laurent", "id": "1001678901345", "type": "user", "status": "En ligne"},
-        {"name": "Nicolas Bernard", "id": "1001789012456", "type": "user", "status": "Actif"},
-        {"name": "Emma Moreau", "id": "1001890123567", "type": "user", "status": "En ligne"},
-        {"name": "Lucas Petit", "id": "1001901234678", "type": "user", "status": "Hors ligne"},
-        {"name": "Chloé Roux", "id": "1001012345789", "type": "user", "status": "Actif"},
-        {"name": "Hugo Thomas", "id": "1001123456890", "type": "user", "status": "En ligne"},
-        {"name": "Léa Dubois", "id": "1001234567901", "type": "user", "status": "Actif"},
-        {"name": "Antoine Garcia", "id": "1001345678012", "type": "user", "status": "Hors ligne"},
-        {"name": "Manon Robert", "id": "1001456789013", "type": "user", "status": "En ligne"},
-        {"name": "Maxime Richard", "id": "1001567890124", "type": "user", "status": "Actif"},
-        {"name": "Clara Leroy", "id": "1001678901235", "type": "user", "status": "En ligne"},
-        {"name": "Julien Moreau", "id": "1001789012346", "type": "user", "status": "Hors ligne"},
-        {"name": "Camille Girard", "id": "1001890123457", "type": "user", "status": "Actif"},
-        {"name": "Théo Andre", "id": "1001901234568", "type": "user", "status": "En ligne"},
-        {"name": "Inès Mercier", "id": "1001012345679", "type": "user", "status": "Actif"},
-        {"name": "Samuel Blanc", "id": "1001123456780", "type": "user", "status": "Hors ligne"},
-        {"name": "Océane Guerin", "id": "1001234567891", "type": "user", "status": "En ligne"},
-        {"name": "Quentin Muller", "id": "1001345678902", "type": "user", "status": "Actif"},
-        {"name": "Anaïs Lefevre", "id": "1001456789014", "type": "user", "status": "En ligne"},
-        {"name": "Romain Fournier", "id": "1001567890125", "type": "user", "status": "Hors ligne"},
-        {"name": "Lola Michel", "id": "1001678901236", "type": "user", "status": "Actif"},
-        {"name": "Enzo Barbier", "id": "1001789012347", "type": "user", "status": "En ligne"},
-        
-        # Groups (35 groupes)
-        {"name": "Famille Martin", "id": "1002370795564", "type": "group", "status": "Actif"},
-        {"name": "Amis du Lycée", "id": "1002471806675", "type": "group", "status": "Actif"},
-        {"name": "Équipe Projet", "id": "1002572817786", "type": "group", "status": "Actif"},
-        {"name": "Football Local", "id": "1002673828897", "type": "group", "status": "Actif"},
-        {"name": "Cuisine & Recettes", "id": "1002774839908", "type": "group", "status": "Actif"},
-        {"name": "Voyage Été 2025", "id": "1002875840019", "type": "group", "status": "Actif"},
-        {"name": "Développeurs Paris", "id": "1002976851120", "type": "group", "status": "Actif"},
-        {"name": "Gamers United", "id": "1003077862231", "type": "group", "status": "Actif"},
-        {"name": "Musique Indie", "id": "1003178873342", "type": "group", "status": "Actif"},
-        {"name": "Photographie Pro", "id": "1003279884453", "type": "group", "status": "Actif"},
-        {"name": "Startup Network", "id": "1003380895564", "type": "group", "status": "Actif"},
-        {"name": "Runners Club", "id": "1003481906675", "type": "group", "status": "Actif"},
-        {"name": "Cinéphiles", "id": "1003582917786", "type": "group", "status": "Actif"},
-        {"name": "Voisins Quartier", "id": "1003683928897", "type": "group", "status": "Actif"},
-        {"name": "Tech Support", "id": "1003784939908", "type": "group", "status": "Actif"},
-        {"name": "Yoga & Méditation", "id": "1003885940019", "type": "group", "status": "Actif"},
-        {"name": "Étudiants Info", "id": "1003986951120", "type": "group", "status": "Actif"},
-        {"name": "Parents École", "id": "1004087962231", "type": "group", "status": "Actif"},
-        {"name": "Randonnée Weekend", "id": "1004188973342", "type": "group", "status": "Actif"},
-        {"name": "Crypto Trading", "id": "1004289984453", "type": "group", "status": "Actif"},
-        {"name": "Livres & Lecture", "id": "1004390995564", "type": "group", "status": "Actif"},
-        {"name": "Jardinage Bio", "id": "1004492006675", "type": "group", "status": "Actif"},
-        {"name": "Moto Passion", "id": "1004593017786", "type": "group", "status": "Actif"},
-        {"name": "Design Graphique", "id": "1004694028897", "type": "group", "status": "Actif"},
-        {"name": "Écologie Locale", "id": "1004795039908", "type": "group", "status": "Actif"},
-        {"name": "Gaming Retro", "id": "1004896040019", "type": "group", "status": "Actif"},
-        {"name": "Artisans Créatifs", "id": "1004997051120", "type": "group", "status": "Actif"},
-        {"name": "Freelancers", "id": "1005098062231", "type": "group", "status": "Actif"},
-        {"name": "Animaux Compagnie", "id": "1005199073342", "type": "group", "status": "Actif"},
-        {"name": "Événements Ville", "id": "1005300084453", "type": "group", "status": "Actif"},
-        {"name": "Mode & Style", "id": "1005401095564", "type": "group", "status": "Actif"},
-        {"name": "Sciences & Tech", "id": "1005502106675", "type": "group", "status": "Actif"},
-        {"name": "Cuisine Végé", "id": "1005603117786", "type": "group", "status": "Actif"},
-        {"name": "Théâtre Amateur", "id": "1005704128897", "type": "group", "status": "Actif"},
-        {"name": "Bricolage Maison", "id": "1005805139908", "type": "group", "status": "Actif"},
-        
-        # Channels (30 canaux)
-        {"name": "📰 Actualités France", "id": "1002682552255", "type": "channel", "status": "Actif"},
-        {"name": "🚀 Tech News Daily", "id": "1002783563366", "type": "channel", "status": "Actif"},
-        {"name": "💰 Crypto Updates", "id": "1002884574477", "type": "channel", "status": "Actif"},
-        {"name": "🎮 Gaming News", "id": "1002985585588", "type": "channel", "status": "Actif"},
-        {"name": "🎬 Cinéma Sorties", "id": "1003086596699", "type": "channel", "status": "Actif"},
-        {"name": "📱 Apps & Outils", "id": "1003187607700", "type": "channel", "status": "Actif"},
-        {"name": "🌍 Voyage & Culture", "id": "1003288618811", "type": "channel", "status": "Actif"},
-        {"name": "💼 Business Tips", "id": "1003389629922", "type": "channel", "status": "Actif"},
-        {"name": "🎨 Design Inspiration", "id": "1003490630033", "type": "channel", "status": "Actif"},
-        {"name": "🍴 Recettes Gourmandes", "id": "1003591641144", "type": "channel", "status": "Actif"},
-        {"name": "📚 Développement Perso", "id": "1003692652255", "type": "channel", "status": "Actif"},
-        {"name": "⚽ Sport Express", "id": "1003793663366", "type": "channel", "status": "Actif"},
-        {"name": "🎵 Playlist Quotidienne", "id": "1003894674477", "type": "channel", "status": "Actif"},
-        {"name": "🌱 Écologie Pratique", "id": "1003995685588", "type": "channel", "status": "Actif"},
-        {"name": "💡 Innovation Tech", "id": "1004096696699", "type": "channel", "status": "Actif"},
-        {"name": "🏠 Déco & Maison", "id": "1004197707700", "type": "channel", "status": "Actif"},
-        {"name": "👗 Mode Tendances", "id": "1004298718811", "type": "channel", "status": "Actif"},
-        {"name": "🚗 Auto Moto News", "id": "1004399729922", "type": "channel", "status": "Actif"},
-        {"name": "📊 Finance Perso", "id": "1004500730033", "type": "channel", "status": "Actif"},
-        {"name": "🎭 Culture Spectacles", "id": "1004601741144", "type": "channel", "status": "Actif"},
-        {"name": "🏃 Sport & Santé", "id": "1004702752255", "type": "channel", "status": "Actif"},
-        {"name": "📸 Photo du Jour", "id": "1004803763366", "type": "channel", "status": "Actif"},
-        {"name": "🧠 Science Vulgarisée", "id": "1004904774477", "type": "channel", "status": "Actif"},
-        {"name": "🍰 Pâtisserie Créative", "id": "1005005785588", "type": "channel", "status": "Actif"},
-        {"name": "🎪 Événements Paris", "id": "1005106796699", "type": "channel", "status": "Actif"},
-        {"name": "💻 Développement Web", "id": "1005207807700", "type": "channel", "status": "Actif"},
-        {"name": "🌟 Motivation Daily", "id": "1005308818811", "type": "channel", "status": "Actif"},
-        {"name": "📖 Livre de la Semaine", "id": "1005409829922", "type": "channel", "status": "Actif"},
-        {"name": "🎯 Marketing Digital", "id": "1005510830033", "type": "channel", "status": "Actif"},
-        {"name": "🌊 Météo & Climat", "id": "1005611841144", "type": "channel", "status": "Actif"},
-        
-        # Bots (15 bots)
-        {"name": "🤖 Assistant IA", "id": "1001111111111", "type": "bot", "status": "Actif"},
-        {"name": "📊 Stats Bot", "id": "1001222222222", "type": "bot", "status": "Actif"},
-        {"name": "🌤️ Météo Bot", "id": "1001333333333", "type": "bot", "status": "Actif"},
-        {"name": "💰 Crypto Tracker", "id": "1001444444444", "type": "bot", "status": "Actif"},
-        {"name": "📝 Notes Rapides", "id": "1001555555555", "type": "bot", "status": "Actif"},
-        {"name": "🎵 Music Finder", "id": "1001666666666", "type": "bot", "status": "Actif"},
-        {"name": "📰 News Aggregator", "id": "1001777777777", "type": "bot", "status": "Actif"},
-        {"name": "🔗 Link Shortener", "id": "1001888888888", "type": "bot", "status": "Actif"},
-        {"name": "🎲 Random Generator", "id": "1001999999999", "type": "bot", "status": "Actif"},
-        {"name": "📅 Calendar Bot", "id": "1002000000000", "type": "bot", "status": "Actif"},
-        {"name": "🔍 Search Helper", "id": "1002111111111", "type": "bot", "status": "Actif"},
-        {"name": "📋 Task Manager", "id": "1002222222222", "type": "bot", "status": "Actif"},
-        {"name": "🎯 Poll Creator", "id": "1002333333333", "type": "bot", "status": "Actif"},
-        {"name": "📈 Analytics Bot", "id": "1002444444444", "type": "bot", "status": "Actif"},
-        {"name": "🔐 Security Bot", "id": "1002555555555", "type": "bot", "status": "Actif"}
-    ]
+    """Get the last persisted chat snapshot of an account, marked as stale"""
+    phone = str(phone_number).replace('+', '')
+    snapshot = _load_chat_snapshots(_chat_snapshot_file(user_id, phone)).get(str(user_id), {}).get(phone)
+    if not snapshot:
+        return []
+    
+    saved_at = snapshot.get("saved_at", "")
+    try:
+        status = f"Instantané du {datetime.fromisoformat(saved_at).strftime('%d/%m/%Y %H:%M')}"
+    except ValueError:
+        status = "Instantané"
     
-    if chat_type:
-        return [chat for chat in sample_chats if chat["type"] == chat_type]
-    return sample_chats
\ No newline at end of file
+    chats = []
+    for chat_id, type_code, name, username in snapshot.get("dialogs", []):
+        type_name = CHAT_TYPE_NAMES.get(type_code, "user")
+        if chat_type and type_name != chat_type:
+            continue
+        chats.append({
+            "id": chat_id,
+            "name": name,
+            "type": type_name,
+            "username": username,
+            "status": status,
+            "stale": True
+        })
+    return chats
+
@@ -1,5 +1,4 @@
 import logging
-import psycopg2
 import os
 from datetime import datetime
 import json
@@ -17,6 +16,7 @@ class PostgreSQLDatabase:
     def init_database(self):
         """Initialize database tables"""
         try:
+            import psycopg2
             self.connection = psycopg2.connect(self.database_url)
             cursor = self.connection.cursor()
             
@@ -224,5 +224,12 @@ class PostgreSQLDatabase:
         if self.connection:
             self.connection.close()
 
-# Global database instance
-db = PostgreSQLDatabase()
\ No newline at end of file
+# Global database instance, connected on first use (not at import)
+_db = None
+
+def get_db():
+    """Shared PostgreSQLDatabase instance"""
+    global _db
+    if _db is None:
+        _db = PostgreSQLDatabase()
+    return _db
\ No newline at end of file
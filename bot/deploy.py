@@ -1,8 +1,6 @@
 
 import logging
 import os
-import zipfile
-import shutil
 from telethon import events
 from datetime import datetime
 
@@ -70,6 +68,8 @@ async def handle_deploy(event, client):
 async def create_deployment_zip():
     """Create a ZIP file with all necessary deployment files including Railway support"""
     try:
+        import zipfile  # only needed by /deposer
+        
         # Get parent directory (project root)
         parent_dir = os.path.dirname(os.getcwd()) if os.path.basename(os.getcwd()) == 'bot' else os.getcwd()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -242,8 +242,8 @@ ADMIN_ID=your_admin_id_here
 async def is_premium_user(user_id):
     """Check if user has premium access"""
     try:
-        from bot.database_postgres import db
-        return db.is_user_licensed(user_id)
+        from bot.database_postgres import get_db
+        return get_db().is_user_licensed(user_id)
     except Exception:
         # Fallback to file-based system
         from bot.database import is_user_licensed
@@ -0,0 +1,412 @@
+"""
+Index en mémoire des dialogues par (utilisateur, numéro)
+Évite un iter_dialogs() complet à chaque commande /chats
+"""
+
+import logging
+import asyncio
+import time
+import unicodedata
+from itertools import islice
+from telethon import events
+from telethon.tl import types
+from telethon.utils import resolve_id
+from bot.metrics import cache_requests
+
+logger = logging.getLogger(__name__)
+
+CHAT_TYPES = ("user", "bot", "group", "channel")
+
+# Durée de validité d'un index avant reconstruction complète (secondes)
+DIALOG_INDEX_TTL = 600
+
+# iter_dialogs() récupère les dialogues par requêtes de 100
+DIALOG_BATCH_SIZE = 100
+
+# Délai d'écriture des instantanés persistants (secondes) : les modifications sont regroupées
+SNAPSHOT_SAVE_DELAY = 30
+
+
+def normalize_phone(phone_number):
+    """Normalise un numéro de téléphone (sans '+')"""
+    return str(phone_number or '').replace('+', '').strip()
+
+
+def normalize_text(text):
+    """Minuscules sans accents, pour la recherche"""
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    return ' '.join(''.join(c for c in text if not unicodedata.combining(c)).split())
+
+
+def text_trigrams(text):
+    """Trigrammes d'un texte normalisé"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def classify_entity(entity):
+    """Détermine le type de chat d'une entité Telethon"""
+    if isinstance(entity, types.User):
+        return 'bot' if entity.bot else 'user'
+    if isinstance(entity, (types.Chat, types.ChatForbidden)):
+        return 'group'
+    if isinstance(entity, (types.Channel, types.ChannelForbidden)):
+        if getattr(entity, 'megagroup', False) or getattr(entity, 'gigagroup', False):
+            return 'group'
+        return 'channel'
+    return 'user'
+
+
+def entity_name(entity):
+    """Obtient le nom affichable d'une entité"""
+    if getattr(entity, 'title', None):
+        return entity.title
+    if getattr(entity, 'first_name', None):
+        name = entity.first_name
+        if getattr(entity, 'last_name', None):
+            name += f' {entity.last_name}'
+        return name
+    if getattr(entity, 'username', None):
+        return f'@{entity.username}'
+    return f'Chat {entity.id}'
+
+
+def entity_to_chat(entity):
+    """Convertit une entité Telethon en entrée d'index"""
+    return {
+        'id': entity.id,
+        'name': entity_name(entity),
+        'type': classify_entity(entity),
+        'username': getattr(entity, 'username', None),
+        'status': 'Actif'
+    }
+
+
+class DialogIndexEntry:
+    """Dialogues d'un compte, regroupés par type"""
+
+    def __init__(self):
+        self.buckets = {chat_type: {} for chat_type in CHAT_TYPES}
+        self.all = {}  # Tous les chats, dans l'ordre des dialogues
+        self.search_text = {}  # chat_id -> titre et username normalisés
+        self.trigrams = {}  # trigramme -> ensemble de chat_id
+        self.built_at = 0.0
+        self.complete = False
+        self.task = None  # Reconstruction en cours
+        self.updated = asyncio.Event()
+
+    def is_fresh(self, ttl):
+        return self.complete and (time.time() - self.built_at) < ttl
+
+    def add(self, chat):
+        # Un chat peut changer de type (groupe converti en supergroupe)
+        self.discard(chat['id'])
+        self.buckets[chat['type']][chat['id']] = chat
+        self.all[chat['id']] = chat
+
+        text = normalize_text(f"{chat['name']} {chat.get('username') or ''}")
+        self.search_text[chat['id']] = text
+        for trigram in text_trigrams(text):
+            self.trigrams.setdefault(trigram, set()).add(chat['id'])
+
+    def discard(self, chat_id):
+        for bucket in self.buckets.values():
+            bucket.pop(chat_id, None)
+        self.all.pop(chat_id, None)
+
+        text = self.search_text.pop(chat_id, None)
+        if text is not None:
+            for trigram in text_trigrams(text):
+                ids = self.trigrams.get(trigram)
+                if ids is not None:
+                    ids.discard(chat_id)
+                    if not ids:
+                        del self.trigrams[trigram]
+
+    def clear(self):
+        for bucket in self.buckets.values():
+            bucket.clear()
+        self.all.clear()
+        self.search_text.clear()
+        self.trigrams.clear()
+        self.complete = False
+
+    def search(self, query, limit=20):
+        """Recherche par titre ou username (trigrammes, préfixe pour les requêtes courtes)"""
+        query = normalize_text(query)
+        if not query:
+            return []
+
+        if len(query) >= 3:
+            # Intersection des trigrammes, en commençant par le plus rare
+            candidate_sets = sorted(
+                (self.trigrams.get(trigram, set()) for trigram in text_trigrams(query)),
+                key=len
+            )
+            candidates = set(candidate_sets[0])
+            for ids in candidate_sets[1:]:
+                candidates &= ids
+                if not candidates:
+                    break
+            matches = [chat_id for chat_id in candidates if query in self.search_text[chat_id]]
+        else:
+            matches = [
+                chat_id for chat_id, text in self.search_text.items()
+                if any(word.startswith(query) for word in text.split())
+            ]
+
+        def rank(chat_id):
+            text = self.search_text[chat_id]
+            name = normalize_text(self.all[chat_id]['name'])
+            if name == query:
+                return (0, name)
+            if text.startswith(query) or f" {query}" in text:
+                return (1, name)
+            return (2, name)
+
+        return [self.all[chat_id] for chat_id in sorted(matches, key=rank)[:limit]]
+
+    def notify(self):
+        """Réveille les lecteurs qui attendent plus de résultats"""
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+    def size(self, chat_type=None):
+        return len(self.buckets.get(chat_type, {}) if chat_type else self.all)
+
+    def chats(self, chat_type=None):
+        if chat_type:
+            return list(self.buckets.get(chat_type, {}).values())
+        return list(self.all.values())
+
+    def slice(self, chat_type, start, stop):
+        source = self.buckets.get(chat_type, {}) if chat_type else self.all
+        return list(islice(source.values(), start, stop))
+
+    def counts(self):
+        return {chat_type: len(bucket) for chat_type, bucket in self.buckets.items()}
+
+
+class DialogIndex:
+    """Cache des dialogues avec TTL et mise à jour incrémentale"""
+
+    def __init__(self, ttl=DIALOG_INDEX_TTL):
+        self.ttl = ttl
+        self.entries = {}  # (user_id, phone) -> DialogIndexEntry
+        self.clients = {}  # (user_id, phone) -> client abonné aux mises à jour
+        self.hits = 0
+        self.misses = 0
+        self._dirty_snapshots = set()  # clés dont l'instantané persistant est à réécrire
+        self._snapshot_task = None
+        self._snapshot_lock = asyncio.Lock()
+
+    def _key(self, user_id, phone_number):
+        return (int(user_id), normalize_phone(phone_number))
+
+    def get_entry(self, user_id, phone_number):
+        """Retourne l'entrée existante ou en crée une vide"""
+        key = self._key(user_id, phone_number)
+        if key not in self.entries:
+            self.entries[key] = DialogIndexEntry()
+        return self.entries[key]
+
+    def ensure_building(self, client, user_id, phone_number):
+        """Démarre une reconstruction en arrière-plan si l'index a expiré"""
+        entry = self.get_entry(user_id, phone_number)
+        self.attach(client, user_id, phone_number)
+
+        if entry.is_fresh(self.ttl):
+            self.hits += 1
+            cache_requests.inc(cache="dialog_index", result="hit")
+        elif entry.task is None or entry.task.done():
+            self.misses += 1
+            cache_requests.inc(cache="dialog_index", result="miss")
+            # Index expiré mais complet : reconstruit à part, l'ancien reste servi jusqu'à l'échange
+            target = DialogIndexEntry() if entry.complete else entry
+            key = self._key(user_id, phone_number)
+            entry.task = asyncio.create_task(self._build(client, target, user_id, phone_number))
+            entry.task.add_done_callback(lambda task: self._build_done(task, key))
+        return entry
+
+    @staticmethod
+    def _build_done(task, key):
+        """Journalise l'échec d'une reconstruction (l'exception de la tâche est toujours récupérée)"""
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Dialog index build failed for user {key[0]} on {key[1]}: {task.exception()}")
+
+    async def get_chats(self, client, user_id, phone_number, chat_type=None):
+        """Retourne les chats depuis la mémoire, en reconstruisant si expiré"""
+        entry = self.ensure_building(client, user_id, phone_number)
+        if entry.task and not entry.task.done():
+            await asyncio.shield(entry.task)
+        return self.get_entry(user_id, phone_number).chats(chat_type)
+
+    async def get_page(self, client, user_id, phone_number, chat_type, page, page_size):
+        """
+        Retourne une page de chats dès que le premier lot de dialogues la couvre.
+        Résultat : (chats, has_more, complete)
+        """
+        entry = self.ensure_building(client, user_id, phone_number)
+        start = page * page_size
+        # Un élément de plus pour savoir s'il existe une page suivante
+        await self.wait_for(entry, chat_type, start + page_size + 1)
+        chats = entry.slice(chat_type, start, start + page_size)
+        has_more = entry.size(chat_type) > start + page_size or not entry.complete
+        return chats, has_more, entry.complete
+
+    async def wait_for(self, entry, chat_type, count):
+        """Attend que l'index contienne `count` chats du type demandé ou soit complet"""
+        while not entry.complete and entry.size(chat_type) < count:
+            if entry.task is None or entry.task.done():
+                break
+            await entry.updated.wait()
+
+    async def _build(self, client, entry, user_id, phone_number):
+        """
+        Reconstruit l'index complet depuis iter_dialogs(), lot par lot.
+        entry est l'entrée servie (premier index, lu au fil des lots) ou une nouvelle entrée
+        qui remplace l'index expiré une fois complète.
+        """
+        started = time.time()
+        entry.clear()
+        entry.notify()
+        try:
+            batch = 0
+            async for dialog in client.iter_dialogs():
+                try:
+                    entry.add(entity_to_chat(dialog.entity))
+                except Exception as e:
+                    logger.error(f"Error indexing dialog: {e}")
+                batch += 1
+                if batch >= DIALOG_BATCH_SIZE:
+                    batch = 0
+                    entry.notify()
+                    # Laisser les lecteurs afficher la première page
+                    await asyncio.sleep(0)
+            entry.built_at = time.time()
+            entry.complete = True
+            self.entries[self._key(user_id, phone_number)] = entry
+            logger.info(
+                f"Dialog index built for user {user_id} on {normalize_phone(phone_number)}: "
+                f"{entry.size()} chats in {entry.built_at - started:.2f}s"
+            )
+
+            # Instantané persistant, servi quand le client n'est plus disponible
+            self.schedule_snapshot(self._key(user_id, phone_number))
+        finally:
+            entry.notify()
+
+    def schedule_snapshot(self, key):
+        """Programme l'écriture de l'instantané d'un compte (regroupée, hors de la boucle asyncio)"""
+        self._dirty_snapshots.add(key)
+        if self._snapshot_task is None or self._snapshot_task.done():
+            self._snapshot_task = asyncio.create_task(self._save_snapshots_later())
+
+    async def _save_snapshots_later(self):
+        await asyncio.sleep(SNAPSHOT_SAVE_DELAY)
+        await self.save_snapshots()
+
+    async def save_snapshots(self):
+        """Écrit les instantanés en attente (aussi appelé lors de l'arrêt)"""
+        async with self._snapshot_lock:
+            keys, self._dirty_snapshots = self._dirty_snapshots, set()
+            items = [
+                (user_id, phone, self.entries[(user_id, phone)].chats())
+                for user_id, phone in keys
+                if (user_id, phone) in self.entries and self.entries[(user_id, phone)].complete
+            ]
+            if not items:
+                return
+            from bot.database import store_chats_snapshots
+            try:
+                await asyncio.to_thread(store_chats_snapshots, items)
+            except Exception as e:
+                logger.error(f"Error saving chat snapshots: {e}")
+
+    async def search(self, client, user_id, phone_number, query, limit=20):
+        """Recherche dans l'index, sans nouveau passage iter_dialogs() s'il est frais"""
+        entry = self.ensure_building(client, user_id, phone_number)
+        if entry.task and not entry.task.done():
+            await asyncio.shield(entry.task)
+        return self.get_entry(user_id, phone_number).search(query, limit)
+
+    def invalidate(self, user_id, phone_number=None):
+        """Force une reconstruction au prochain accès"""
+        for key in list(self.entries):
+            if key[0] == int(user_id) and (phone_number is None or key[1] == normalize_phone(phone_number)):
+                self.entries[key].built_at = 0.0
+
+    def attach(self, client, user_id, phone_number):
+        """Abonne l'index aux mises à jour d'un client (une seule fois par client)"""
+        key = self._key(user_id, phone_number)
+        if self.clients.get(key) is client:
+            return
+        self.clients[key] = client
+
+        async def on_chat_action(event):
+            await self._on_chat_action(event, key)
+
+        async def on_channel_update(update):
+            await self._on_channel_update(client, update, key)
+
+        async def on_private_message(event):
+            await self._on_private_message(event, key)
+
+        client.add_event_handler(on_chat_action, events.ChatAction())
+        client.add_event_handler(on_channel_update, events.Raw(types.UpdateChannel))
+        client.add_event_handler(on_private_message, events.NewMessage(func=lambda e: e.is_private))
+
+    async def _on_chat_action(self, event, key):
+        """Ajout/retrait d'un groupe quand le compte le rejoint ou le quitte"""
+        entry = self.entries.get(key)
+        if not entry or not entry.complete:
+            return
+        try:
+            me = await event.client.get_me(input_peer=True)
+            if not event.created and me.user_id not in (event.user_ids or []):
+                return
+            chat_id, _ = resolve_id(event.chat_id)
+            if event.user_left or event.user_kicked:
+                entry.discard(chat_id)
+                self.schedule_snapshot(key)
+            elif event.user_joined or event.user_added or event.created:
+                chat = await event.get_chat()
+                if chat:
+                    entry.add(entity_to_chat(chat))
+                    self.schedule_snapshot(key)
+        except Exception as e:
+            logger.debug(f"Dialog index chat action ignored: {e}")
+
+    async def _on_channel_update(self, client, update, key):
+        """Canal rejoint ou quitté (UpdateChannel)"""
+        entry = self.entries.get(key)
+        if not entry or not entry.complete:
+            return
+        channel_id = update.channel_id
+        try:
+            channel = await client.get_entity(types.PeerChannel(channel_id))
+            if getattr(channel, 'left', False) or isinstance(channel, types.ChannelForbidden):
+                entry.discard(channel_id)
+            else:
+                entry.add(entity_to_chat(channel))
+        except Exception:
+            entry.discard(channel_id)
+        self.schedule_snapshot(key)
+
+    async def _on_private_message(self, event, key):
+        """Nouvelle conversation privée"""
+        entry = self.entries.get(key)
+        if not entry or not entry.complete:
+            return
+        if event.chat_id in entry.buckets['user'] or event.chat_id in entry.buckets['bot']:
+            return
+        try:
+            chat = await event.get_chat()
+            if chat:
+                entry.add(entity_to_chat(chat))
+                self.schedule_snapshot(key)
+        except Exception as e:
+            logger.debug(f"Dialog index private chat ignored: {e}")
+
+
+# Instance globale
+dialog_index = DialogIndex()
@@ -3,34 +3,32 @@ import os
 import asyncio
 from telethon import TelegramClient, events
 from config.settings import API_ID, API_HASH, BOT_TOKEN, ADMIN_ID
-from keep_alive import KeepAliveSystem
 from bot.license import check_license, validate_license_code
 from bot.payment import process_payment
-from bot.deploy import handle_deploy
 from bot.connection import handle_connect, handle_verification_code
 from bot.redirection import handle_redirection_command
 from bot.transformation import handle_transformation_command
 from bot.whitelist import handle_whitelist_command
 from bot.blacklist import handle_blacklist_command
-from bot.chats import handle_chats_command
+from bot.chats import handle_chats_command, handle_chats_callback
 from bot.admin import handle_admin_commands
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/activity.log'),
-        logging.StreamHandler()
-    ]
-)
+from bot.conversation import conversation_manager, AWAITING_CODE, AWAITING_REDIRECTION_IDS, AWAITING_LICENSE
+from bot.logging_setup import setup_logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize Telegram client without starting it yet
-client = TelegramClient('bot', API_ID, API_HASH)
+# Client du bot, créé par create_client() au démarrage (pas à l'import : les workers
+# lancés en spawn réimportent le module principal)
+client = None
+
+def create_client():
+    """Crée le client du bot et y enregistre les gestionnaires"""
+    global client
+    client = TelegramClient('bot', API_ID, API_HASH)
+    client.add_event_handler(chats_navigation, events.CallbackQuery(pattern=b"chats\\|"))
+    client.add_event_handler(route_message, events.NewMessage)
+    return client
 
-@client.on(events.NewMessage(pattern="/start"))
 async def start(event):
     """Handle /start command"""
     try:
@@ -58,7 +56,6 @@ Pour accéder aux fonctionnalités premium, veuillez valider votre licence avec
         logger.error(f"Error in start command: {e}")
         await event.respond("❌ Une erreur est survenue. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/valide"))
 async def valide(event):
     """Handle /valide command for license validation"""
     try:
@@ -68,7 +65,6 @@ async def valide(event):
         logger.error(f"Error in license validation: {e}")
         await event.respond("❌ Erreur lors de la validation de licence. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/payer une semaine"))
 async def payer_semaine(event):
     """Handle /payer une semaine command"""
     try:
@@ -78,7 +74,6 @@ async def payer_semaine(event):
         logger.error(f"Error in weekly payment processing: {e}")
         await event.respond("❌ Erreur lors du traitement du paiement. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/payer un mois"))
 async def payer_mois(event):
     """Handle /payer un mois command"""
     try:
@@ -88,14 +83,9 @@ async def payer_mois(event):
         logger.error(f"Error in monthly payment processing: {e}")
         await event.respond("❌ Erreur lors du traitement du paiement. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/payer"))
 async def payer(event):
     """Handle /payer command for payment processing"""
     try:
-        # Check if it's a specific payment command
-        if "une semaine" in event.text or "un mois" in event.text:
-            return  # Let the specific handlers handle it first
-
         # Show payment options
         payment_options = """
 💳 **Options de paiement TeleFeed**
@@ -116,17 +106,17 @@ Choisissez votre formule d'abonnement :
         logger.error(f"Error in payment processing: {e}")
         await event.respond("❌ Erreur lors du traitement du paiement. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/deposer"))
 async def deposer(event):
     """Handle /deposer command for file deployment"""
     try:
+        # Rarement utilisé : chargé à la première commande plutôt qu'au démarrage
+        from bot.deploy import handle_deploy
         await handle_deploy(event, client)
         logger.info(f"Deploy request from user {event.sender_id}")
     except Exception as e:
         logger.error(f"Error in deploy handling: {e}")
         await event.respond("❌ Erreur lors du traitement du dépôt. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/connect"))
 async def connect(event):
     """Handle /connect command"""
     try:
@@ -136,7 +126,6 @@ async def connect(event):
         logger.error(f"Error in connect command: {e}")
         await event.respond("❌ Erreur lors de la connexion. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/redirection"))
 async def redirection(event):
     """Handle /redirection command"""
     try:
@@ -146,7 +135,6 @@ async def redirection(event):
         logger.error(f"Error in redirection command: {e}")
         await event.respond("❌ Erreur lors de la redirection. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/transformation"))
 async def transformation(event):
     """Handle /transformation command"""
     try:
@@ -156,7 +144,6 @@ async def transformation(event):
         logger.error(f"Error in transformation command: {e}")
         await event.respond("❌ Erreur lors de la transformation. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/whitelist"))
 async def whitelist(event):
     """Handle /whitelist command"""
     try:
@@ -166,7 +153,6 @@ async def whitelist(event):
         logger.error(f"Error in whitelist command: {e}")
         await event.respond("❌ Erreur lors de la whitelist. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/blacklist"))
 async def blacklist(event):
     """Handle /blacklist command"""
     try:
@@ -176,7 +162,6 @@ async def blacklist(event):
         logger.error(f"Error in blacklist command: {e}")
         await event.respond("❌ Erreur lors de la blacklist. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/chats"))
 async def chats(event):
     """Handle /chats command"""
     try:
@@ -186,7 +171,10 @@ async def chats(event):
         logger.error(f"Error in chats command: {e}")
         await event.respond("❌ Erreur lors de l'affichage des chats. Veuillez réessayer.")
 
-@client.on(events.NewMessage(pattern="/help"))
+async def chats_navigation(event):
+    """Handle /chats page navigation buttons"""
+    await handle_chats_callback(event, client)
+
 async def help_command(event):
     """Handle /help command"""
     try:
@@ -217,27 +205,22 @@ Pour toute question ou problème, contactez l'administrateur.
         await event.respond("❌ Une erreur est survenue. Veuillez réessayer.")
 
 # Admin commands
-@client.on(events.NewMessage(pattern="/admin"))
 async def admin_command(event):
     """Handle /admin command"""
     await handle_admin_commands(event, client)
 
-@client.on(events.NewMessage(pattern="/confirm"))
 async def confirm_command(event):
     """Handle /confirm command"""
     await handle_admin_commands(event, client)
 
-@client.on(events.NewMessage(pattern="/generate"))
 async def generate_command(event):
     """Handle /generate command"""
     await handle_admin_commands(event, client)
 
-@client.on(events.NewMessage(pattern="/users"))
 async def users_command(event):
     """Handle /users command"""
     await handle_admin_commands(event, client)
 
-@client.on(events.NewMessage(pattern="/stats"))
 async def stats_command(event):
     """Handle /stats command"""
     await handle_admin_commands(event, client)
@@ -267,10 +250,11 @@ async def handle_sessions(event, client):
         python_version = platform.python_version()
         system_info = f"{platform.system()} {platform.release()}"
 
-        # Get active connections
-        from bot.connection import active_connections
+        # Get the user's live account clients
+        from bot.client_registry import client_registry
+        user_entries = client_registry.get_user_entries(user_id)
 
-        if user_id not in active_connections:
+        if not user_entries:
             # Afficher quand même les infos serveur
             server_info = f"""
 🌐 **Serveur Replit Hébergement**
@@ -292,7 +276,7 @@ async def handle_sessions(event, client):
             await event.respond(server_info)
             return
 
-        connection_info = active_connections[user_id]
+        connection_info = user_entries[-1]
 
         # Check if connection is still valid
         if 'client' not in connection_info:
@@ -369,12 +353,14 @@ async def handle_sessions(event, client):
     except Exception as e:
         logger.error(f"Erreur dans handle_sessions: {e}")
         await event.respond("❌ Erreur lors de la récupération des sessions.")
-@client.on(events.NewMessage(pattern="/sessions"))
 async def sessions_command(event):
     """Handle /sessions command"""
     await handle_admin_commands(event, client)
 
-@client.on(events.NewMessage(pattern="/stop"))
+async def latency_command(event):
+    """Handle /latency command"""
+    await handle_admin_commands(event, client)
+
 async def stop_continuous_command(event):
     """Handle /stop command - Stop continuous mode"""
     try:
@@ -398,7 +384,6 @@ async def stop_continuous_command(event):
         logger.error(f"Error in stop command: {e}")
         await event.respond("❌ Erreur lors de l'arrêt du mode continu.")
 
-@client.on(events.NewMessage(pattern="/start_continuous"))
 async def start_continuous_command(event):
     """Handle /start_continuous command - Start continuous mode"""
     try:
@@ -422,7 +407,6 @@ async def start_continuous_command(event):
         logger.error(f"Error in start_continuous command: {e}")
         await event.respond("❌ Erreur lors du démarrage du mode continu.")
 
-@client.on(events.NewMessage(pattern="/keepalive"))
 async def keepalive_command(event):
     """Handle /keepalive command - Check keep-alive system status"""
     try:
@@ -485,7 +469,6 @@ async def keepalive_command(event):
         logger.error(f"Error in keepalive command: {e}")
         await event.respond("❌ Erreur lors de la vérification du statut.")
 
-@client.on(events.NewMessage(pattern="/railway"))
 async def railway_command(event):
     """Handle /railway command - Railway deployment and communication"""
     try:
@@ -527,7 +510,6 @@ async def railway_command(event):
         logger.error(f"Error in railway command: {e}")
         await event.respond("❌ Erreur lors de l'affichage du statut Railway.")
 
-@client.on(events.NewMessage(pattern="/railway deploy"))
 async def railway_deploy_command(event):
     """Handle /railway deploy command"""
     try:
@@ -575,7 +557,6 @@ git push origin main
         logger.error(f"Error in railway deploy command: {e}")
         await event.respond("❌ Erreur lors de l'affichage des instructions de déploiement.")
 
-@client.on(events.NewMessage(pattern="/railway test"))
 async def railway_test_command(event):
     """Handle /railway test command - Test Railway communication"""
     try:
@@ -617,36 +598,36 @@ async def railway_test_command(event):
         logger.error(f"Error in railway test command: {e}")
         await event.respond("❌ Erreur lors du test de communication Railway.")
 
-@client.on(events.NewMessage)
 async def handle_unknown_command(event):
-    """Handle unknown commands and verification codes"""
-    # Mettre à jour l'activité du bot à chaque message
-    if hasattr(client, 'keep_alive_system'):
-        client.keep_alive_system.update_bot_activity()
-
-    # First check if it's a verification code
-    if await handle_verification_code(event, client):
-        return  # Message was handled as verification code
-
-    # Check if it's a redirection format (ID - ID)
-    if event.text and " - " in event.text:
-        parts = event.text.split(" - ")
+    """Handle non-command messages according to the user's conversation state"""
+    text = (event.text or "").strip()
+    state = conversation_manager.get(event.sender_id)
+
+    if state is None:
+        # Redirection IDs sent without /redirection add: explain the flow
+        if " - " in text:
+            parts = text.split(" - ")
+            if len(parts) == 2 and len(parts[0].strip()) > 5 and len(parts[1].strip()) > 5:
+                await event.respond("❌ **Aucune redirection en attente**\n\nVeuillez d'abord utiliser `/redirection add NOM on NUMERO`.")
+        return
+
+    if state["state"] == AWAITING_CODE:
+        await handle_verification_code(event, client)
+
+    elif state["state"] == AWAITING_REDIRECTION_IDS:
+        # Redirection format (ID - ID)
+        parts = text.split(" - ")
         if len(parts) == 2 and len(parts[0].strip()) > 5 and len(parts[1].strip()) > 5:
             from bot.redirection import handle_redirection_format
             await handle_redirection_format(event, client, parts[0].strip(), parts[1].strip())
-            return
 
-    # Check if it's a license code (starts with user ID)
-    if event.text and event.text.strip() and event.text.strip().startswith(str(event.sender_id)):
-        if await validate_license_code(event, client, event.text.strip()):
-            return  # License was validated successfully
-
-    # Then check for unknown commands
-    if event.text and event.text.startswith('/') and not any(event.text.startswith(cmd) for cmd in ['/start', '/connect', '/valide', '/payer', '/deposer', '/redirection', '/transformation', '/whitelist', '/blacklist', '/chats', '/help', '/admin', '/confirm', '/generate', '/users', '/stats', '/sessions', '/keepalive', '/stop', '/start_continuous', '/railway']):
-        await event.respond("❓ Commande non reconnue. Tapez /help pour voir les commandes disponibles.")
+    elif state["state"] == AWAITING_LICENSE:
+        if text:
+            # One attempt per /valide
+            conversation_manager.clear(event.sender_id, AWAITING_LICENSE)
+            await validate_license_code(event, client, text)
 
 # Surveillance automatique pour Render
-@client.on(events.NewMessage(pattern="Kouamé Appolinaire tu es là ?"))
 async def surveillance_response(event):
     """Handle automatic surveillance from Render"""
     try:
@@ -655,30 +636,148 @@ async def surveillance_response(event):
     except Exception as e:
         logger.error(f"Error in surveillance response: {e}")
 
-async def start_bot():
-    """Start the bot and handle all initialization"""
-    try:
-        # Start client with bot token
-        await client.start(bot_token=BOT_TOKEN)
-        logger.info("🚀 Bot TeleFeed démarré avec succès!")
-        print("Bot lancé !")
+SURVEILLANCE_MESSAGE = "Kouamé Appolinaire tu es là ?"
+
+# Command token -> handler
+COMMAND_HANDLERS = {
+    "/start": start,
+    "/valide": valide,
+    "/payer": payer,
+    "/deposer": deposer,
+    "/connect": connect,
+    "/redirection": redirection,
+    "/transformation": transformation,
+    "/whitelist": whitelist,
+    "/blacklist": blacklist,
+    "/chats": chats,
+    "/help": help_command,
+    "/admin": admin_command,
+    "/confirm": confirm_command,
+    "/generate": generate_command,
+    "/users": users_command,
+    "/stats": stats_command,
+    "/sessions": sessions_command,
+    "/latency": latency_command,
+    "/stop": stop_continuous_command,
+    "/start_continuous": start_continuous_command,
+    "/keepalive": keepalive_command,
+    "/railway": railway_command,
+}
+
+# Command token -> {arguments: handler} for commands with sub-commands
+SUBCOMMAND_HANDLERS = {
+    "/payer": {"une semaine": payer_semaine, "un mois": payer_mois},
+    "/railway": {"deploy": railway_deploy_command, "test": railway_test_command},
+}
+
+def resolve_command(text):
+    """Return the handler for a command message, or None if unknown"""
+    parts = text.split(maxsplit=3)
+    # "/cmd@TeleFeedBot args" -> "/cmd"
+    command = parts[0].split('@', 1)[0]
+
+    subcommands = SUBCOMMAND_HANDLERS.get(command)
+    if subcommands and len(parts) > 1:
+        handler = subcommands.get(" ".join(parts[1:3])) or subcommands.get(parts[1])
+        if handler:
+            return handler
+
+    return COMMAND_HANDLERS.get(command)
+
+async def route_message(event):
+    """Single entry point for incoming messages: one dict lookup per command"""
+    # Mettre à jour l'activité du bot à chaque message
+    if hasattr(client, 'keep_alive_system'):
+        client.keep_alive_system.update_bot_activity()
 
-        # Initialize session manager and restore sessions
-        from bot.session_manager import session_manager
-        await session_manager.restore_all_sessions()
+    text = event.text or ""
 
-        # Wait a moment for sessions to be fully restored
-        await asyncio.sleep(2)
+    if text.startswith('/'):
+        handler = resolve_command(text)
+        if handler:
+            await handler(event)
+        else:
+            await event.respond("❓ Commande non reconnue. Tapez /help pour voir les commandes disponibles.")
+        return
 
-        # Restore all active redirections automatically (système simple)
+    if text.startswith(SURVEILLANCE_MESSAGE):
+        await surveillance_response(event)
+
+    await handle_unknown_command(event)
+
+# Tâches de fond du démarrage : référence conservée, une tâche sans référence peut être collectée
+_background_tasks = set()
+
+def start_background_task(coro):
+    """Lance une tâche de fond en gardant sa référence jusqu'à sa fin"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def restore_accounts():
+    """Restaure les comptes utilisateurs sans bloquer le démarrage du bot (mode mono-processus)"""
+    from bot.startup import startup_timer
+    try:
+        # Reconnexion automatique des comptes tombés, y compris pendant une restauration lente
+        from bot.health_supervisor import health_supervisor
+        start_background_task(health_supervisor.run())
+
+        # Redirections d'abord : chaque compte connecté attache aussitôt ses routes (bot.readiness)
         from bot.simple_restorer import simple_restorer
-        await simple_restorer.restore_all_redirections()
+        with startup_timer.phase("route_restore"):
+            await simple_restorer.restore_all_redirections()
 
         # Configuration des redirections automatiques via simple_restorer uniquement
         # from bot.message_handler import message_redirector
         # await message_redirector.setup_redirection_handlers()
         logger.info("🔄 Redirections gérées par simple_restorer")
 
+        # Sessions : clients déjà connectés ci-dessus réutilisés, sessions expirées désactivées
+        from bot.session_manager import session_manager
+        with startup_timer.phase("db_init"):
+            await session_manager.connect()
+        with startup_timer.phase("session_restore"):
+            await session_manager.restore_all_sessions()
+
+        # Mise en veille des comptes sans redirection inactifs
+        from bot.client_registry import client_registry
+        start_background_task(client_registry.hibernation_loop())
+    except Exception as e:
+        logger.error(f"Error restoring accounts: {e}")
+    finally:
+        startup_timer.report()
+
+async def start_bot():
+    """Start the bot and handle all initialization"""
+    try:
+        # Serveur HTTP dans la même boucle que le bot (health check disponible dès le démarrage)
+        from bot.startup import startup_timer
+        from http_server import start_http_server
+        with startup_timer.phase("http_server"):
+            await start_http_server(client)
+
+        # Start client with bot token
+        with startup_timer.phase("bot_login"):
+            await client.start(bot_token=BOT_TOKEN)
+        logger.info("🚀 Bot TeleFeed démarré avec succès!")
+        print("Bot lancé !")
+
+        # Messages internes (notifications, endpoints HTTP) envoyés par ce client
+        from bot.messenger import bot_messenger
+        bot_messenger.attach(client)
+
+        from bot.workers import worker_pool
+        if worker_pool.enabled:
+            # User accounts are sharded across worker processes, which restore their own redirections
+            with startup_timer.phase("workers"):
+                await worker_pool.start()
+            startup_timer.report()
+        else:
+            # Restauration en tâche de fond : chaque compte transfère dès que son client est connecté,
+            # le bot répond aux commandes et /health donne l'avancement pendant ce temps
+            start_background_task(restore_accounts())
+
         # Log restoration summary
         logger.info("🔄 Système de restauration automatique des redirections activé")
 
@@ -696,8 +795,16 @@ async def start_bot():
         # Plus besoin des messages "réveil toi" - communication silencieuse uniquement
         logger.info("🔕 Système keep-alive traditionnel désactivé - Communication automatique active")
 
+        # Arrêt propre sur SIGTERM (redéploiement) et SIGINT
+        from bot.shutdown import shutdown_manager
+        shutdown_manager.install(client)
+
         await client.run_until_disconnected()
 
+        # Déconnexion provoquée par l'arrêt propre : le laisser se terminer avant de quitter la boucle
+        if shutdown_manager.stopping:
+            await shutdown_manager.closed.wait()
+
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
         raise
@@ -705,6 +812,10 @@ async def start_bot():
 def start_bot_sync():
     """Synchronous wrapper to start the bot"""
     try:
+        # Configure logging (file with rotation + console, written off the event loop)
+        setup_logging()
+        create_client()
+
         # Get or create event loop
         try:
             loop = asyncio.get_event_loop()
@@ -0,0 +1,116 @@
+"""
+Surveillance des connexions des comptes utilisateurs
+Reconnecte automatiquement un client tombé (backoff exponentiel avec jitter),
+réattache ses redirections et rattrape les messages manqués
+"""
+
+import logging
+import asyncio
+import os
+import random
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Intervalle de vérification des clients (secondes)
+HEALTH_CHECK_INTERVAL = int(os.getenv("HEALTH_CHECK_INTERVAL", "10"))
+
+# Backoff de reconnexion : min(BACKOFF_MAX, BACKOFF_BASE * 2^tentative), tiré au hasard ("full jitter")
+RECONNECT_BACKOFF_BASE = 1.0
+RECONNECT_BACKOFF_MAX = 300.0
+
+
+class HealthSupervisor:
+    """Surveille les clients du registre et relance ceux qui sont déconnectés"""
+
+    def __init__(self, interval=HEALTH_CHECK_INTERVAL):
+        self.interval = interval
+        self.reconnecting = {}  # (user_id, phone) -> Task
+        self.reconnects = 0
+        self.failures = 0
+        self.stopped = False
+
+    async def run(self):
+        """Boucle de surveillance"""
+        logger.info("🩺 Surveillance des connexions démarrée")
+        while not self.stopped:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error checking client health: {e}")
+            await asyncio.sleep(self.interval)
+
+    def check(self):
+        """Lance une reconnexion pour chaque client tombé (hors mise en veille)"""
+        from bot.client_registry import client_registry
+        for key, entry in client_registry.items():
+            if not entry.get('connected') or entry['client'].is_connected():
+                continue
+            if key in self.reconnecting:
+                continue
+            entry.setdefault('down_since', time.time())
+            logger.warning(f"Client down for {key[0]}:{key[1]}, reconnecting")
+            self.reconnecting[key] = asyncio.create_task(self._reconnect(key, entry))
+
+    async def _reconnect(self, key, entry):
+        """Reconnecte un compte jusqu'au succès, avec backoff exponentiel et jitter"""
+        from bot.client_registry import client_registry
+        attempt = 0
+        try:
+            while entry.get('connected') and client_registry.entries.get(key) is entry:
+                delay = random.uniform(0, min(RECONNECT_BACKOFF_MAX, RECONNECT_BACKOFF_BASE * 2 ** attempt))
+                await asyncio.sleep(delay)
+                attempt += 1
+
+                try:
+                    client = await client_registry.acquire(*key)
+                except Exception as e:
+                    logger.warning(f"Reconnect attempt {attempt} failed for {key[0]}:{key[1]}: {e}")
+                    client = None
+
+                if client:
+                    downtime = time.time() - entry.pop('down_since', time.time())
+                    entry['reconnected_at'] = datetime.now()
+                    self.reconnects += 1
+                    logger.info(f"✅ Client reconnected for {key[0]}:{key[1]} after {downtime:.1f}s ({attempt} attempt(s))")
+                    await self._resume(client, key)
+                    return
+                self.failures += 1
+        finally:
+            self.reconnecting.pop(key, None)
+
+    async def _resume(self, client, key):
+        """Réattache les redirections du compte puis rattrape les mises à jour manquées"""
+        user_id, phone_number = key
+        try:
+            from bot.database import load_data
+            from bot.client_registry import routes_by_phone
+            user_redirections = load_data().get("redirections", {}).get(str(user_id), {})
+            routes = routes_by_phone(user_redirections).get(phone_number)
+            if routes:
+                # Les redirections déjà attachées à ce client sont ignorées (claim_route)
+                from bot.simple_restorer import simple_restorer
+                await simple_restorer._setup_message_handlers(client, user_id, routes)
+
+            # getDifference : les messages reçus pendant la coupure passent par les gestionnaires
+            await client.catch_up()
+        except Exception as e:
+            logger.error(f"Error resuming {user_id}:{phone_number} after reconnect: {e}")
+
+    def stop(self):
+        """Arrête les reconnexions (arrêt du bot)"""
+        self.stopped = True
+        for task in self.reconnecting.values():
+            task.cancel()
+
+    def stats(self):
+        return {
+            "reconnecting": len(self.reconnecting),
+            "reconnects": self.reconnects,
+            "failures": self.failures,
+        }
+
+
+# Instance globale
+health_supervisor = HealthSupervisor()
@@ -0,0 +1,35 @@
+"""
+Session HTTP aiohttp partagée par un sous-système (keep-alive, communication automatique, messagerie)
+Créée au premier appel puis réutilisée : connexions keep-alive et cache DNS d'une requête à l'autre
+"""
+
+import aiohttp
+
+HTTP_POOL_LIMIT = 10
+HTTP_DNS_CACHE_TTL = 300  # secondes
+HTTP_KEEPALIVE_TIMEOUT = 75  # secondes
+
+
+class PooledSession:
+    """ClientSession paresseuse, recréée si elle a été fermée"""
+
+    def __init__(self, limit=HTTP_POOL_LIMIT, dns_cache_ttl=HTTP_DNS_CACHE_TTL,
+                 keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT):
+        self.limit = limit
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+
+    def get(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
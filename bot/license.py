@@ -2,6 +2,7 @@ from telethon import events
 import logging
 import os
 from bot.database import store_license, is_user_licensed
+from bot.conversation import conversation_manager, AWAITING_LICENSE
 
 logger = logging.getLogger(__name__)
 
@@ -23,14 +24,9 @@ async def check_license(event, client):
         # Request license from user
         await event.respond("🔐 **Validation de licence**\n\nVeuillez entrer votre code de licence :")
         
-        # For now, inform user to send license in next message
+        # Next free-text message from this user is the license code
+        conversation_manager.set(event.sender_id, AWAITING_LICENSE)
         await event.respond("📝 **Instructions :**\n\nEnvoyez votre code de licence dans le prochain message.")
-        
-        # Note: License validation will be handled by the message handler
-        # This is a simplified approach - in production, you'd use conversation state
-            
-        # This function now only handles the /valide command
-        # License validation will be handled by a separate function
                 
     except Exception as e:
         logger.error(f"Error in license validation: {e}")
@@ -91,6 +87,7 @@ async def validate_license_code(event, client, license_code):
             
             # Store license validation
             await store_license(user_id, license_code)
+            conversation_manager.clear(event.sender_id, AWAITING_LICENSE)
             return True
             
         else:
@@ -0,0 +1,137 @@
+"""
+Configuration des journaux du bot
+Les appels de log ne font que déposer l'enregistrement dans une file ; un thread (QueueListener)
+le formate et l'écrit (fichier avec rotation par taille, console), hors de la boucle asyncio.
+Mode structuré (LOG_STYLE=json) : une ligne JSON par enregistrement, avec les champs passés
+dans extra={"fields": {...}}. Les succès de transfert sont échantillonnés par redirection.
+"""
+
+import logging
+import logging.handlers
+import atexit
+import json
+import os
+import queue
+
+# Niveau global et niveaux par module ("telethon=WARNING,bot.dialog_index=DEBUG")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "telethon=WARNING")
+
+# Fichier de log et rotation
+LOG_FILE = os.getenv("LOG_FILE", "logs/activity.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# "text" (format ci-dessus) ou "json"
+LOG_STYLE = os.getenv("LOG_STYLE", "text")
+
+# Transferts réussis : 1 ligne toutes les N par redirection (les échecs sont toujours journalisés)
+FORWARD_LOG_EVERY = int(os.getenv("FORWARD_LOG_EVERY", "50"))
+
+_listener = None
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler qui transmet l'enregistrement tel quel : le formatage (%-args, traceback)
+    est fait par le thread d'écriture et non par la boucle asyncio
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par enregistrement (champs structurés de extra={"fields": {...}} inclus)"""
+
+    def __init__(self, static_fields=None):
+        super().__init__()
+        self.static_fields = static_fields or {}
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **self.static_fields,
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ForwardLogSampler:
+    """
+    Échantillonnage des logs de transferts réussis, par redirection :
+    le premier puis un sur `every` sont journalisés avec le total cumulé, les autres sont seulement comptés
+    """
+
+    def __init__(self, every=FORWARD_LOG_EVERY):
+        self.every = max(1, every)
+        self.counts = {}  # (user_id, redirection) -> transferts réussis
+
+    def sample(self, user_id, route):
+        """Compte un succès ; retourne le total s'il doit être journalisé, sinon None"""
+        key = (user_id, route)
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        if count == 1 or count % self.every == 0:
+            return count
+        return None
+
+
+def parse_levels(spec):
+    """Spécification "module=NIVEAU,..." -> {module: NIVEAU}"""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(log_file=LOG_FILE, fmt=LOG_FORMAT, level=LOG_LEVEL, module_levels=LOG_LEVELS,
+                  style=LOG_STYLE, static_fields=None):
+    """
+    Installe la file de logs sur le logger racine (une seule fois par processus).
+    log_file=None : console uniquement (processus workers).
+    static_fields : champs ajoutés à chaque ligne en mode JSON (ex. index du worker).
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter(static_fields) if style == "json" else logging.Formatter(fmt)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        log_dir = os.path.dirname(log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level.upper())
+    for name, module_level in parse_levels(module_levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Vider la file avant la sortie du processus
+    atexit.register(_listener.stop)
+    return _listener
+
+
+# Instance globale
+forward_log_sampler = ForwardLogSampler()
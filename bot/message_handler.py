@@ -1,9 +1,14 @@
 import logging
 import asyncio
 from telethon import events
-from bot.database import load_data
-from bot.connection import active_connections
+from telethon.errors import FloodWaitError
+from bot.database import load_data, load_message_mapping
+from bot.client_registry import client_registry, routes_by_phone
 from bot.error_handler import error_handler
+from bot.shutdown import shutdown_manager
+from bot.metrics import messages_forwarded, send_duration, flood_waits, handler_errors
+from bot.tracing import forward_tracer
+from bot.logging_setup import forward_log_sampler
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -12,8 +17,7 @@ class MessageRedirector:
     """Handles message redirection based on configured rules"""
     
     def __init__(self):
-        self.redirection_clients = {}
-        self.message_mapping = {}  # Maps original message ID to redirected message ID
+        self.message_mapping = load_message_mapping()  # Maps original message ID to redirected message ID
         
     async def setup_redirection_handlers(self):
         """Setup message handlers for all active connections"""
@@ -29,17 +33,15 @@ class MessageRedirector:
             await asyncio.sleep(3)
             
             for user_id, user_redirections in redirections.items():
-                if int(user_id) in active_connections:
-                    connection_data = active_connections[int(user_id)]
-                    client = connection_data.get('client')
-                    if client and client.is_connected():
-                        count = await self._setup_client_handlers(client, int(user_id), user_redirections)
+                # Each redirection is attached to the client of the phone it was created on
+                for phone_number, phone_redirections in routes_by_phone(user_redirections).items():
+                    client = client_registry.get(user_id, phone_number)
+                    if client:
+                        count = await self._setup_client_handlers(client, int(user_id), phone_redirections)
                         total_redirections += count
-                        logger.info(f"Restored {count} redirections for user {user_id}")
+                        logger.info(f"Restored {count} redirections for user {user_id} on {phone_number}")
                     else:
-                        logger.warning(f"User {user_id} has redirections but no active client")
-                else:
-                    logger.warning(f"User {user_id} has redirections but no active connection")
+                        logger.warning(f"User {user_id} has redirections on {phone_number} but no active client")
             
             logger.info(f"🔄 Redirections automatiques configurées: {total_redirections} redirections actives")
                         
@@ -52,28 +54,14 @@ class MessageRedirector:
             from bot.session_manager import session_manager
             
             for user_id, user_redirections in redirections.items():
-                # Check if user has active redirections
-                active_redirections = [r for r in user_redirections.values() if r.get('active', True)]
-                
-                if active_redirections:
-                    logger.info(f"Restoring session for user {user_id} with {len(active_redirections)} redirections")
-                    
-                    # Get phone number from redirections
-                    phone_number = None
-                    for redir_data in active_redirections:
-                        if redir_data.get('phone'):
-                            phone_number = redir_data['phone']
-                            break
-                    
-                    if phone_number:
-                        # Try to restore the session
-                        try:
-                            await session_manager._restore_session(int(user_id), phone_number, f"session_{user_id}_{phone_number}.session")
-                            logger.info(f"Session restored for user {user_id} with phone {phone_number}")
-                        except Exception as e:
-                            logger.error(f"Failed to restore session for user {user_id}: {e}")
-                    else:
-                        logger.warning(f"No phone number found for user {user_id} redirections")
+                # Restore every phone the user has active redirections on
+                for phone_number, phone_redirections in routes_by_phone(user_redirections).items():
+                    logger.info(f"Restoring session for user {user_id} on {phone_number} with {len(phone_redirections)} redirections")
+                    try:
+                        await session_manager._restore_session(int(user_id), phone_number, None)
+                        logger.info(f"Session restored for user {user_id} with phone {phone_number}")
+                    except Exception as e:
+                        logger.error(f"Failed to restore session for user {user_id} on {phone_number}: {e}")
                         
         except Exception as e:
             logger.error(f"Error restoring sessions for redirections: {e}")
@@ -88,15 +76,18 @@ class MessageRedirector:
                     destination_id = redir_data.get('destination_id')
                     
                     if source_id and destination_id:
+                        if not client_registry.claim_route(client, name, source_id, destination_id):
+                            continue  # Already attached to this client
+                        
                         # Create handler for new messages
                         @client.on(events.NewMessage(chats=int(source_id)))
                         async def message_handler(event, dest_id=destination_id, redirect_name=name):
-                            await self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=False)
+                            await shutdown_manager.run_forward(self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=False))
                         
                         # Create handler for edited messages
                         @client.on(events.MessageEdited(chats=int(source_id)))
                         async def edit_handler(event, dest_id=destination_id, redirect_name=name):
-                            await self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=True)
+                            await shutdown_manager.run_forward(self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=True))
                         
                         setup_count += 1
                         logger.info(f"✅ Redirection '{name}' configurée: {source_id} -> {destination_id}")
@@ -110,10 +101,11 @@ class MessageRedirector:
     async def _handle_message_redirection(self, event, destination_id, redirect_name, user_id, is_edit=False):
         """Handle individual message redirection"""
         try:
-            # Get the client for forwarding
-            client = active_connections[user_id].get('client')
+            trace = forward_tracer.start(event, redirect_name)
+            # Forward with the account client that received the update
+            client = event.client
             if not client or not client.is_connected():
-                logger.warning(f"Client not available for redirection {redirect_name}")
+                logger.warning("Client not available for redirection %s", redirect_name)
                 return
             
             # Get message content
@@ -121,9 +113,6 @@ class MessageRedirector:
             original_msg_id = message.id
             mapping_key = f"{event.chat_id}_{original_msg_id}_{destination_id}"
             
-            # Get source and destination channel names for logging only
-            source_name = await self._get_channel_name(client, event.chat_id)
-            dest_name = await self._get_channel_name(client, int(destination_id))
             
             if is_edit:
                 # Check if we have a mapping for this message
@@ -132,9 +121,11 @@ class MessageRedirector:
                     try:
                         # Edit the existing message
                         if message.text:
-                            await client.edit_message(int(destination_id), redirected_msg_id, message.text)
-                            action = "edited and updated"
-                            logger.info(f"Message {action} from {event.chat_id} ({source_name}) to {destination_id} ({dest_name}) via {redirect_name}")
+                            with send_duration.time(path="edit"), trace.stage("send"):
+                                await client.edit_message(int(destination_id), redirected_msg_id, message.text)
+                            messages_forwarded.inc(user=user_id, route=redirect_name, kind="edit")
+                            forward_tracer.finish(trace)
+                            await self._log_forwarded(client, user_id, redirect_name, "edit", event.chat_id, destination_id)
                             return
                         elif message.media:
                             # For media edits, we need to delete and resend since Telegram doesn't allow editing media in the same way
@@ -148,51 +139,79 @@ class MessageRedirector:
                             try:
                                 await client.delete_messages(int(destination_id), redirected_msg_id)
                                 del self.message_mapping[mapping_key]
-                                logger.info(f"Message deleted from {event.chat_id} to {destination_id} via {redirect_name}")
+                                logger.info("Message deleted from %s to %s via %s", event.chat_id, destination_id, redirect_name)
                                 return
                             except Exception as delete_error:
-                                logger.warning(f"Failed to delete message {redirected_msg_id}: {delete_error}")
+                                logger.warning("Failed to delete message %s: %s", redirected_msg_id, delete_error)
                                 return
                     except Exception as edit_error:
                         # Check if it's just a "content not modified" error
                         if "Content of the message was not modified" in str(edit_error):
-                            logger.info(f"Message content unchanged for edit in {event.chat_id} to {destination_id} via {redirect_name}")
+                            logger.info("Message content unchanged for edit in %s to %s via %s", event.chat_id, destination_id, redirect_name)
                             return  # Don't send duplicate message
                         else:
-                            logger.warning(f"Failed to edit message {redirected_msg_id}: {edit_error}. Sending new message instead.")
+                            logger.warning("Failed to edit message %s: %s. Sending new message instead.", redirected_msg_id, edit_error)
                             # If edit fails for other reasons, continue to send new message
                 else:
                     # This is an edit but we don't have the original message mapped
-                    logger.info(f"Edit event for unmapped message {original_msg_id} in {event.chat_id}")
+                    logger.info("Edit event for unmapped message %s in %s", original_msg_id, event.chat_id)
                     # Don't send anything for edits of unmapped messages
                     return
             
             # Send new message (either first time or edit/media replacement)
             sent_message = None
             if message.text:
-                sent_message = await client.send_message(int(destination_id), message.text)
+                with send_duration.time(path="send"), trace.stage("send"):
+                    sent_message = await client.send_message(int(destination_id), message.text)
             elif message.media:
                 # Forward media directly
-                sent_message = await client.forward_messages(int(destination_id), message)
+                with send_duration.time(path="forward"), trace.stage("send"):
+                    sent_message = await client.forward_messages(int(destination_id), message)
+            if sent_message:
+                messages_forwarded.inc(user=user_id, route=redirect_name, kind="edit" if is_edit else "new")
             
             # Store the mapping for future edits (only for new messages or successful replacements)
-            if sent_message and not is_edit:
-                if hasattr(sent_message, 'id'):
-                    self.message_mapping[mapping_key] = sent_message.id
-                elif isinstance(sent_message, list) and len(sent_message) > 0:
-                    self.message_mapping[mapping_key] = sent_message[0].id
-            elif sent_message and is_edit:
-                # Update mapping for media replacements
-                if hasattr(sent_message, 'id'):
-                    self.message_mapping[mapping_key] = sent_message.id
-                elif isinstance(sent_message, list) and len(sent_message) > 0:
-                    self.message_mapping[mapping_key] = sent_message[0].id
-            
-            action = "edited and redirected" if is_edit else "redirected"
-            logger.info(f"Message {action} from {event.chat_id} ({source_name}) to {destination_id} ({dest_name}) via {redirect_name}")
+            with trace.stage("mapping"):
+                if sent_message and not is_edit:
+                    if hasattr(sent_message, 'id'):
+                        self.message_mapping[mapping_key] = sent_message.id
+                    elif isinstance(sent_message, list) and len(sent_message) > 0:
+                        self.message_mapping[mapping_key] = sent_message[0].id
+                elif sent_message and is_edit:
+                    # Update mapping for media replacements
+                    if hasattr(sent_message, 'id'):
+                        self.message_mapping[mapping_key] = sent_message.id
+                    elif isinstance(sent_message, list) and len(sent_message) > 0:
+                        self.message_mapping[mapping_key] = sent_message[0].id
+            if sent_message:
+                forward_tracer.finish(trace)
+                await self._log_forwarded(client, user_id, redirect_name, "replace" if is_edit else "new", event.chat_id, destination_id)
             
         except Exception as e:
-            logger.error(f"Error handling message redirection: {e}")
+            if isinstance(e, FloodWaitError):
+                flood_waits.inc(source="forward")
+            handler_errors.inc(handler="redirection")
+            logger.error("Error handling message redirection: %s", e, extra={"fields": {
+                "event": "forward_failed", "user": user_id, "route": redirect_name,
+                "source": event.chat_id, "destination": destination_id, "error": type(e).__name__
+            }})
+    
+    async def _log_forwarded(self, client, user_id, redirect_name, kind, source_id, destination_id):
+        """Sampled success log: channel names are only resolved for the lines actually written"""
+        total = forward_log_sampler.sample(user_id, redirect_name)
+        if total is None:
+            return
+        source_name = await self._get_channel_name(client, source_id)
+        dest_name = await self._get_channel_name(client, int(destination_id))
+        logger.info(
+            "Message %s from %s (%s) to %s (%s) via %s (%s forwarded)",
+            kind, source_id, source_name, destination_id, dest_name, redirect_name, total,
+            extra={"fields": {
+                "event": "forwarded", "user": user_id, "route": redirect_name, "kind": kind,
+                "source": source_id, "source_name": source_name,
+                "destination": destination_id, "destination_name": dest_name, "total": total
+            }}
+        )
     
     async def _get_channel_name(self, client, chat_id):
         """Get the actual channel/chat name with better error handling"""
@@ -214,25 +233,35 @@ class MessageRedirector:
         else:
             return f"Chat {chat_id}"
     
-    async def add_redirection_handler(self, user_id, name, source_id, destination_id):
-        """Add a new redirection handler for a user"""
+    async def add_redirection_handler(self, user_id, name, source_id, destination_id, phone_number=None):
+        """Add a new redirection handler on the client of the given phone"""
         try:
-            if user_id not in active_connections:
-                return False
-                
-            client = active_connections[user_id].get('client')
-            if not client or not client.is_connected():
+            from bot.workers import worker_pool
+            if worker_pool.enabled and phone_number:
+                # The account lives in its shard's worker process
+                return await worker_pool.call(user_id, phone_number, "add_route", name=name,
+                                              source_id=int(source_id), destination_id=int(destination_id))
+            
+            if phone_number:
+                # Wakes the account up if it was dormant: accounts with routes stay hot
+                client = await client_registry.acquire(user_id, phone_number)
+            else:
+                client = client_registry.get_user_client(user_id)
+            if not client:
                 return False
             
+            if not client_registry.claim_route(client, name, source_id, destination_id):
+                return True  # Already attached to this client
+            
             # Create handler for new messages
             @client.on(events.NewMessage(chats=int(source_id)))
             async def message_handler(event, dest_id=destination_id, redirect_name=name):
-                await self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=False)
+                await shutdown_manager.run_forward(self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=False))
             
             # Create handler for edited messages
             @client.on(events.MessageEdited(chats=int(source_id)))
             async def edit_handler(event, dest_id=destination_id, redirect_name=name):
-                await self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=True)
+                await shutdown_manager.run_forward(self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=True))
             
             logger.info(f"Added message and edit handlers for redirection {name}: {source_id} -> {destination_id}")
             return True
@@ -241,9 +270,13 @@ class MessageRedirector:
             logger.error(f"Error adding redirection handler: {e}")
             return False
     
-    async def remove_redirection_handler(self, user_id, name):
+    async def remove_redirection_handler(self, user_id, name, phone_number=None):
         """Remove a redirection handler for a user"""
         try:
+            from bot.workers import worker_pool
+            if worker_pool.enabled and phone_number:
+                return await worker_pool.call(user_id, phone_number, "remove_route", name=name)
+            
             # Note: Telethon doesn't provide direct handler removal
             # In a production system, you would need to track handlers
             # and remove them manually or restart the client
@@ -0,0 +1,213 @@
+"""
+Envoi des messages internes du bot (notifications admin, endpoints HTTP)
+Les messages passent par une file unique et sont envoyés avec le client du bot déjà connecté,
+avec limitation de débit ; l'API HTTP Bot ne sert que de secours quand le client est hors ligne
+"""
+
+import logging
+import asyncio
+import os
+import time
+import aiohttp
+from telethon.errors import FloodWaitError
+from bot.metrics import send_duration, flood_waits
+from bot.http_pool import PooledSession
+
+logger = logging.getLogger(__name__)
+
+# Taille maximale de la file d'envoi
+MESSENGER_QUEUE_SIZE = 1000
+
+# Limites de débit : global (messages/seconde) et intervalle minimal par chat (secondes)
+MESSENGER_RATE = float(os.getenv("MESSENGER_RATE", "20"))
+MESSENGER_CHAT_INTERVAL = 1.0
+
+# Délai maximal d'attente d'un envoi par l'appelant (secondes)
+MESSENGER_SEND_TIMEOUT = 30
+
+# Résultat de send() quand le message est toujours en file après ce délai (il sera envoyé plus tard)
+QUEUED = "queued"
+
+
+class BotMessenger:
+    """File d'envoi des messages du bot, servie par une tâche unique"""
+
+    def __init__(self, rate=MESSENGER_RATE, chat_interval=MESSENGER_CHAT_INTERVAL):
+        self.client = None
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.chat_interval = chat_interval
+        self.queue = None
+        self._task = None
+        self._next_send = 0.0
+        self._last_by_chat = {}
+        self._ready_at = {}  # chat_id -> fin du FLOOD_WAIT du chat (time.monotonic)
+        self.deferred = 0  # messages mis de côté jusqu'à la fin d'un FLOOD_WAIT
+        self.http = PooledSession(limit=2)  # Session HTTP de secours (créée au premier envoi HTTP)
+        self.sent = 0
+        self.fallbacks = 0
+        self.failures = 0
+
+    def attach(self, client):
+        """Associe le client du bot utilisé pour les envois"""
+        self.client = client
+
+    def _ensure_worker(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue(MESSENGER_QUEUE_SIZE)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def send(self, chat_id, text, parse_mode=None, wait=True):
+        """
+        Met un message en file d'envoi.
+        wait=True : attend l'envoi et retourne True s'il a réussi, False s'il a échoué,
+        QUEUED s'il est toujours en file après MESSENGER_SEND_TIMEOUT (ex. FLOOD_WAIT du chat).
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((normalize_chat_id(chat_id), text, parse_mode, future))
+        except asyncio.QueueFull:
+            logger.error("Messenger queue full, message to %s dropped", chat_id)
+            self.failures += 1
+            return False
+
+        if not wait:
+            return True
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), MESSENGER_SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Message to %s still queued after %ss", chat_id, MESSENGER_SEND_TIMEOUT)
+            return QUEUED
+
+    async def _run(self):
+        """
+        Tâche d'envoi : un message à la fois, dans l'ordre de la file.
+        Un chat en FLOOD_WAIT ne bloque pas les autres : ses messages sont remis en file à la fin de l'attente.
+        """
+        while True:
+            item = await self.queue.get()
+            chat_id, text, parse_mode, future = item
+            try:
+                delay = self._ready_at.get(chat_id, 0.0) - time.monotonic()
+                if delay > 0:
+                    self._defer(item, delay)
+                    continue
+                self._ready_at.pop(chat_id, None)
+                await self._throttle(chat_id)
+                ok = await self._deliver(chat_id, text, parse_mode)
+            except FloodWaitError as e:
+                flood_waits.inc(source="messenger")
+                logger.warning("Flood wait of %ss for %s, message requeued", e.seconds, chat_id)
+                self._ready_at[chat_id] = time.monotonic() + e.seconds
+                self._defer(item, e.seconds)
+                continue
+            except Exception as e:
+                logger.error("Error sending message to %s: %s", chat_id, e)
+                ok = False
+            finally:
+                self.queue.task_done()
+            if ok:
+                self.sent += 1
+            else:
+                self.failures += 1
+            if not future.done():
+                future.set_result(ok)
+
+    def _defer(self, item, delay):
+        """Remet un message en file après `delay` secondes"""
+        self.deferred += 1
+        asyncio.get_running_loop().call_later(delay, self._requeue, item)
+
+    def _requeue(self, item):
+        self.deferred -= 1
+        future = item[3]
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            logger.error("Messenger queue full, deferred message to %s dropped", item[0])
+            self.failures += 1
+            if not future.done():
+                future.set_result(False)
+
+    async def _throttle(self, chat_id):
+        """Respecte le débit global et l'intervalle minimal par chat"""
+        now = time.monotonic()
+        ready_at = max(self._next_send, self._last_by_chat.get(chat_id, 0.0) + self.chat_interval)
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+            now = time.monotonic()
+        self._next_send = now + self.interval
+        self._last_by_chat[chat_id] = now
+
+    async def _deliver(self, chat_id, text, parse_mode):
+        """Envoie via le client du bot, ou via l'API HTTP s'il est déconnecté"""
+        if self.client is not None and self.client.is_connected():
+            try:
+                with send_duration.time(path="messenger"):
+                    await self.client.send_message(chat_id, text, parse_mode=parse_mode)
+                return True
+            except FloodWaitError:
+                # Remis en file par _run() avec le délai du chat
+                raise
+            except Exception as e:
+                if self.client.is_connected():
+                    raise
+                logger.warning("Bot client dropped while sending to %s: %s", chat_id, e)
+
+        self.fallbacks += 1
+        return await self._send_http(chat_id, text, parse_mode)
+
+    async def _send_http(self, chat_id, text, parse_mode):
+        """Secours : API HTTP Bot (client du bot indisponible)"""
+        bot_token = os.getenv("BOT_TOKEN")
+        if not bot_token:
+            logger.error("Bot client offline and BOT_TOKEN missing, message not sent")
+            return False
+
+        data = {"chat_id": chat_id, "text": text}
+        if parse_mode:
+            data["parse_mode"] = "HTML" if parse_mode == "html" else "Markdown"
+        session = self.http.get()
+        with send_duration.time(path="bot_api"):
+            async with session.post(
+                f"https://api.telegram.org/bot{bot_token}/sendMessage",
+                json=data,
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                if response.status != 200:
+                    logger.error("Bot API fallback failed for %s: %s", chat_id, response.status)
+                return response.status == 200
+
+    async def close(self, drain_timeout=5):
+        """Envoie les messages restants (délai limité) puis arrête la tâche d'envoi"""
+        if self.queue is not None and self._task is not None and not self._task.done():
+            try:
+                await asyncio.wait_for(self.queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("%s message(s) not sent before shutdown", self.queue.qsize())
+        if self.deferred:
+            logger.warning("%s message(s) in flood wait not sent before shutdown", self.deferred)
+        if self._task is not None:
+            self._task.cancel()
+        await self.http.close()
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "deferred": self.deferred,
+            "sent": self.sent,
+            "fallbacks": self.fallbacks,
+            "failures": self.failures,
+        }
+
+
+def normalize_chat_id(chat_id):
+    """Les identifiants reçus en texte (corps JSON) deviennent des entiers"""
+    if isinstance(chat_id, str) and chat_id.lstrip('-').isdigit():
+        return int(chat_id)
+    return chat_id
+
+
+# Instance globale
+bot_messenger = BotMessenger()
@@ -0,0 +1,247 @@
+"""
+Métriques du bot (compteurs, jauges, histogrammes) au format texte Prometheus
+Les mises à jour ont lieu surtout dans la boucle asyncio, mais aussi depuis des threads
+(ex. écriture des instantanés de chats via asyncio.to_thread) : chaque métrique a son verrou.
+En mode multi-processus, chaque worker a son registre ; /metrics les agrège avec un label worker.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes de latence (secondes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metric:
+    """Métrique à labels : une valeur par combinaison de labels"""
+
+    type = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return dict(zip(self.labelnames, key))
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [[self.name, self._labels(key), value] for key, value in values]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """
+        Valeur calculée à la lecture (état déjà tenu ailleurs, ex. taille d'une file).
+        Pour une jauge à labels, la fonction retourne {tuple des valeurs de labels: valeur}.
+        """
+        self._function = function
+        return self
+
+    def samples(self):
+        if self._function is not None:
+            try:
+                value = self._function()
+                if isinstance(value, dict):
+                    return [[self.name, self._labels(key), item] for key, item in value.items()]
+                return [[self.name, {}, value]]
+            except Exception as e:
+                logger.error(f"Error collecting metric {self.name}: {e}")
+                return []
+        return super().samples()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [comptes par intervalle (dernier : +Inf), somme, nombre]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bucket] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mesure la durée du bloc (utilisable autour d'un await)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, (counts, total, count) in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append([f"{self.name}_bucket", {**labels, "le": format_value(bound)}, cumulative])
+            samples.append([f"{self.name}_sum", labels, total])
+            samples.append([f"{self.name}_count", labels, count])
+        return samples
+
+
+class MetricsRegistry:
+    """Registre des métriques du processus"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, cls, name, help, labelnames, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def collect(self):
+        """Familles de métriques sérialisables (transmises par les workers)"""
+        return [
+            {"name": metric.name, "type": metric.type, "help": metric.help, "samples": metric.samples()}
+            for metric in self.metrics.values()
+        ]
+
+
+def merge_families(families, other, **labels):
+    """Ajoute les échantillons d'un autre registre (ex. un worker) en leur ajoutant des labels"""
+    by_name = {family["name"]: family for family in families}
+    for family in other:
+        target = by_name.get(family["name"])
+        if target is None:
+            target = by_name[family["name"]] = {**family, "samples": []}
+            families.append(target)
+        for sample_name, sample_labels, value in family["samples"]:
+            target["samples"].append([sample_name, {**sample_labels, **labels}, value])
+    return families
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(families):
+    """Format d'exposition texte Prometheus (version 0.0.4)"""
+    lines = []
+    for family in families:
+        lines.append(f"# HELP {family['name']} {family['help']}")
+        lines.append(f"# TYPE {family['name']} {family['type']}")
+        for sample_name, labels, value in family["samples"]:
+            if labels:
+                label_text = ",".join(f'{name}="{_escape(label)}"' for name, label in labels.items())
+                lines.append(f"{sample_name}{{{label_text}}} {format_value(value)}")
+            else:
+                lines.append(f"{sample_name} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Instance globale
+registry = MetricsRegistry()
+
+# Transferts de messages
+messages_forwarded = registry.counter(
+    "telefeed_messages_forwarded_total", "Messages transférés par redirection", ("user", "route", "kind"))
+send_duration = registry.histogram(
+    "telefeed_send_duration_seconds", "Durée des envois vers Telegram", ("path",))
+flood_waits = registry.counter(
+    "telefeed_flood_waits_total", "Attentes FloodWait imposées par Telegram", ("source",))
+handler_errors = registry.counter(
+    "telefeed_handler_errors_total", "Erreurs dans les gestionnaires", ("handler",))
+
+# Stockage et caches
+db_duration = registry.histogram(
+    "telefeed_db_duration_seconds", "Durée des opérations de stockage", ("op",))
+cache_requests = registry.counter(
+    "telefeed_cache_requests_total", "Accès aux caches (hit / miss)", ("cache", "result"))
+
+# Serveur HTTP
+http_requests = registry.counter(
+    "telefeed_http_requests_total", "Requêtes HTTP reçues", ("path",))
+
+
+def _messenger_queue_depth():
+    from bot.messenger import bot_messenger
+    return bot_messenger.stats()["queued"]
+
+
+def _forwards_in_flight():
+    from bot.shutdown import shutdown_manager
+    return shutdown_manager.inflight
+
+
+def _connected_clients():
+    from bot.client_registry import client_registry
+    return sum(1 for _, entry in client_registry.items() if entry['client'].is_connected())
+
+
+registry.gauge("telefeed_messenger_queue_depth", "Messages en attente d'envoi").set_function(_messenger_queue_depth)
+registry.gauge("telefeed_forwards_in_flight", "Transferts en cours").set_function(_forwards_in_flight)
+registry.gauge("telefeed_connected_clients", "Comptes utilisateurs connectés").set_function(_connected_clients)
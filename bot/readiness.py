@@ -0,0 +1,110 @@
+"""
+Disponibilité des comptes pendant la restauration au démarrage
+Chaque compte passe de "pending" à "connecting" puis "live" (redirections attachées) ou "failed".
+Les routes d'un compte transfèrent dès qu'il est "live", sans attendre les autres comptes ;
+/health expose l'avancement (disponibilité partielle).
+"""
+
+import logging
+import time
+from bot.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_STATES = ("pending", "connecting", "live", "failed")
+
+
+class AccountReadiness:
+    """État de restauration de chaque compte (utilisateur, numéro) du processus"""
+
+    def __init__(self):
+        self.accounts = {}  # "user_id:phone" -> {"state", "routes", "updated_at"}
+        self.started_at = None
+        self.finished_at = None
+        self.first_live_at = None
+
+    def begin(self):
+        """Début d'une restauration (réinitialise l'avancement)"""
+        self.accounts.clear()
+        self.started_at = time.time()
+        self.finished_at = None
+        self.first_live_at = None
+
+    def expect(self, user_id, phone_number, routes):
+        """Déclare un compte à restaurer et son nombre de redirections"""
+        self.accounts[f"{user_id}:{phone_number}"] = {
+            "state": "pending",
+            "routes": routes,
+            "updated_at": time.time()
+        }
+
+    def mark(self, user_id, phone_number, state):
+        """Change l'état d'un compte ; le premier compte "live" est journalisé (délai avant transfert)"""
+        account = self.accounts.setdefault(f"{user_id}:{phone_number}", {"routes": 0})
+        account["state"] = state
+        account["updated_at"] = time.time()
+        if state == "live" and self.first_live_at is None and self.started_at is not None:
+            self.first_live_at = account["updated_at"]
+            logger.info("⚡ Premier compte actif %.1fs après le début de la restauration",
+                        self.first_live_at - self.started_at)
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    @property
+    def complete(self):
+        return self.started_at is not None and self.finished_at is not None
+
+    def counts(self):
+        """Nombre de comptes par état, pour la jauge Prometheus"""
+        counts = {(state,): 0 for state in ACCOUNT_STATES}
+        for account in self.accounts.values():
+            counts[(account["state"],)] += 1
+        return counts
+
+    def summary(self):
+        """Avancement sérialisable en JSON (fusionnable entre workers avec merge_summaries)"""
+        summary = {state: count for (state,), count in self.counts().items()}
+        summary.update({
+            "accounts": len(self.accounts),
+            "routes_total": sum(account["routes"] for account in self.accounts.values()),
+            "routes_live": sum(
+                account["routes"] for account in self.accounts.values() if account["state"] == "live"
+            ),
+            "complete": self.complete,
+            "elapsed_seconds": (
+                (self.finished_at or time.time()) - self.started_at if self.started_at is not None else None
+            ),
+            "first_live_seconds": (
+                self.first_live_at - self.started_at if self.first_live_at is not None else None
+            ),
+        })
+        return summary
+
+
+def merge_summaries(summaries):
+    """Avancement global de plusieurs processus (un par worker)"""
+    merged = {key: 0 for key in (*ACCOUNT_STATES, "accounts", "routes_total", "routes_live")}
+    merged["complete"] = bool(summaries)
+    elapsed = []
+    first_live = []
+    for summary in summaries:
+        for key in merged:
+            if key != "complete":
+                merged[key] += summary.get(key, 0)
+        merged["complete"] = merged["complete"] and summary.get("complete", False)
+        if summary.get("elapsed_seconds") is not None:
+            elapsed.append(summary["elapsed_seconds"])
+        if summary.get("first_live_seconds") is not None:
+            first_live.append(summary["first_live_seconds"])
+    merged["elapsed_seconds"] = max(elapsed) if elapsed else None
+    merged["first_live_seconds"] = min(first_live) if first_live else None
+    return merged
+
+
+# Instance globale
+account_readiness = AccountReadiness()
+
+registry.gauge(
+    "telefeed_restore_accounts", "Comptes par état de restauration", ("state",)
+).set_function(account_readiness.counts)
@@ -104,6 +104,8 @@ async def remove_redirection(event, client, name, phone_number):
         
         # Remove redirection
         await store_redirection(user_id, name, phone_number, "remove")
+        from bot.message_handler import message_redirector
+        await message_redirector.remove_redirection_handler(user_id, name, phone_number)
         
         success_message = f"""
 ✅ **Redirection supprimée**
@@ -257,19 +259,17 @@ async def get_channel_name(client, phone_number, fallback_name):
 
 async def store_pending_redirection(user_id, name, phone_number):
     """Store pending redirection waiting for channel IDs"""
-    from bot.database import store_pending_redirection as db_store_pending
-    await db_store_pending(user_id, name, phone_number)
+    from bot.conversation import conversation_manager, AWAITING_REDIRECTION_IDS
+    conversation_manager.set(user_id, AWAITING_REDIRECTION_IDS, {"name": name, "phone_number": phone_number})
+    logger.info(f"Pending redirection stored for user {user_id}: {name} on {phone_number}")
 
 async def handle_redirection_format(event, client, source_id, destination_id):
     """Handle redirection format input (ID - ID)"""
     try:
         user_id = event.sender_id
         
-        # Check if user has premium access
-        if not await is_premium_user(user_id):
-            await event.respond("❌ **Accès premium requis**\n\nCette fonctionnalité est réservée aux utilisateurs premium.")
-            return
-        
+        # Premium access was already checked by /redirection add|change,
+        # which is the only way to create a pending redirection
         # Get pending redirection
         pending = await get_pending_redirection(user_id)
         
@@ -291,7 +291,7 @@ async def handle_redirection_format(event, client, source_id, destination_id):
         
         # Set up message redirection handler
         from bot.message_handler import message_redirector
-        handler_added = await message_redirector.add_redirection_handler(user_id, name, source_id, destination_id)
+        handler_added = await message_redirector.add_redirection_handler(user_id, name, source_id, destination_id, phone_number)
         
         success_message = f"""
 ✅ **Redirection configurée avec succès**
@@ -316,10 +316,11 @@ La redirection est maintenant active !
 
 async def get_pending_redirection(user_id):
     """Get pending redirection for user"""
-    from bot.database import get_pending_redirection as db_get_pending
-    return await db_get_pending(user_id)
+    from bot.conversation import conversation_manager, AWAITING_REDIRECTION_IDS
+    state = conversation_manager.get(user_id, AWAITING_REDIRECTION_IDS)
+    return state["data"] if state else None
 
 async def clear_pending_redirection(user_id):
     """Clear pending redirection for user"""
-    from bot.database import clear_pending_redirection as db_clear_pending
-    await db_clear_pending(user_id)
\ No newline at end of file
+    from bot.conversation import conversation_manager, AWAITING_REDIRECTION_IDS
+    conversation_manager.clear(user_id, AWAITING_REDIRECTION_IDS)
\ No newline at end of file
@@ -5,11 +5,8 @@ Ce module assure que toutes les redirections actives sont restaurées au démarr
 
 import logging
 import asyncio
-import os
-from telethon import TelegramClient
 from bot.database import load_data
-from bot.connection import active_connections, store_connection_client
-from config.settings import API_ID, API_HASH
+from bot.client_registry import client_registry, routes_by_phone
 
 logger = logging.getLogger(__name__)
 
@@ -43,41 +40,25 @@ class RedirectionRestorer:
             logger.error(f"Erreur lors de la restauration des redirections: {e}")
     
     async def _restore_user_redirections(self, user_id, user_redirections):
-        """Restaure les redirections pour un utilisateur"""
+        """Restaure les redirections pour un utilisateur, sur chacun de ses numéros"""
         try:
-            # Obtenir les redirections actives
-            active_redirections = {
-                name: data for name, data in user_redirections.items() 
-                if data.get('active', True) and data.get('source_id') and data.get('destination_id')
-            }
+            # Redirections actives regroupées par numéro connecté
+            redirections_by_phone = routes_by_phone(user_redirections)
             
-            if not active_redirections:
-                return
-            
-            logger.info(f"Restauration de {len(active_redirections)} redirections pour utilisateur {user_id}")
-            
-            # Obtenir le numéro de téléphone
-            phone_number = None
-            for redir_data in active_redirections.values():
-                if redir_data.get('phone'):
-                    phone_number = redir_data['phone']
-                    break
-            
-            if not phone_number:
-                logger.warning(f"Aucun numéro de téléphone trouvé pour l'utilisateur {user_id}")
-                return
-            
-            # Restaurer la session Telegram
-            client = await self._restore_telegram_session(user_id, phone_number)
-            
-            if client:
-                # Configurer les redirections
-                await self._setup_redirections(client, user_id, active_redirections)
-                logger.info(f"✅ {len(active_redirections)} redirections restaurées pour utilisateur {user_id}")
-                self.restored_count += len(active_redirections)
-            else:
-                logger.warning(f"❌ Impossible de restaurer la session pour utilisateur {user_id}")
-                self.failed_count += len(active_redirections)
+            for phone_number, active_redirections in redirections_by_phone.items():
+                logger.info(f"Restauration de {len(active_redirections)} redirections pour {user_id}:{phone_number}")
+                
+                # Restaurer la session Telegram de ce numéro
+                client = await self._restore_telegram_session(user_id, phone_number)
+                
+                if client:
+                    # Configurer les redirections
+                    await self._setup_redirections(client, user_id, phone_number, active_redirections)
+                    logger.info(f"✅ {len(active_redirections)} redirections restaurées pour {user_id}:{phone_number}")
+                    self.restored_count += len(active_redirections)
+                else:
+                    logger.warning(f"❌ Impossible de restaurer la session pour {user_id}:{phone_number}")
+                    self.failed_count += len(active_redirections)
                 
         except Exception as e:
             logger.error(f"Erreur lors de la restauration pour utilisateur {user_id}: {e}")
@@ -86,54 +67,21 @@ class RedirectionRestorer:
     async def _restore_telegram_session(self, user_id, phone_number):
         """Restaure une session Telegram"""
         try:
-            # Vérifier si la session existe déjà
-            if user_id in active_connections:
-                client = active_connections[user_id].get('client')
-                if client and client.is_connected():
-                    logger.info(f"Session déjà active pour utilisateur {user_id}")
-                    return client
-            
-            # Chercher le fichier de session
-            session_file = f"session_{user_id}_{phone_number}.session"
-            if not os.path.exists(session_file):
-                # Chercher d'autres formats de session
-                possible_sessions = [
-                    f"session_{user_id}_{phone_number}.session",
-                    f"{user_id}_{phone_number}.session",
-                    f"session_{phone_number}.session",
-                    f"{phone_number}.session"
-                ]
-                
-                session_file = None
-                for session_name in possible_sessions:
-                    if os.path.exists(session_name):
-                        session_file = session_name
-                        break
-                
-                if not session_file:
-                    logger.warning(f"Aucun fichier de session trouvé pour {user_id}:{phone_number}")
-                    return None
-            
-            # Créer le client Telegram
-            client = TelegramClient(session_file, API_ID, API_HASH)
+            # Réutiliser ou ouvrir l'unique client du compte
+            client = await client_registry.acquire(user_id, phone_number)
             
-            # Démarrer la session
-            await client.start(phone=phone_number)
-            
-            if client.is_connected():
-                # Stocker la connexion
-                await store_connection_client(user_id, phone_number, client)
+            if client:
                 logger.info(f"Session restaurée avec succès pour {user_id}:{phone_number}")
                 return client
             else:
-                logger.error(f"Impossible de se connecter pour {user_id}:{phone_number}")
+                logger.warning(f"Aucune session utilisable pour {user_id}:{phone_number}")
                 return None
                 
         except Exception as e:
             logger.error(f"Erreur lors de la restauration de session {user_id}:{phone_number}: {e}")
             return None
     
-    async def _setup_redirections(self, client, user_id, redirections):
+    async def _setup_redirections(self, client, user_id, phone_number, redirections):
         """Configure les redirections pour un client"""
         try:
             from bot.message_handler import message_redirector
@@ -144,7 +92,7 @@ class RedirectionRestorer:
                 
                 # Ajouter le gestionnaire de redirection
                 await message_redirector.add_redirection_handler(
-                    user_id, name, source_id, destination_id
+                    user_id, name, source_id, destination_id, phone_number
                 )
                 
                 logger.info(f"Redirection configurée: {name} ({source_id} -> {destination_id})")
@@ -0,0 +1,112 @@
+"""
+Planificateur de restauration à concurrence bornée
+Restaure les sessions et redirections en parallèle au démarrage
+"""
+
+import logging
+import asyncio
+import os
+import random
+import time
+from telethon.errors import FloodWaitError
+from bot.metrics import flood_waits
+
+logger = logging.getLogger(__name__)
+
+# Nombre de comptes restaurés simultanément
+RESTORE_CONCURRENCY = int(os.getenv("RESTORE_CONCURRENCY", "10"))
+
+# Intervalle minimal entre deux connexions vers le même DC (secondes)
+DC_STAGGER_DELAY = float(os.getenv("RESTORE_DC_STAGGER", "0.2"))
+
+# FLOOD_WAIT plus long que ce seuil : abandon du compte (réessayé au prochain démarrage)
+MAX_FLOOD_WAIT = int(os.getenv("RESTORE_MAX_FLOOD_WAIT", "120"))
+MAX_FLOOD_RETRIES = 3
+
+# Délai maximal d'une tentative de connexion (secondes)
+CONNECT_TIMEOUT = 30
+
+
+class RestoreScheduler:
+    """Exécute des restaurations en parallèle avec étalement par DC et reprise FLOOD_WAIT"""
+
+    def __init__(self, concurrency=RESTORE_CONCURRENCY, dc_stagger=DC_STAGGER_DELAY):
+        self.concurrency = max(1, concurrency)
+        self.dc_stagger = dc_stagger
+        self._dc_locks = {}
+        self._dc_last_start = {}
+        self.progress = {}  # label -> {"total", "done", "failed", "started_at", "finished_at"}
+
+    async def run(self, items, worker, label):
+        """
+        Exécute worker(item) pour chaque élément, au plus `concurrency` à la fois.
+        Un worker qui retourne False ou lève une exception compte comme un échec.
+        """
+        items = list(items)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        progress = {
+            "total": len(items),
+            "done": 0,
+            "failed": 0,
+            "started_at": time.time(),
+            "finished_at": None
+        }
+        self.progress[label] = progress
+        report_every = max(1, len(items) // 10)
+
+        async def run_one(item):
+            async with semaphore:
+                try:
+                    ok = await worker(item)
+                except Exception as e:
+                    logger.error(f"Erreur restauration {label}: {e}")
+                    ok = False
+            progress["done"] += 1
+            if ok is False:
+                progress["failed"] += 1
+            if progress["done"] % report_every == 0 or progress["done"] == progress["total"]:
+                logger.info(
+                    f"🔄 Restauration {label}: {progress['done']}/{progress['total']} "
+                    f"({progress['failed']} échec(s))"
+                )
+            return ok
+
+        results = await asyncio.gather(*(run_one(item) for item in items))
+        progress["finished_at"] = time.time()
+        logger.info(
+            f"✅ Restauration {label} terminée en {progress['finished_at'] - progress['started_at']:.1f}s "
+            f"({progress['total'] - progress['failed']}/{progress['total']} réussie(s))"
+        )
+        return results
+
+    async def stagger(self, dc_id):
+        """Espace les connexions vers un même DC pour éviter les rafales"""
+        lock = self._dc_locks.setdefault(dc_id, asyncio.Lock())
+        async with lock:
+            wait = self._dc_last_start.get(dc_id, 0) + self.dc_stagger - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._dc_last_start[dc_id] = time.time()
+
+    async def call_with_flood_retry(self, coro_factory, label):
+        """Appelle coro_factory() en respectant les FLOOD_WAIT de Telegram"""
+        for attempt in range(MAX_FLOOD_RETRIES + 1):
+            try:
+                return await coro_factory()
+            except FloodWaitError as e:
+                flood_waits.inc(source="restore")
+                if e.seconds > MAX_FLOOD_WAIT or attempt == MAX_FLOOD_RETRIES:
+                    logger.warning(f"FLOOD_WAIT de {e.seconds}s pour {label}, abandon")
+                    raise
+                delay = e.seconds + random.uniform(0, 1)
+                logger.warning(f"FLOOD_WAIT de {e.seconds}s pour {label}, nouvelle tentative dans {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def connect(self, client, label, timeout=CONNECT_TIMEOUT):
+        """Connecte un client en étalant par DC et en gérant les FLOOD_WAIT"""
+        await self.stagger(getattr(client.session, 'dc_id', None))
+        await self.call_with_flood_retry(lambda: asyncio.wait_for(client.connect(), timeout), label)
+
+
+# Instance globale
+restore_scheduler = RestoreScheduler()
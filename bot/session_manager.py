@@ -1,26 +1,49 @@
 import logging
 import os
 import asyncio
-from telethon import TelegramClient
+import time
 from bot.database import load_data, save_data
-import psycopg2
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# After a failed connection, wait this long before trying again (seconds)
+DB_RETRY_DELAY = int(os.getenv("SESSION_DB_RETRY_DELAY", "300"))
+
+# An unreachable database fails after this delay instead of hanging (seconds)
+DB_CONNECT_TIMEOUT = int(os.getenv("SESSION_DB_CONNECT_TIMEOUT", "5"))
+
 class SessionManager:
     """Manages persistent Telegram sessions"""
     
     def __init__(self):
         self.sessions = {}  # In-memory active sessions
-        self.db_connection = None
-        self._init_database()
+        self._db_connection = None
+        self._db_retry_at = 0  # no new connection attempt before this time (after a failure)
+        self._connect_lock = asyncio.Lock()
+    
+    async def _get_connection(self):
+        """
+        Database connection, opened on first use rather than at import.
+        psycopg2.connect blocks, so it runs in a thread (bounded by DB_CONNECT_TIMEOUT);
+        None while the database is unreachable, a failed attempt being retried after DB_RETRY_DELAY
+        """
+        if self._db_connection is None and time.time() >= self._db_retry_at:
+            async with self._connect_lock:
+                if self._db_connection is None and time.time() >= self._db_retry_at:
+                    await asyncio.to_thread(self._init_database)
+        return self._db_connection
+    
+    async def connect(self):
+        """Open the database connection now (bot startup) instead of on the first query"""
+        return await self._get_connection() is not None
     
     def _init_database(self):
-        """Initialize database connection and tables"""
+        """Initialize database connection and tables (blocking: run through asyncio.to_thread)"""
         try:
-            self.db_connection = psycopg2.connect(os.getenv("DATABASE_URL"))
-            cursor = self.db_connection.cursor()
+            import psycopg2
+            self._db_connection = psycopg2.connect(os.getenv("DATABASE_URL"), connect_timeout=DB_CONNECT_TIMEOUT)
+            cursor = self._db_connection.cursor()
             
             # Create sessions table if not exists
             cursor.execute("""
@@ -36,17 +59,23 @@ class SessionManager:
                 )
             """)
             
-            self.db_connection.commit()
+            self._db_connection.commit()
             cursor.close()
             logger.info("Session database initialized successfully")
             
         except Exception as e:
-            logger.error(f"Error initializing session database: {e}")
+            logger.error(f"Error initializing session database (next attempt in {DB_RETRY_DELAY}s): {e}")
+            if self._db_connection is None:
+                self._db_retry_at = time.time() + DB_RETRY_DELAY
     
     async def store_session(self, user_id, phone_number, session_name):
         """Store session information in database"""
+        connection = await self._get_connection()
+        if connection is None:
+            return
+        
         try:
-            cursor = self.db_connection.cursor()
+            cursor = connection.cursor()
             
             # Insert or update session
             cursor.execute("""
@@ -59,7 +88,7 @@ class SessionManager:
                     last_used = EXCLUDED.last_used
             """, (user_id, phone_number, session_name, True, datetime.now()))
             
-            self.db_connection.commit()
+            connection.commit()
             cursor.close()
             logger.info(f"Session stored for user {user_id}, phone {phone_number}")
             
@@ -68,8 +97,12 @@ class SessionManager:
     
     async def get_user_sessions(self, user_id):
         """Get all active sessions for a user"""
+        connection = await self._get_connection()
+        if connection is None:
+            return []
+        
         try:
-            cursor = self.db_connection.cursor()
+            cursor = connection.cursor()
             cursor.execute("""
                 SELECT phone_number, session_file, last_used 
                 FROM telegram_sessions 
@@ -87,8 +120,12 @@ class SessionManager:
     
     async def restore_all_sessions(self):
         """Restore all active sessions on bot startup"""
+        connection = await self._get_connection()
+        if connection is None:
+            return
+        
         try:
-            cursor = self.db_connection.cursor()
+            cursor = connection.cursor()
             cursor.execute("""
                 SELECT user_id, phone_number, session_file 
                 FROM telegram_sessions 
@@ -98,72 +135,76 @@ class SessionManager:
             sessions = cursor.fetchall()
             cursor.close()
             
-            for user_id, phone_number, session_file in sessions:
-                await self._restore_session(user_id, phone_number, session_file)
+            # Only accounts with active redirections are connected now; the others
+            # stay dormant until a command needs them (client_registry.acquire)
+            from bot.client_registry import routes_by_phone, normalize_phone
+            routed = {
+                (int(user_id), phone)
+                for user_id, user_redirections in load_data().get("redirections", {}).items()
+                for phone in routes_by_phone(user_redirections)
+            }
+            dormant = [row for row in sessions if (int(row[0]), normalize_phone(row[1])) not in routed]
+            sessions = [row for row in sessions if (int(row[0]), normalize_phone(row[1])) in routed]
+            if dormant:
+                logger.info(f"{len(dormant)} session(s) without active redirection left dormant")
+            
+            from bot.restore_scheduler import restore_scheduler
+            results = await restore_scheduler.run(
+                sessions,
+                lambda row: self._restore_session(*row),
+                "sessions"
+            )
                 
-            logger.info(f"Restored {len(sessions)} active sessions")
+            logger.info(f"Restored {sum(1 for ok in results if ok)}/{len(sessions)} routed sessions")
             
         except Exception as e:
             logger.error(f"Error restoring sessions: {e}")
     
     async def _restore_session(self, user_id, phone_number, session_file):
-        """Restore a single session"""
+        """
+        Restore a single session.
+        The session is only deactivated when it is missing or no longer authorized:
+        timeouts and transient errors (FLOOD_WAIT, network) leave it active for the next attempt
+        """
+        from bot.client_registry import client_registry, SESSION_MISSING, SESSION_UNAUTHORIZED
         try:
-            # Check if session file exists
-            if not os.path.exists(session_file):
-                logger.warning(f"Session file not found: {session_file}")
-                await self.deactivate_session(user_id, phone_number)
-                return False
-            
-            # Create Telegram client with existing session
-            client = TelegramClient(
-                session_file.replace('.session', ''),  # Telethon expects name without .session
-                int(os.getenv("API_ID")),
-                os.getenv("API_HASH")
-            )
-            
-            # Try to connect
-            await client.connect()
-            
-            if await client.is_user_authorized():
-                # Store in active sessions
-                from bot.connection import active_connections
-                active_connections[user_id] = {
-                    'client': client,
-                    'phone': phone_number,
-                    'connected': True,
-                    'session_name': session_file,
-                    'restored': True
-                }
-                
-                # Update last used time
-                await self.update_session_activity(user_id, phone_number)
-                
-                logger.info(f"Session restored for user {user_id}, phone {phone_number}")
-                return True
-            else:
-                # Session expired, deactivate
-                await client.disconnect()
-                await self.deactivate_session(user_id, phone_number)
-                logger.warning(f"Session expired for user {user_id}, phone {phone_number}")
-                return False
-                
+            # Reuse or open the account's single client (staggered per DC, FLOOD_WAIT-aware)
+            client = await client_registry.acquire(user_id, phone_number, session_file)
         except Exception as e:
-            logger.error(f"Error restoring session for user {user_id}: {e}")
-            await self.deactivate_session(user_id, phone_number)
+            logger.error(f"Error restoring session for user {user_id}, phone {phone_number} (will retry): {e}")
             return False
+        
+        if client:
+            # Update last used time
+            await self.update_session_activity(user_id, phone_number)
+            
+            logger.info(f"Session restored for user {user_id}, phone {phone_number}")
+            return True
+        
+        reason = client_registry.failure_reason(user_id, phone_number)
+        if reason in (SESSION_MISSING, SESSION_UNAUTHORIZED):
+            # Session file missing or expired, deactivate
+            await self.deactivate_session(user_id, phone_number)
+            logger.warning(f"Session expired for user {user_id}, phone {phone_number} ({reason})")
+        else:
+            logger.warning(f"Session unreachable for user {user_id}, phone {phone_number}, kept active")
+        return False
     
     async def update_session_activity(self, user_id, phone_number):
         """Update last used timestamp for a session"""
+        connection = await self._get_connection()
+        if connection is None:
+            return
+        
         try:
-            cursor = self.db_connection.cursor()
+            cursor = connection.cursor()
             cursor.execute("""
                 UPDATE telegram_sessions 
                 SET last_used = %s 
                 WHERE user_id = %s AND phone_number = %s
             """, (datetime.now(), user_id, phone_number))
             
-            self.db_connection.commit()
+            connection.commit()
             cursor.close()
             
         except Exception as e:
@@ -172,23 +213,21 @@ class SessionManager:
     async def deactivate_session(self, user_id, phone_number):
         """Deactivate a session in database"""
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                UPDATE telegram_sessions 
-                SET is_active = FALSE 
-                WHERE user_id = %s AND phone_number = %s
-            """, (user_id, phone_number))
-            
-            self.db_connection.commit()
-            cursor.close()
+            connection = await self._get_connection()
+            if connection is not None:
+                cursor = connection.cursor()
+                cursor.execute("""
+                    UPDATE telegram_sessions 
+                    SET is_active = FALSE 
+                    WHERE user_id = %s AND phone_number = %s
+                """, (user_id, phone_number))
+                
+                connection.commit()
+                cursor.close()
             
-            # Remove from active connections if present
-            from bot.connection import active_connections
-            if user_id in active_connections:
-                client = active_connections[user_id].get('client')
-                if client:
-                    await client.disconnect()
-                del active_connections[user_id]
+            # Disconnect and forget the account's client if present
+            from bot.client_registry import client_registry
+            await client_registry.disconnect(user_id, phone_number)
             
             logger.info(f"Session deactivated for user {user_id}, phone {phone_number}")
             
@@ -197,8 +236,12 @@ class SessionManager:
     
     async def cleanup_expired_sessions(self):
         """Clean up expired sessions (older than 7 days)"""
+        connection = await self._get_connection()
+        if connection is None:
+            return
+        
         try:
-            cursor = self.db_connection.cursor()
+            cursor = connection.cursor()
             cursor.execute("""
                 UPDATE telegram_sessions 
                 SET is_active = FALSE 
@@ -207,7 +250,7 @@ class SessionManager:
             """)
             
             affected_rows = cursor.rowcount
-            self.db_connection.commit()
+            connection.commit()
             cursor.close()
             
             if affected_rows > 0:
@@ -218,8 +261,9 @@ class SessionManager:
     
     def close(self):
         """Close database connection"""
-        if self.db_connection:
-            self.db_connection.close()
+        if self._db_connection:
+            self._db_connection.close()
+            self._db_connection = None
 
 # Global session manager instance
 session_manager = SessionManager()
\ No newline at end of file
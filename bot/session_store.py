@@ -0,0 +1,274 @@
+"""
+Stockage des sessions Telethon des comptes utilisateurs
+Une session par compte, à clé déterministe, sans fichier SQLite : clé d'autorisation,
+cache d'entités et états de mise à jour sont gardés en mémoire et écrits en JSON
+uniquement lorsqu'ils ont changé (Telethon appelle save() après connexion puis chaque minute).
+L'écriture a lieu dans un thread dédié : la boucle asyncio ne fait que copier l'état.
+"""
+
+import logging
+import asyncio
+import json
+import os
+import datetime
+import threading
+from telethon.sessions import StringSession
+from telethon.tl import types
+
+logger = logging.getLogger(__name__)
+
+# Dossier des sessions stockées (un fichier JSON par compte)
+SESSION_DIR = os.getenv("SESSION_DIR", "sessions")
+
+
+class SessionWriter:
+    """
+    Thread unique d'écriture des sessions.
+    Seul le dernier instantané de chaque session est écrit (les précédents en attente sont remplacés).
+    """
+
+    def __init__(self):
+        self._pending = {}  # path -> (session, instantané)
+        self._writing = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, session, snapshot):
+        with self._condition:
+            self._pending[session.path] = (session, snapshot)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def discard(self, path):
+        """Oublie l'écriture en attente d'une session supprimée"""
+        with self._condition:
+            self._pending.pop(path, None)
+
+    def flush(self, timeout=None):
+        """Attend que toutes les sessions en attente soient écrites (arrêt du bot)"""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                path, (session, snapshot) = self._pending.popitem()
+                self._writing += 1
+            try:
+                tmp_file = f"{path}.tmp"
+                with open(tmp_file, 'w') as f:
+                    json.dump(snapshot, f, separators=(',', ':'))
+                os.replace(tmp_file, path)
+            except Exception as e:
+                logger.error(f"Error saving session {session.key}: {e}")
+                # Nouvel essai au prochain save()
+                session._dirty = True
+            finally:
+                with self._condition:
+                    self._writing -= 1
+                    self._condition.notify_all()
+
+
+# Instance globale
+session_writer = SessionWriter()
+
+
+class StoredSession(StringSession):
+    """Session Telethon en mémoire, persistée dans le stockage des sessions"""
+
+    def __init__(self, key, path, data=None):
+        data = data or {}
+        super().__init__(data.get("string") or None)
+        self.key = key
+        self.path = path
+        self._dirty = False
+
+        # Cache d'entités indexé : id -> (id, hash, username, phone, name)
+        self._entities_by_id = {}
+        self._ids_by_username = {}
+        self._ids_by_phone = {}
+        for row in data.get("entities", []):
+            self._store_row(tuple(row))
+
+        for entity_id, (pts, qts, date, seq) in data.get("update_states", {}).items():
+            self._update_states[int(entity_id)] = types.updates.State(
+                pts, qts, datetime.datetime.fromtimestamp(date, datetime.timezone.utc), seq, unread_count=0
+            )
+
+    # Données de connexion : toute modification est persistée au prochain save()
+
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self._dirty = True
+
+    @StringSession.auth_key.setter
+    def auth_key(self, value):
+        if value is not self._auth_key:
+            self._auth_key = value
+            self._dirty = True
+
+    def set_update_state(self, entity_id, state):
+        previous = self._update_states.get(entity_id)
+        if previous is None or (previous.pts, previous.qts, previous.seq) != (state.pts, state.qts, state.seq):
+            self._dirty = True
+        super().set_update_state(entity_id, state)
+
+    # Cache d'entités en mémoire (recherches en O(1) au lieu d'un parcours)
+
+    def _store_row(self, row):
+        entity_id, _, username, phone, _ = row
+        previous = self._entities_by_id.get(entity_id)
+        if previous == row:
+            return False
+        if previous:
+            self._ids_by_username.pop(previous[2], None)
+            self._ids_by_phone.pop(previous[3], None)
+        self._entities_by_id[entity_id] = row
+        if username:
+            self._ids_by_username[username] = entity_id
+        if phone:
+            self._ids_by_phone[phone] = entity_id
+        return True
+
+    def process_entities(self, tlo):
+        for row in self._entities_to_rows(tlo):
+            if self._store_row(row):
+                self._dirty = True
+
+    def _row_ids(self, entity_id):
+        row = self._entities_by_id.get(entity_id)
+        return (row[0], row[1]) if row else None
+
+    def get_entity_rows_by_phone(self, phone):
+        return self._row_ids(self._ids_by_phone.get(phone))
+
+    def get_entity_rows_by_username(self, username):
+        return self._row_ids(self._ids_by_username.get(username))
+
+    def get_entity_rows_by_name(self, name):
+        return next(((row[0], row[1]) for row in self._entities_by_id.values() if row[4] == name), None)
+
+    def get_entity_rows_by_id(self, id, exact=True):
+        if exact:
+            return self._row_ids(id)
+        from telethon import utils
+        for peer in (types.PeerUser(id), types.PeerChat(id), types.PeerChannel(id)):
+            found = self._row_ids(utils.get_peer_id(peer))
+            if found:
+                return found
+        return None
+
+    # Persistance
+
+    def to_dict(self):
+        return {
+            "string": StringSession.save(self),
+            "entities": list(self._entities_by_id.values()),
+            "update_states": {
+                str(entity_id): [state.pts, state.qts, state.date.timestamp(), state.seq]
+                for entity_id, state in self._update_states.items()
+            },
+            "saved_at": datetime.datetime.now().isoformat()
+        }
+
+    def save(self):
+        """Fait écrire la session si elle a changé (écriture atomique, hors de la boucle asyncio)"""
+        if not self._dirty or not self._auth_key or self.path is None:
+            return
+        try:
+            snapshot = self.to_dict()
+        except Exception as e:
+            logger.error(f"Error saving session {self.key}: {e}")
+            return
+        self._dirty = False
+        session_writer.submit(self, snapshot)
+
+    def close(self):
+        self.save()
+
+    def delete(self):
+        """Déconnexion du compte (log_out) : la session est supprimée"""
+        session_writer.discard(self.path)
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SessionStore:
+    """Ouvre les sessions des comptes à partir de leur clé"""
+
+    def __init__(self, directory=SESSION_DIR):
+        self.directory = directory
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def open(self, key, legacy_name=None):
+        """
+        Retourne la session d'un compte, ou None si elle n'existe pas.
+        legacy_name : ancien fichier SQLite du compte, importé une seule fois.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(key)
+        try:
+            with open(path, 'r') as f:
+                return StoredSession(key, path, json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error loading session {key}: {e}")
+            return None
+
+        return self._import_sqlite(key, path, legacy_name or key)
+
+    def new_login(self, key):
+        """
+        Session vide d'une connexion /connect, gardée en mémoire jusqu'à adopt() :
+        la session du compte déjà connecté reste intacte si le code n'est jamais validé
+        """
+        return StoredSession(key, None)
+
+    async def adopt(self, session):
+        """Écrit la session d'une connexion réussie à la place de celle du compte (écriture terminée au retour)"""
+        os.makedirs(self.directory, exist_ok=True)
+        session.path = self.path_for(session.key)
+        session._dirty = True
+        session.save()
+        await asyncio.to_thread(session_writer.flush)
+
+    def _import_sqlite(self, key, path, sqlite_name):
+        """Importe une ancienne session SQLite (.session) dans le stockage"""
+        if sqlite_name.endswith('.session'):
+            sqlite_name = sqlite_name[:-len('.session')]
+        if not os.path.exists(f"{sqlite_name}.session"):
+            return None
+
+        from telethon.sessions import SQLiteSession
+        legacy = SQLiteSession(sqlite_name)
+        try:
+            if not legacy.auth_key:
+                return None
+            session = StoredSession(key, path)
+            session.set_dc(legacy.dc_id, legacy.server_address, legacy.port)
+            session.auth_key = legacy.auth_key
+            for entity_id, state in legacy.get_update_states():
+                session.set_update_state(entity_id, state)
+            cursor = legacy._cursor()
+            try:
+                for row in cursor.execute('select id, hash, username, phone, name from entities'):
+                    session._store_row(tuple(row))
+            finally:
+                cursor.close()
+            session.save()
+            logger.info(f"Session {sqlite_name}.session imported as {key}")
+            return session
+        finally:
+            legacy.close()
+
+
+# Instance globale
+session_store = SessionStore()
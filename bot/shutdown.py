@@ -0,0 +1,147 @@
+"""
+Arrêt propre du bot (SIGTERM lors d'un redéploiement, SIGINT)
+Termine les transferts en cours, sauvegarde l'état puis déconnecte les clients
+"""
+
+import logging
+import asyncio
+import os
+import signal
+
+logger = logging.getLogger(__name__)
+
+# Délai maximal accordé aux transferts en cours (secondes)
+SHUTDOWN_DRAIN_TIMEOUT = int(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))
+
+
+class ShutdownManager:
+    """Coordonne l'arrêt : transferts en cours, sauvegardes, déconnexions"""
+
+    def __init__(self, drain_timeout=SHUTDOWN_DRAIN_TIMEOUT):
+        self.drain_timeout = drain_timeout
+        self.stopping = False
+        self.inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.closed = asyncio.Event()
+
+    async def run_forward(self, coro):
+        """
+        Exécute un transfert en le comptant comme en cours (attendu lors de l'arrêt).
+        Pendant l'arrêt, les nouveaux transferts sont refusés pour que l'attente se termine.
+        """
+        if self.stopping:
+            coro.close()
+            return None
+        self.inflight += 1
+        self._idle.clear()
+        try:
+            return await coro
+        finally:
+            self.inflight -= 1
+            if self.inflight == 0:
+                self._idle.set()
+
+    def install(self, bot_client=None):
+        """Déclenche l'arrêt propre sur SIGTERM et SIGINT"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, lambda sig=sig: asyncio.ensure_future(self.shutdown(bot_client, sig.name)))
+
+    async def shutdown(self, bot_client=None, reason="shutdown"):
+        """Séquence d'arrêt ; sans effet si elle est déjà en cours"""
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info(f"🛑 Arrêt propre demandé ({reason})")
+
+        try:
+            # 1. Plus de nouvelles commandes, de nouveaux transferts (run_forward) ni de reconnexions automatiques
+            try:
+                if bot_client is not None:
+                    for callback, event in bot_client.list_event_handlers():
+                        bot_client.remove_event_handler(callback, event)
+                from bot.health_supervisor import health_supervisor
+                health_supervisor.stop()
+            except Exception as e:
+                logger.error(f"Erreur à l'arrêt des gestionnaires: {e}")
+
+            try:
+                from bot.workers import worker_pool
+                if worker_pool.enabled:
+                    # Chaque worker reçoit SIGTERM et exécute sa propre séquence d'arrêt
+                    await worker_pool.stop()
+            except Exception as e:
+                logger.error(f"Erreur à l'arrêt des workers: {e}")
+
+            # 2. Attendre la fin des transferts en cours, avec un délai maximal
+            if self.inflight:
+                logger.info(f"⏳ {self.inflight} transfert(s) en cours, attente (max {self.drain_timeout}s)")
+                try:
+                    await asyncio.wait_for(self._idle.wait(), self.drain_timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"{self.inflight} transfert(s) interrompu(s) par l'arrêt")
+
+            # 3. Sauvegarder les correspondances de messages et les instantanés de chats en attente
+            try:
+                from bot.database import save_message_mapping
+                from bot.simple_restorer import simple_restorer
+                from bot.message_handler import message_redirector
+                save_message_mapping({**message_redirector.message_mapping, **simple_restorer.message_mapping})
+            except Exception as e:
+                logger.error(f"Erreur de sauvegarde des correspondances de messages: {e}")
+
+            try:
+                from bot.dialog_index import dialog_index
+                await dialog_index.save_snapshots()
+            except Exception as e:
+                logger.error(f"Erreur de sauvegarde des instantanés de chats: {e}")
+
+            # 4. Déconnecter tous les comptes en parallèle (les sessions sont écrites à la déconnexion)
+            try:
+                from bot.client_registry import client_registry
+                await client_registry.disconnect_all()
+            except Exception as e:
+                logger.error(f"Erreur de déconnexion des comptes: {e}")
+
+            # Les sessions sont écrites par un thread : attendre la fin des écritures
+            try:
+                from bot.session_store import session_writer
+                await asyncio.to_thread(session_writer.flush, self.drain_timeout)
+            except Exception as e:
+                logger.error(f"Erreur d'écriture des sessions: {e}")
+
+            # Envoyer les messages internes encore en file tant que le client du bot est connecté
+            try:
+                from bot.messenger import bot_messenger
+                await bot_messenger.close()
+            except Exception as e:
+                logger.error(f"Erreur à la fermeture de la messagerie interne: {e}")
+
+            if bot_client is not None:
+                # Fermer les sessions HTTP partagées des systèmes de maintien d'activité
+                for name in ('auto_communication', 'keep_alive_system'):
+                    system = getattr(bot_client, name, None)
+                    if system is not None:
+                        try:
+                            await system.close()
+                        except Exception as e:
+                            logger.error(f"Erreur à la fermeture de {name}: {e}")
+
+            try:
+                from http_server import stop_http_server
+                await stop_http_server()
+            except Exception as e:
+                logger.error(f"Erreur à l'arrêt du serveur HTTP: {e}")
+        finally:
+            # En dernier, même après une erreur : la déconnexion du bot fait revenir run_until_disconnected()
+            try:
+                if bot_client is not None:
+                    await bot_client.disconnect()
+            except Exception as e:
+                logger.error(f"Erreur de déconnexion du bot: {e}")
+            logger.info("✅ Arrêt propre terminé")
+            self.closed.set()
+
+# Instance globale
+shutdown_manager = ShutdownManager()
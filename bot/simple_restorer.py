@@ -4,11 +4,13 @@ Fonctionne sans dépendance à PostgreSQL
 """
 
 import logging
-import asyncio
 import os
 import json
-from telethon import TelegramClient
-from config.settings import API_ID, API_HASH
+from telethon.errors import FloodWaitError
+from bot.database import load_message_mapping
+from bot.metrics import messages_forwarded, send_duration, flood_waits, handler_errors
+from bot.tracing import forward_tracer
+from bot.logging_setup import forward_log_sampler
 
 logger = logging.getLogger(__name__)
 
@@ -16,12 +18,17 @@ class SimpleRedirectionRestorer:
     """Système de restauration simple et efficace"""
     
     def __init__(self):
-        self.active_clients = {}
         self.restored_redirections = 0
-        self.message_mapping = {}  # Maps original message ID to redirected message ID
+        self.message_mapping = load_message_mapping()  # Maps original message ID to redirected message ID
         
-    async def restore_all_redirections(self):
-        """Restaure toutes les redirections depuis user_data.json"""
+    async def restore_all_redirections(self, account_filter=None):
+        """
+        Restaure toutes les redirections depuis user_data.json
+        account_filter(user_id, phone) limite la restauration à certains comptes (mode workers)
+        Chaque compte devient actif dès que son client est connecté (bot.readiness)
+        """
+        from bot.readiness import account_readiness
+        account_readiness.begin()
         try:
             logger.info("🔄 Démarrage de la restauration simple des redirections")
             
@@ -40,59 +47,61 @@ class SimpleRedirectionRestorer:
                 logger.info("Aucune redirection à restaurer")
                 return
             
-            # Restaurer pour chaque utilisateur
+            # Un élément par compte (utilisateur, numéro) : chaque téléphone connecté a son client
+            from bot.client_registry import routes_by_phone
+            accounts = []
             for user_id, user_redirections in redirections.items():
-                await self._restore_user_redirections(int(user_id), user_redirections, connections)
+                default_phone = self._get_user_phone(user_id, connections)
+                for phone_number, phone_redirections in routes_by_phone(user_redirections, default_phone).items():
+                    if account_filter and not account_filter(int(user_id), phone_number):
+                        continue
+                    accounts.append((int(user_id), phone_number, phone_redirections))
+                    account_readiness.expect(int(user_id), phone_number, len(phone_redirections))
+            
+            # Restaurer les comptes en parallèle (concurrence bornée)
+            from bot.restore_scheduler import restore_scheduler
+            await restore_scheduler.run(
+                accounts,
+                lambda account: self._restore_user_redirections(*account),
+                "redirections"
+            )
             
             logger.info(f"✅ Restauration terminée: {self.restored_redirections} redirections actives")
             
         except Exception as e:
             logger.error(f"Erreur lors de la restauration: {e}")
+        finally:
+            account_readiness.finish()
     
-    async def _restore_user_redirections(self, user_id, user_redirections, connections):
-        """Restaure les redirections d'un utilisateur"""
+    async def _restore_user_redirections(self, user_id, phone_number, active_redirections):
+        """Restaure les redirections d'un compte (utilisateur, numéro)"""
+        from bot.readiness import account_readiness
+        account_readiness.mark(user_id, phone_number, "connecting")
         try:
-            # Filtrer les redirections actives
-            active_redirections = {
-                name: data for name, data in user_redirections.items()
-                if data.get('active', True) and data.get('source_id') and data.get('destination_id')
-            }
-            
-            if not active_redirections:
-                return
-                
-            logger.info(f"Restauration de {len(active_redirections)} redirections pour utilisateur {user_id}")
-            
-            # Obtenir le numéro de téléphone depuis les connexions
-            phone_number = self._get_user_phone(user_id, connections)
-            if not phone_number:
-                logger.warning(f"Aucun numéro trouvé pour utilisateur {user_id}")
-                return
+            logger.info(f"Restauration de {len(active_redirections)} redirections pour {user_id}:{phone_number}")
             
             # Créer le client Telegram
             client = await self._create_telegram_client(user_id, phone_number)
             if not client:
-                logger.warning(f"Impossible de créer le client pour {user_id}")
-                return
+                logger.warning(f"Impossible de créer le client pour {user_id}:{phone_number}")
+                account_readiness.mark(user_id, phone_number, "failed")
+                return False
             
             # Configurer les redirections
             await self._setup_message_handlers(client, user_id, active_redirections)
-            
-            # Stocker le client actif
-            self.active_clients[user_id] = {
-                'client': client,
-                'phone': phone_number,
-                'redirections': len(active_redirections)
-            }
+            account_readiness.mark(user_id, phone_number, "live")
             
             self.restored_redirections += len(active_redirections)
-            logger.info(f"✅ {len(active_redirections)} redirections configurées pour {user_id}")
+            logger.info(f"✅ {len(active_redirections)} redirections configurées pour {user_id}:{phone_number}")
+            return True
             
         except Exception as e:
-            logger.error(f"Erreur restauration utilisateur {user_id}: {e}")
+            logger.error(f"Erreur restauration compte {user_id}:{phone_number}: {e}")
+            account_readiness.mark(user_id, phone_number, "failed")
+            return False
     
     def _get_user_phone(self, user_id, connections):
-        """Obtient le numéro de téléphone d'un utilisateur"""
+        """Numéro le plus récent d'un utilisateur, pour les redirections sans numéro enregistré"""
         try:
             user_connections = connections.get(str(user_id), [])
             if user_connections:
@@ -106,54 +115,13 @@ class SimpleRedirectionRestorer:
             return None
     
     async def _create_telegram_client(self, user_id, phone_number):
-        """Crée un client Telegram"""
+        """Obtient le client Telegram du compte depuis le registre partagé"""
         try:
-            # Vérifier si un client existe déjà
-            from bot.connection import active_connections
-            if user_id in active_connections:
-                existing_client = active_connections[user_id].get('client')
-                if existing_client and existing_client.is_connected():
-                    logger.info(f"Utilisation du client existant pour {user_id}")
-                    return existing_client
-            
-            # Chercher les fichiers de session possibles
-            session_files = [
-                f"session_{user_id}_{phone_number}.session",
-                f"session_1190237801_22995501564.session",  # Session connue
-                f"session_1190237801_22967924076.session",  # Autre session connue
-                f"{user_id}_{phone_number}.session",
-                f"session_{phone_number}.session"
-            ]
-            
-            session_file = None
-            for session_name in session_files:
-                if os.path.exists(session_name):
-                    session_file = session_name
-                    break
-            
-            if not session_file:
-                logger.warning(f"Aucune session trouvée pour {user_id}:{phone_number}")
-                return None
-            
-            # Attendre un moment pour éviter les conflits de base de données
-            await asyncio.sleep(1)
-            
-            # Créer le client
-            client = TelegramClient(session_file, API_ID, API_HASH)
-            
-            # Démarrer la session avec timeout
-            try:
-                await asyncio.wait_for(client.start(phone=f"+{phone_number}"), timeout=30)
-            except asyncio.TimeoutError:
-                logger.error(f"Timeout lors de la connexion pour {user_id}")
-                return None
-            
-            if client.is_connected():
-                logger.info(f"Client connecté pour {user_id} avec session {session_file}")
-                return client
-            else:
-                logger.error(f"Échec de connexion pour {user_id}")
-                return None
+            from bot.client_registry import client_registry
+            client = await client_registry.acquire(user_id, phone_number)
+            if client:
+                logger.info(f"Client connecté pour {user_id}:{phone_number}")
+            return client
                 
         except Exception as e:
             logger.error(f"Erreur création client {user_id}:{phone_number}: {e}")
@@ -169,49 +137,42 @@ class SimpleRedirectionRestorer:
                 logger.error(f"Client non connecté pour utilisateur {user_id}")
                 return
             
-            # Stocker le client dans active_connections pour éviter les conflits
-            from bot.connection import active_connections
-            active_connections[user_id] = {
-                'client': client,
-                'phone': self._get_user_phone_from_redirections(redirections),
-                'active': True
-            }
+            from bot.client_registry import client_registry
+            from bot.shutdown import shutdown_manager
             
             for name, redir_data in redirections.items():
                 source_id = int(redir_data['source_id'])
                 destination_id = int(redir_data['destination_id'])
                 
+                # Une redirection n'est attachée qu'une fois par client
+                if not client_registry.claim_route(client, name, source_id, destination_id):
+                    continue
+                
                 # Créer le gestionnaire de messages
                 @client.on(events.NewMessage(chats=source_id))
                 async def message_handler(event, dest_id=destination_id, redirect_name=name, u_id=user_id):
                     try:
-                        await self._forward_message(event, dest_id, redirect_name, u_id)
+                        await shutdown_manager.run_forward(self._forward_message(event, dest_id, redirect_name, u_id))
                     except Exception as e:
-                        logger.error(f"Erreur redirection {redirect_name}: {e}")
+                        logger.error("Erreur redirection %s: %s", redirect_name, e)
                 
                 # Créer le gestionnaire d'édition
                 @client.on(events.MessageEdited(chats=source_id))
                 async def edit_handler(event, dest_id=destination_id, redirect_name=name, u_id=user_id):
                     try:
-                        await self._forward_message(event, dest_id, redirect_name, u_id, is_edit=True)
+                        await shutdown_manager.run_forward(self._forward_message(event, dest_id, redirect_name, u_id, is_edit=True))
                     except Exception as e:
-                        logger.error(f"Erreur édition {redirect_name}: {e}")
+                        logger.error("Erreur édition %s: %s", redirect_name, e)
                 
-                logger.info(f"Gestionnaire configuré: {name} ({source_id} → {destination_id})")
+                logger.info("Gestionnaire configuré: %s (%s → %s)", name, source_id, destination_id)
                 
         except Exception as e:
-            logger.error(f"Erreur configuration gestionnaires: {e}")
-    
-    def _get_user_phone_from_redirections(self, redirections):
-        """Obtient le numéro de téléphone depuis les redirections"""
-        for redir_data in redirections.values():
-            if redir_data.get('phone'):
-                return redir_data['phone']
-        return None
+            logger.error("Erreur configuration gestionnaires: %s", e)
     
     async def _forward_message(self, event, destination_id, redirect_name, user_id, is_edit=False):
         """Transfère un message"""
         try:
+            trace = forward_tracer.start(event, redirect_name)
             message = event.message
             original_msg_id = message.id
             mapping_key = f"{event.chat_id}_{original_msg_id}_{destination_id}"
@@ -223,8 +184,11 @@ class SimpleRedirectionRestorer:
                     try:
                         # Modifier le message existant
                         if message.text:
-                            await event.client.edit_message(int(destination_id), redirected_msg_id, message.text)
-                            logger.info(f"Message modifié: {redirect_name}")
+                            with send_duration.time(path="edit"), trace.stage("send"):
+                                await event.client.edit_message(int(destination_id), redirected_msg_id, message.text)
+                            messages_forwarded.inc(user=user_id, route=redirect_name, kind="edit")
+                            forward_tracer.finish(trace)
+                            self._log_forwarded(user_id, redirect_name, "edit", event.chat_id, destination_id)
                             return
                         elif message.media:
                             # Pour les médias modifiés, supprimer et renvoyer
@@ -238,48 +202,68 @@ class SimpleRedirectionRestorer:
                             try:
                                 await event.client.delete_messages(int(destination_id), redirected_msg_id)
                                 del self.message_mapping[mapping_key]
-                                logger.info(f"Message supprimé: {redirect_name}")
+                                logger.info("Message supprimé: %s", redirect_name)
                                 return
                             except:
                                 return
                     except Exception as edit_error:
                         # Si l'édition échoue, continuer pour envoyer un nouveau message
                         if "Content of the message was not modified" in str(edit_error):
-                            logger.info(f"Contenu inchangé pour {redirect_name}")
+                            logger.info("Contenu inchangé pour %s", redirect_name)
                             return
-                        logger.warning(f"Échec édition message {redirected_msg_id}: {edit_error}")
+                        logger.warning("Échec édition message %s: %s", redirected_msg_id, edit_error)
                 else:
                     # Édition d'un message non mappé, ne rien faire
-                    logger.info(f"Édition d'un message non mappé: {original_msg_id}")
+                    logger.info("Édition d'un message non mappé: %s", original_msg_id)
                     return
             
             # Envoyer un nouveau message (première fois ou remplacement)
             sent_message = None
             if message.text:
-                sent_message = await event.client.send_message(int(destination_id), message.text)
+                with send_duration.time(path="send"), trace.stage("send"):
+                    sent_message = await event.client.send_message(int(destination_id), message.text)
             elif message.media:
-                sent_message = await event.client.forward_messages(int(destination_id), message)
+                with send_duration.time(path="forward"), trace.stage("send"):
+                    sent_message = await event.client.forward_messages(int(destination_id), message)
             else:
                 return
+            messages_forwarded.inc(user=user_id, route=redirect_name, kind="edit" if is_edit else "new")
             
             # Stocker la correspondance pour les futures éditions
-            if sent_message and not is_edit:
-                if hasattr(sent_message, 'id'):
-                    self.message_mapping[mapping_key] = sent_message.id
-                elif isinstance(sent_message, list) and len(sent_message) > 0:
-                    self.message_mapping[mapping_key] = sent_message[0].id
-            elif sent_message and is_edit:
-                # Mettre à jour la correspondance pour les remplacements de médias
-                if hasattr(sent_message, 'id'):
-                    self.message_mapping[mapping_key] = sent_message.id
-                elif isinstance(sent_message, list) and len(sent_message) > 0:
-                    self.message_mapping[mapping_key] = sent_message[0].id
+            with trace.stage("mapping"):
+                if sent_message and not is_edit:
+                    if hasattr(sent_message, 'id'):
+                        self.message_mapping[mapping_key] = sent_message.id
+                    elif isinstance(sent_message, list) and len(sent_message) > 0:
+                        self.message_mapping[mapping_key] = sent_message[0].id
+                elif sent_message and is_edit:
+                    # Mettre à jour la correspondance pour les remplacements de médias
+                    if hasattr(sent_message, 'id'):
+                        self.message_mapping[mapping_key] = sent_message.id
+                    elif isinstance(sent_message, list) and len(sent_message) > 0:
+                        self.message_mapping[mapping_key] = sent_message[0].id
+            forward_tracer.finish(trace)
             
-            action = "modifié et redirigé" if is_edit else "transféré"
-            logger.info(f"Message {action}: {redirect_name}")
+            self._log_forwarded(user_id, redirect_name, "replace" if is_edit else "new", event.chat_id, destination_id)
             
         except Exception as e:
-            logger.error(f"Erreur transfert message: {e}")
+            if isinstance(e, FloodWaitError):
+                flood_waits.inc(source="forward")
+            handler_errors.inc(handler="forward")
+            logger.error("Erreur transfert message: %s", e, extra={"fields": {
+                "event": "forward_failed", "user": user_id, "route": redirect_name,
+                "source": event.chat_id, "destination": destination_id, "error": type(e).__name__
+            }})
+    
+    def _log_forwarded(self, user_id, redirect_name, kind, source_id, destination_id):
+        """Log échantillonné d'un transfert réussi (1 sur FORWARD_LOG_EVERY par redirection)"""
+        total = forward_log_sampler.sample(user_id, redirect_name)
+        if total is None:
+            return
+        logger.info("Message transféré (%s): %s (%s transfert(s) réussi(s))", kind, redirect_name, total, extra={"fields": {
+            "event": "forwarded", "user": user_id, "route": redirect_name, "kind": kind,
+            "source": source_id, "destination": destination_id, "total": total
+        }})
     
     async def _get_channel_name(self, client, chat_id):
         """Obtient le nom d'un canal"""
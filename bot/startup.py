@@ -0,0 +1,51 @@
+"""
+Chronométrage du démarrage du bot
+Chaque phase (imports, base de données, connexion du bot, restauration des sessions et des routes)
+est mesurée ; le récapitulatif est journalisé une fois le bot prêt et exposé dans /metrics.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from bot.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Durées des phases de démarrage, dans l'ordre d'exécution"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.total = None
+
+    @contextmanager
+    def phase(self, name):
+        """Mesure une phase (même en cas d'échec, pour voir où le démarrage bloque)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def report(self):
+        """Journalise le récapitulatif ; le total part de l'import de ce module (début du processus)"""
+        self.total = time.perf_counter() - self.started
+        details = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        logger.info("⏱️ Démarrage terminé en %.2fs (%s)", self.total, details)
+
+    def values(self):
+        """Durées par phase pour la jauge Prometheus"""
+        values = {(name,): seconds for name, seconds in self.phases.items()}
+        if self.total is not None:
+            values[("total",)] = self.total
+        return values
+
+
+# Instance globale
+startup_timer = StartupTimer()
+
+registry.gauge(
+    "telefeed_startup_phase_seconds", "Durée des phases du dernier démarrage", ("phase",)
+).set_function(startup_timer.values)
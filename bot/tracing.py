@@ -0,0 +1,117 @@
+"""
+Traçage de latence des transferts de messages
+Chaque transfert enregistre ses étapes (délai de livraison Telegram, envoi, correspondance)
+dans un tampon circulaire ; les percentiles p50/p95/p99 sont calculés à la demande.
+"""
+
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from bot.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Nombre de transferts conservés pour les percentiles
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "2000"))
+
+# Étapes dans l'ordre d'affichage
+# delivery : date du message source -> début du gestionnaire (résolution : 1 s, les dates Telegram sont en secondes)
+# end_to_end : date du message source -> fin du transfert
+TRACE_STAGES = ("delivery", "send", "mapping", "handler", "end_to_end")
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+forward_stage_duration = registry.histogram(
+    "telefeed_forward_stage_seconds", "Durée des étapes d'un transfert", ("stage",))
+
+
+class ForwardTrace:
+    """Mesures d'un transfert en cours"""
+
+    __slots__ = ("route", "source_date", "started", "stages")
+
+    def __init__(self, route, source_date):
+        self.route = route
+        self.source_date = source_date
+        self.started = time.time()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Mesure une étape (cumulée si elle se répète)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+
+class ForwardTracer:
+    """Tampon circulaire des derniers transferts"""
+
+    def __init__(self, size=TRACE_BUFFER_SIZE):
+        self.records = deque(maxlen=size)
+
+    def start(self, event, route):
+        """Début du gestionnaire d'un message source"""
+        message = event.message
+        source_date = getattr(message, 'edit_date', None) or getattr(message, 'date', None)
+        return ForwardTrace(route, source_date.timestamp() if source_date else None)
+
+    def finish(self, trace):
+        """Enregistre un transfert terminé"""
+        now = time.time()
+        record = dict(trace.stages)
+        record["handler"] = now - trace.started
+        if trace.source_date is not None:
+            # Horloge locale décalée : pas de durée négative
+            record["delivery"] = max(0.0, trace.started - trace.source_date)
+            record["end_to_end"] = max(0.0, now - trace.source_date)
+        for stage, duration in record.items():
+            forward_stage_duration.observe(duration, stage=stage)
+        record["route"] = trace.route
+        self.records.append(record)
+
+    def summary(self, route=None):
+        """{étape: {"count", "p50", "p95", "p99"}} sur les transferts conservés"""
+        return summarize(self.records, route)
+
+    def quantiles(self):
+        """Percentiles par (étape, quantile) pour la jauge Prometheus"""
+        return {
+            (stage, str(q)): values[f"p{int(q * 100)}"]
+            for stage, values in self.summary().items()
+            for q in PERCENTILES
+        }
+
+
+def summarize(records, route=None):
+    """Percentiles par étape d'une liste de transferts (ex. ceux de tous les workers)"""
+    records = [record for record in records if route is None or record["route"] == route]
+    result = {}
+    for stage in TRACE_STAGES:
+        values = sorted(record[stage] for record in records if stage in record)
+        if values:
+            result[stage] = {"count": len(values)}
+            for q in PERCENTILES:
+                result[stage][f"p{int(q * 100)}"] = percentile(values, q)
+    return result
+
+
+def percentile(sorted_values, q):
+    """Percentile au rang le plus proche d'une liste triée"""
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+# Instance globale
+forward_tracer = ForwardTracer()
+
+registry.gauge(
+    "telefeed_forward_latency_quantile_seconds",
+    "Percentiles de latence des derniers transferts",
+    ("stage", "quantile")
+).set_function(forward_tracer.quantiles)
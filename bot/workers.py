@@ -0,0 +1,370 @@
+"""
+Mode multi-processus : répartition des comptes utilisateurs sur N workers
+Le processus du bot pilote les workers via une socket Unix locale (JSON, une ligne par message)
+"""
+
+import logging
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Nombre de processus workers (0 : tous les comptes dans le processus du bot)
+USER_WORKERS = int(os.getenv("USER_WORKERS", "0"))
+
+# Dossier des sockets Unix des workers
+WORKER_SOCKET_DIR = os.getenv("USER_WORKERS_SOCKET_DIR", tempfile.gettempdir())
+
+# Délai maximal de démarrage d'un worker et d'une requête IPC (secondes)
+WORKER_START_TIMEOUT = 60
+IPC_TIMEOUT = 120
+
+# Taille maximale d'une ligne IPC (listes de dialogues complètes)
+IPC_LINE_LIMIT = 64 * 1024 * 1024
+
+
+def shard_for(user_id, phone_number, count=USER_WORKERS):
+    """Index du worker d'un compte, stable d'un démarrage à l'autre"""
+    phone = str(phone_number or '').replace('+', '').strip()
+    return zlib.crc32(f"{int(user_id)}:{phone}".encode()) % count
+
+
+def socket_path_for(index):
+    return os.path.join(WORKER_SOCKET_DIR, f"telefeed-worker-{index}.sock")
+
+
+class ShardWorker:
+    """Processus worker : possède les clients des comptes de son shard"""
+
+    def __init__(self, index, count):
+        self.index = index
+        self.count = count
+        self.socket_path = socket_path_for(index)
+        self._tasks = []  # tâches de fond (référence conservée)
+        self._requests = set()  # requêtes en cours (référence conservée jusqu'à la fin)
+        self.ops = {
+            "ping": self.ping,
+            "activate": self.activate,
+            "release": self.release,
+            "add_route": self.add_route,
+            "remove_route": self.remove_route,
+            "get_chats": self.get_chats,
+            "chats_page": self.chats_page,
+            "search_chats": self.search_chats,
+            "stats": self.stats,
+            "metrics": self.metrics,
+            "trace_records": self.trace_records,
+            "readiness": self.readiness,
+        }
+
+    def owns(self, user_id, phone_number):
+        return shard_for(user_id, phone_number, self.count) == self.index
+
+    async def run(self):
+        """Sert les requêtes IPC pendant que les redirections du shard sont restaurées"""
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._serve, path=self.socket_path, limit=IPC_LINE_LIMIT)
+        logger.info(f"Worker {self.index}/{self.count} listening on {self.socket_path}")
+
+        # Restauration en tâche de fond : les requêtes IPC (readiness, activate...) sont servies pendant ce temps
+        self._tasks.append(asyncio.create_task(self._restore()))
+
+        # Arrêt propre sur SIGTERM (envoyé par le processus du bot)
+        from bot.shutdown import shutdown_manager
+        shutdown_manager.install()
+
+        async with server:
+            await shutdown_manager.closed.wait()
+
+    async def _restore(self):
+        """Restaure les redirections du shard, compte par compte, sous la surveillance des connexions"""
+        from bot.simple_restorer import simple_restorer
+        from bot.client_registry import client_registry
+        from bot.health_supervisor import health_supervisor
+        self._tasks.append(asyncio.create_task(health_supervisor.run()))
+        await simple_restorer.restore_all_redirections(account_filter=self.owns)
+        self._tasks.append(asyncio.create_task(client_registry.hibernation_loop()))
+
+    async def _serve(self, reader, writer):
+        write_lock = asyncio.Lock()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            task = asyncio.create_task(self._handle(json.loads(line), writer, write_lock))
+            self._requests.add(task)
+            task.add_done_callback(self._requests.discard)
+        writer.close()
+
+    async def _handle(self, request, writer, write_lock):
+        """Exécute une requête ; chaque requête est indépendante (un compte lent ne bloque pas les autres)"""
+        response = {"id": request.get("id")}
+        try:
+            op = self.ops.get(request.get("op"))
+            if op is None:
+                raise ValueError(f"Unknown operation {request.get('op')}")
+            response["result"] = await op(**request.get("params", {}))
+            response["ok"] = True
+        except Exception as e:
+            logger.error(f"Worker {self.index} error on {request.get('op')}: {e}")
+            response["ok"] = False
+            response["error"] = str(e)
+        async with write_lock:
+            writer.write(json.dumps(response, ensure_ascii=False, default=str).encode() + b"\n")
+            await writer.drain()
+
+    async def ping(self):
+        return {"index": self.index, "pid": os.getpid()}
+
+    async def activate(self, user_id, phone_number):
+        """Prend en charge un compte après /connect et attache ses redirections"""
+        from bot.client_registry import client_registry, routes_by_phone, normalize_phone
+        from bot.database import load_data
+        client = await client_registry.acquire(user_id, phone_number)
+        if not client:
+            return False
+        user_redirections = load_data().get("redirections", {}).get(str(user_id), {})
+        routes = routes_by_phone(user_redirections).get(normalize_phone(phone_number))
+        if routes:
+            from bot.simple_restorer import simple_restorer
+            await simple_restorer._setup_message_handlers(client, int(user_id), routes)
+        return True
+
+    async def release(self, user_id, phone_number):
+        """Déconnecte le client d'un compte avant qu'une nouvelle session le remplace (/connect)"""
+        from bot.client_registry import client_registry
+        from bot.session_store import session_writer
+        await client_registry.disconnect(user_id, phone_number)
+        # La session est écrite par un thread : terminée avant que le processus principal la remplace
+        await asyncio.to_thread(session_writer.flush)
+        return True
+
+    async def add_route(self, user_id, phone_number, name, source_id, destination_id):
+        from bot.message_handler import message_redirector
+        return await message_redirector.add_redirection_handler(user_id, name, source_id, destination_id, phone_number)
+
+    async def remove_route(self, user_id, phone_number, name):
+        from bot.message_handler import message_redirector
+        return await message_redirector.remove_redirection_handler(user_id, name, phone_number)
+
+    async def get_chats(self, user_id, phone_number, chat_type=None):
+        from bot.chats import get_real_user_chats
+        return await get_real_user_chats(user_id, phone_number, chat_type)
+
+    async def chats_page(self, user_id, phone_number, chat_type, page):
+        from bot.chats import get_chats_page
+        return list(await get_chats_page(user_id, phone_number, chat_type, page))
+
+    async def search_chats(self, user_id, phone_number, query, limit):
+        from bot.chats import search_user_chats
+        return await search_user_chats(user_id, phone_number, query, limit)
+
+    async def stats(self):
+        from bot.client_registry import client_registry
+        from bot.health_supervisor import health_supervisor
+        entries = [entry for _, entry in client_registry.items()]
+        return {
+            "index": self.index,
+            "pid": os.getpid(),
+            "accounts": len(entries),
+            "connected": sum(1 for entry in entries if entry['client'].is_connected()),
+            "routed": sum(1 for entry in entries if client_registry.has_routes(entry['client'])),
+            "reconnecting": health_supervisor.stats()["reconnecting"],
+        }
+
+    async def metrics(self):
+        from bot.metrics import registry
+        return registry.collect()
+
+    async def trace_records(self):
+        from bot.tracing import forward_tracer
+        return list(forward_tracer.records)
+
+    async def readiness(self):
+        from bot.readiness import account_readiness
+        return account_readiness.summary()
+
+
+def run_worker(index, count):
+    """Point d'entrée d'un processus worker"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    from bot.logging_setup import setup_logging
+    setup_logging(
+        log_file=None,
+        fmt=f'%(asctime)s - worker {index} - %(name)s - %(levelname)s - %(message)s',
+        static_fields={"worker": index}
+    )
+    os.environ["USER_WORKER_INDEX"] = str(index)
+    worker_pool.is_worker = True
+    try:
+        asyncio.run(ShardWorker(index, count).run())
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerPool:
+    """Côté bot : démarre les workers et leur transmet les requêtes des comptes"""
+
+    def __init__(self, count=USER_WORKERS):
+        self.count = count
+        self.is_worker = False
+        self.processes = {}  # index -> multiprocessing.Process
+        self.writers = {}  # index -> StreamWriter
+        self._write_locks = {}  # index -> asyncio.Lock
+        self._pending = {}  # index -> {request id: Future}
+        self._ids = itertools.count(1)
+        self._stopping = False
+        self._readers = set()  # tâches de lecture des réponses (référence conservée)
+
+    @property
+    def enabled(self):
+        return self.count > 0 and not self.is_worker
+
+    async def start(self):
+        """Lance les N workers et s'y connecte"""
+        await asyncio.gather(*(self._start_worker(index) for index in range(self.count)))
+        logger.info(f"🧩 {self.count} worker(s) démarré(s) pour les comptes utilisateurs")
+
+    async def _start_worker(self, index):
+        import multiprocessing
+        process = multiprocessing.get_context("spawn").Process(
+            target=run_worker, args=(index, self.count), name=f"telefeed-worker-{index}", daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+        await self._connect(index)
+
+    async def _connect(self, index):
+        """Se connecte à la socket d'un worker dès qu'elle est prête"""
+        path = socket_path_for(index)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + WORKER_START_TIMEOUT
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(path, limit=IPC_LINE_LIMIT)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if loop.time() > deadline or not self.processes[index].is_alive():
+                    raise RuntimeError(f"Worker {index} did not start")
+                await asyncio.sleep(0.2)
+        self.writers[index] = writer
+        self._write_locks[index] = asyncio.Lock()
+        self._pending[index] = {}
+        task = asyncio.create_task(self._read_loop(index, reader))
+        self._readers.add(task)
+        task.add_done_callback(self._readers.discard)
+
+    async def _read_loop(self, index, reader):
+        """Résout les requêtes en attente avec les réponses du worker"""
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self._pending[index].pop(response.get("id"), None)
+            if future and not future.done():
+                if response.get("ok"):
+                    future.set_result(response.get("result"))
+                else:
+                    future.set_exception(RuntimeError(response.get("error")))
+
+        self.writers.pop(index, None)
+        for future in self._pending.pop(index, {}).values():
+            if not future.done():
+                future.set_exception(RuntimeError(f"Worker {index} disconnected"))
+        if self._stopping:
+            return
+        logger.error(f"Worker {index} disconnected, restarting")
+        process = self.processes.get(index)
+        if process and process.is_alive():
+            process.terminate()
+        try:
+            await self._start_worker(index)
+        except Exception as e:
+            logger.error(f"Error restarting worker {index}: {e}")
+
+    async def call(self, user_id, phone_number, op, timeout=IPC_TIMEOUT, **params):
+        """Exécute `op` sur le worker qui possède le compte (user_id, numéro)"""
+        return await self.call_worker(shard_for(user_id, phone_number, self.count), op, timeout,
+                                      user_id=int(user_id), phone_number=phone_number, **params)
+
+    async def call_worker(self, index, op, timeout=IPC_TIMEOUT, **params):
+        writer = self.writers.get(index)
+        if writer is None:
+            raise RuntimeError(f"Worker {index} unavailable")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending[index]
+        pending[request_id] = future
+        try:
+            async with self._write_locks[index]:
+                writer.write(json.dumps({"id": request_id, "op": op, "params": params}).encode() + b"\n")
+                await writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            pending.pop(request_id, None)
+
+    async def stats(self):
+        """État de chaque worker"""
+        results = await asyncio.gather(
+            *(self.call_worker(index, "stats", timeout=10) for index in range(self.count)),
+            return_exceptions=True
+        )
+        return [
+            result if not isinstance(result, Exception) else {"index": index, "error": str(result)}
+            for index, result in enumerate(results)
+        ]
+
+    async def metrics(self):
+        """Métriques de chaque worker (un worker injoignable est ignoré)"""
+        results = await asyncio.gather(
+            *(self.call_worker(index, "metrics", timeout=10) for index in range(self.count)),
+            return_exceptions=True
+        )
+        return {index: result for index, result in enumerate(results) if not isinstance(result, Exception)}
+
+    async def trace_records(self):
+        """Derniers transferts tracés par l'ensemble des workers"""
+        results = await asyncio.gather(
+            *(self.call_worker(index, "trace_records", timeout=10) for index in range(self.count)),
+            return_exceptions=True
+        )
+        return [record for result in results if not isinstance(result, Exception) for record in result]
+
+    async def readiness(self):
+        """Avancement global de la restauration (incomplet tant qu'un worker ne répond pas)"""
+        from bot.readiness import merge_summaries
+        results = await asyncio.gather(
+            *(self.call_worker(index, "readiness", timeout=10) for index in range(self.count)),
+            return_exceptions=True
+        )
+        summaries = [result for result in results if not isinstance(result, Exception)]
+        merged = merge_summaries(summaries)
+        merged["workers_unavailable"] = len(results) - len(summaries)
+        if merged["workers_unavailable"]:
+            merged["complete"] = False
+        return merged
+
+    async def stop(self):
+        """Arrête les workers (SIGTERM : chacun termine ses transferts avant de quitter)"""
+        self._stopping = True
+        for writer in list(self.writers.values()):
+            writer.close()
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        from bot.shutdown import SHUTDOWN_DRAIN_TIMEOUT
+        for process in self.processes.values():
+            await asyncio.to_thread(process.join, SHUTDOWN_DRAIN_TIMEOUT + 10)
+            if process.is_alive():
+                process.kill()
+
+
+# Instance globale
+worker_pool = WorkerPool()
@@ -1,17 +1,13 @@
-from flask import Flask, jsonify, request
-import threading
+from aiohttp import web
+import hmac
 import time
 import os
 from datetime import datetime
 import logging
 
-# Configuration du logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-
-# Variables globales pour le statut
+# Variables globales pour le statut (modifiées uniquement depuis la boucle asyncio du bot)
 server_status = {
     "last_activity": time.time(),
     "start_time": time.time(),
@@ -19,56 +15,86 @@ server_status = {
     "wake_up_calls": 0
 }
 
-@app.route('/')
-def home():
-    """Page d'accueil"""
+routes = web.RouteTableDef()
+
+# Messages internes (/send-message, /trigger-message) : toujours envoyés à l'administrateur,
+# et protégés par un secret partagé (en-tête X-Internal-Secret) s'il est défini
+INTERNAL_API_SECRET = os.getenv("INTERNAL_API_SECRET", "")
+INTERNAL_SECRET_HEADER = "X-Internal-Secret"
+
+# Runner du serveur en cours d'exécution (arrêt propre)
+_runner = None
+
+@web.middleware
+async def count_requests(request, handler):
+    """Compte les requêtes par route déclarée (pas par chemin brut)"""
+    from bot.metrics import http_requests
+    resource = request.match_info.route.resource
+    http_requests.inc(path=resource.canonical if resource is not None else "unmatched")
+    return await handler(request)
+
+def internal_request_allowed(request):
+    """Vérifie le secret partagé des endpoints de messages internes"""
+    if not INTERNAL_API_SECRET:
+        return True
+    return hmac.compare_digest(request.headers.get(INTERNAL_SECRET_HEADER, ""), INTERNAL_API_SECRET)
+
+def internal_headers():
+    """En-têtes à joindre aux appels des endpoints de messages internes"""
+    return {INTERNAL_SECRET_HEADER: INTERNAL_API_SECRET} if INTERNAL_API_SECRET else {}
+
+def mark_activity(count_request=True):
+    """Met à jour l'activité du serveur"""
     server_status["last_activity"] = time.time()
-    server_status["requests_count"] += 1
-    
-    return jsonify({
+    if count_request:
+        server_status["requests_count"] += 1
+
+@routes.get('/')
+async def home(request):
+    """Page d'accueil"""
+    mark_activity()
+
+    return web.json_response({
         "status": "TeleFeed Bot Server Active",
         "uptime": int(time.time() - server_status["start_time"]),
         "last_activity": datetime.fromtimestamp(server_status["last_activity"]).strftime("%Y-%m-%d %H:%M:%S"),
         "requests_count": server_status["requests_count"]
     })
 
-@app.route('/ping')
-def ping():
+@routes.get('/ping')
+async def ping(request):
     """Endpoint pour les pings de maintien d'activité"""
-    server_status["last_activity"] = time.time()
-    server_status["requests_count"] += 1
-    
+    mark_activity()
+
     logger.info(f"📡 Ping reçu - {datetime.now().strftime('%H:%M:%S')}")
-    
-    return jsonify({
+
+    return web.json_response({
         "status": "pong",
         "timestamp": datetime.now().isoformat(),
         "server_active": True
     })
 
-@app.route('/wake-up')
-def wake_up():
+@routes.get('/wake-up')
+async def wake_up(request):
     """Endpoint pour réveiller le serveur"""
-    server_status["last_activity"] = time.time()
-    server_status["requests_count"] += 1
+    mark_activity()
     server_status["wake_up_calls"] += 1
-    
+
     logger.info("🔔 Serveur réveillé par le bot")
-    
-    return jsonify({
+
+    return web.json_response({
         "status": "D'accord Kouamé",
         "message": "Serveur Replit réveillé",
         "timestamp": datetime.now().isoformat(),
         "wake_up_calls": server_status["wake_up_calls"]
     })
 
-@app.route('/status')
-def status():
+@routes.get('/status')
+async def status(request):
     """Statut détaillé du serveur"""
-    server_status["last_activity"] = time.time()
-    server_status["requests_count"] += 1
-    
-    return jsonify({
+    mark_activity()
+
+    return web.json_response({
         "server_status": "active",
         "uptime_seconds": int(time.time() - server_status["start_time"]),
         "last_activity": datetime.fromtimestamp(server_status["last_activity"]).strftime("%Y-%m-%d %H:%M:%S"),
@@ -77,117 +103,144 @@ def status():
         "current_time": datetime.now().isoformat()
     })
 
-@app.route('/health')
-def health():
-    """Health check endpoint"""
-    server_status["last_activity"] = time.time()
-    
-    return jsonify({
-        "status": "healthy",
+@routes.get('/health')
+async def health(request):
+    """Health check endpoint (toujours 200 : le bot répond pendant la restauration des comptes)"""
+    mark_activity(count_request=False)
+    from bot.readiness import account_readiness
+    from bot.workers import worker_pool
+
+    restore = await worker_pool.readiness() if worker_pool.enabled else account_readiness.summary()
+    if not restore["complete"]:
+        state = "starting"
+    elif restore["failed"]:
+        state = "degraded"
+    else:
+        state = "healthy"
+
+    return web.json_response({
+        "status": state,
         "service": "TeleFeed Bot",
+        "restore": restore,
         "timestamp": datetime.now().isoformat()
     })
 
-@app.route('/send-message', methods=['POST'])
-def send_message():
+@routes.get('/metrics')
+async def metrics(request):
+    """Métriques au format Prometheus (avec celles des workers en mode multi-processus)"""
+    from bot.metrics import registry, merge_families, render
+    from bot.workers import worker_pool
+
+    families = registry.collect()
+    if worker_pool.enabled:
+        for index, worker_families in (await worker_pool.metrics()).items():
+            merge_families(families, worker_families, worker=index)
+    return web.Response(text=render(families), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+@routes.post('/send-message')
+async def send_message(request):
     """Endpoint pour que le serveur envoie un message via le bot"""
-    server_status["last_activity"] = time.time()
-    server_status["requests_count"] += 1
-    
+    mark_activity()
+
+    if not internal_request_allowed(request):
+        return web.json_response({"error": "Non autorisé"}, status=403)
+
     try:
-        data = request.json
-        admin_id = data.get('admin_id')
+        data = await request.json()
         message = data.get('message')
-        bot_token = data.get('bot_token')
-        
-        if not all([admin_id, message, bot_token]):
-            return jsonify({"error": "Paramètres manquants"}), 400
-        
-        # Envoyer le message via l'API Telegram HTTP
-        import requests
-        
-        telegram_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        payload = {
-            "chat_id": admin_id,
-            "text": message
-        }
-        
-        response = requests.post(telegram_url, json=payload, timeout=10)
-        
-        if response.status_code == 200:
+        # Le destinataire n'est jamais lu dans la requête
+        admin_id = int(os.getenv("ADMIN_ID") or "0")
+
+        if not all([admin_id, message]):
+            return web.json_response({"error": "Paramètres manquants"}, status=400)
+
+        # Envoi via le client du bot déjà connecté (file d'envoi partagée)
+        from bot.messenger import bot_messenger, QUEUED
+        sent = await bot_messenger.send(admin_id, message)
+
+        if sent == QUEUED:
+            # Toujours en file (ex. FLOOD_WAIT) : il sera envoyé plus tard
+            return web.json_response({
+                "status": "queued",
+                "message": "Message en file d'envoi",
+                "timestamp": datetime.now().isoformat()
+            }, status=202)
+        elif sent:
             logger.info(f"📨 Message envoyé depuis le SERVEUR REPLIT: {message}")
-            return jsonify({
+            return web.json_response({
                 "status": "success",
                 "message": "Message envoyé par le serveur Replit",
                 "timestamp": datetime.now().isoformat()
             })
         else:
-            logger.error(f"Échec envoi message Telegram: {response.status_code}")
-            return jsonify({"error": "Échec envoi Telegram"}), 500
-            
+            logger.error("Échec envoi message Telegram")
+            return web.json_response({"error": "Échec envoi Telegram"}, status=500)
+
     except Exception as e:
         logger.error(f"Erreur envoi message: {e}")
-        return jsonify({"error": "Erreur serveur"}), 500
+        return web.json_response({"error": "Erreur serveur"}, status=500)
 
-@app.route('/trigger-message', methods=['POST'])
-def trigger_message():
+@routes.post('/trigger-message')
+async def trigger_message(request):
     """Endpoint pour déclencher un message depuis le serveur"""
-    server_status["last_activity"] = time.time()
-    server_status["requests_count"] += 1
-    
+    mark_activity()
+
+    if not internal_request_allowed(request):
+        return web.json_response({"error": "Non autorisé"}, status=403)
+
     try:
-        data = request.json
-        admin_id = data.get('admin_id')
+        data = await request.json()
         message = data.get('message')
-        bot_token = data.get('bot_token')
-        
-        if not all([admin_id, message, bot_token]):
-            return jsonify({"error": "Paramètres manquants"}), 400
-        
-        # Envoyer le message via l'API Telegram HTTP
-        import requests
-        
-        telegram_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        payload = {
-            "chat_id": admin_id,
-            "text": message
-        }
-        
-        response = requests.post(telegram_url, json=payload, timeout=10)
-        
-        if response.status_code == 200:
+        # Le destinataire n'est jamais lu dans la requête
+        admin_id = int(os.getenv("ADMIN_ID") or "0")
+
+        if not all([admin_id, message]):
+            return web.json_response({"error": "Paramètres manquants"}, status=400)
+
+        # Envoi via le client du bot déjà connecté (file d'envoi partagée)
+        from bot.messenger import bot_messenger, QUEUED
+        sent = await bot_messenger.send(admin_id, message)
+
+        if sent == QUEUED:
+            # Toujours en file (ex. FLOOD_WAIT) : il sera envoyé plus tard
+            return web.json_response({
+                "status": "queued",
+                "message": "Message en file d'envoi",
+                "timestamp": datetime.now().isoformat(),
+                "source": "Serveur Replit HTTP"
+            }, status=202)
+        elif sent:
             logger.info(f"🔥 Message déclenché depuis le SERVEUR REPLIT: {message}")
-            return jsonify({
+            return web.json_response({
                 "status": "success",
                 "message": "Message déclenché par le serveur Replit",
                 "timestamp": datetime.now().isoformat(),
                 "source": "Serveur Replit HTTP"
             })
         else:
-            logger.error(f"Échec déclenchement message Telegram: {response.status_code}")
-            return jsonify({"error": "Échec déclenchement Telegram"}), 500
-            
+            logger.error("Échec déclenchement message Telegram")
+            return web.json_response({"error": "Échec déclenchement Telegram"}, status=500)
+
     except Exception as e:
         logger.error(f"Erreur déclenchement message: {e}")
-        return jsonify({"error": "Erreur serveur"}), 500
+        return web.json_response({"error": "Erreur serveur"}, status=500)
 
-@app.route('/railway-notification', methods=['POST'])
-def railway_notification():
+@routes.post('/railway-notification')
+async def railway_notification(request):
     """Endpoint pour recevoir les notifications de Railway"""
-    server_status["last_activity"] = time.time()
-    server_status["requests_count"] += 1
-    
+    mark_activity()
+
     try:
-        data = request.json
+        data = await request.json()
         event = data.get('event', 'unknown')
         message = data.get('message', '')
         railway_url = data.get('railway_url', '')
         timestamp = data.get('timestamp', datetime.now().isoformat())
-        
+
         if event == 'railway_deployment_success':
             logger.info(f"🚂 Notification Railway reçue: {message}")
             logger.info(f"🌐 URL Railway: {railway_url}")
-            
+
             # Log du succès du déploiement
             success_log = f"""
 DÉPLOIEMENT RAILWAY CONFIRMÉ:
@@ -198,85 +251,87 @@ DÉPLOIEMENT RAILWAY CONFIRMÉ:
 - Statut Replit: Opérationnel
             """
             logger.info(success_log)
-            
-            return jsonify({
+
+            return web.json_response({
                 "status": "notification_received",
                 "message": "Déploiement Railway confirmé",
                 "replit_status": "operational",
                 "timestamp": datetime.now().isoformat()
             })
-        
-        return jsonify({
+
+        return web.json_response({
             "status": "notification_received",
             "event": event,
             "timestamp": datetime.now().isoformat()
         })
-        
+
     except Exception as e:
         logger.error(f"Erreur notification Railway: {e}")
-        return jsonify({
+        return web.json_response({
             "status": "error",
             "error": str(e)
-        }), 500
+        }, status=500)
 
-@app.route('/sync', methods=['POST'])
-def sync_endpoint():
+@routes.post('/sync')
+async def sync_endpoint(request):
     """Endpoint pour synchronisation croisée des plateformes"""
-    server_status["last_activity"] = time.time()
-    server_status["requests_count"] += 1
-    
+    mark_activity()
+
     try:
-        data = request.json
+        data = await request.json()
         platform = data.get('platform', 'unknown')
         timestamp = data.get('timestamp', datetime.now().isoformat())
-        
+
         logger.debug(f"🔄 Sync reçu de {platform}")
-        
-        return jsonify({
+
+        return web.json_response({
             "status": "sync_received",
             "platform": "replit",
             "timestamp": datetime.now().isoformat()
         })
-        
+
     except Exception as e:
         logger.error(f"Erreur sync: {e}")
-        return jsonify({
+        return web.json_response({
             "status": "error",
             "error": str(e)
-        }), 500
+        }, status=500)
+
+def create_app(bot_client=None):
+    """Construit l'application HTTP (bot_client : client du bot partagé avec les endpoints)"""
+    app = web.Application(middlewares=[count_requests])
+    app["bot_client"] = bot_client
+    app.add_routes(routes)
+    return app
 
-def start_http_server():
-    """Démarrer le serveur HTTP"""
+async def start_http_server(bot_client=None):
+    """Démarrer le serveur HTTP dans la boucle asyncio du bot"""
+    global _runner
     port = int(os.environ.get('PORT', 8080))  # Port 8080 pour Replit
     logger.info(f"🌐 Démarrage du serveur HTTP sur le port {port}")
-    
+
+    runner = web.AppRunner(create_app(bot_client), access_log=None)
+    await runner.setup()
     try:
-        app.run(
-            host='0.0.0.0',
-            port=port,
-            debug=False,
-            use_reloader=False,
-            threaded=True
-        )
+        await web.TCPSite(runner, '0.0.0.0', port).start()
     except OSError as e:
-        if "Address already in use" in str(e):
+        if "Address already in use" in str(e) or "address already in use" in str(e):
             logger.info(f"⚠️ Port {port} occupé, tentative port {port+1}")
-            app.run(
-                host='0.0.0.0',
-                port=port+1,
-                debug=False,
-                use_reloader=False,
-                threaded=True
-            )
+            await web.TCPSite(runner, '0.0.0.0', port + 1).start()
         else:
+            await runner.cleanup()
             raise
+    _runner = runner
+    logger.info("🔄 Serveur HTTP démarré dans la boucle du bot")
+    return runner
 
-def start_server_in_background():
-    """Démarrer le serveur HTTP en arrière-plan"""
-    server_thread = threading.Thread(target=start_http_server, daemon=True)
-    server_thread.start()
-    logger.info("🔄 Serveur HTTP démarré en arrière-plan")
-    return server_thread
+async def stop_http_server():
+    """Arrêter le serveur HTTP"""
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
 
 if __name__ == "__main__":
-    start_http_server()
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_app(), host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
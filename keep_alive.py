@@ -5,6 +5,7 @@ from datetime import datetime
 import logging
 from telethon import TelegramClient
 import os
+from bot.http_pool import PooledSession
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +24,11 @@ class KeepAliveSystem:
         self.continuous_mode = False  # Mode normal par défaut - réveil seulement si inactif
         self.message_count = 0
         self.wake_up_active = False  # Indique si une séquence de réveil est en cours
+        self.http = PooledSession()  # Session HTTP partagée (créée au premier appel)
+
+    async def close(self):
+        """Ferme la session HTTP partagée"""
+        await self.http.close()
 
     async def start_keep_alive(self):
         """Démarrer le système de maintien d'activité"""
@@ -143,46 +149,46 @@ class KeepAliveSystem:
     async def trigger_server_message_to_bot(self):
         """Déclencher un message du serveur vers le bot"""
         try:
-            async with aiohttp.ClientSession() as session:
-                try:
-                    async with session.post(
-                        f"{self.server_url}/send-message",
-                        json={
-                            "admin_id": self.admin_id,
-                            "message": "🔔 Replit: Kouamé réveil toi",
-                            "bot_token": os.getenv("BOT_TOKEN")
-                        },
-                        timeout=aiohttp.ClientTimeout(total=10)
-                    ) as response:
-                        if response.status == 200:
-                            logger.info("🌐 Serveur Replit a envoyé le message de réveil")
-                        else:
-                            logger.warning(f"Échec message réveil serveur: {response.status}")
-                except Exception as e:
-                    logger.debug(f"Erreur message réveil serveur: {e}")
+            from http_server import internal_headers
+            session = self.http.get()
+            try:
+                async with session.post(
+                    f"{self.server_url}/send-message",
+                    json={
+                        "message": "🔔 Replit: Kouamé réveil toi"
+                    },
+                    headers=internal_headers(),
+                    timeout=aiohttp.ClientTimeout(total=10)
+                ) as response:
+                    if response.status == 200:
+                        logger.info("🌐 Serveur Replit a envoyé le message de réveil")
+                    else:
+                        logger.warning(f"Échec message réveil serveur: {response.status}")
+            except Exception as e:
+                logger.debug(f"Erreur message réveil serveur: {e}")
         except:
             pass
 
     async def make_server_request_with_response(self):
         """Faire une requête au serveur pour qu'il réponde"""
         try:
-            async with aiohttp.ClientSession() as session:
-                try:
-                    async with session.post(
-                        f"{self.server_url}/send-message",
-                        json={
-                            "admin_id": self.admin_id,
-                            "message": "✅ Replit: D'accord Kouamé",
-                            "bot_token": os.getenv("BOT_TOKEN")
-                        },
-                        timeout=aiohttp.ClientTimeout(total=10)
-                    ) as response:
-                        if response.status == 200:
-                            logger.info("🌐 Serveur Replit a répondu avec succès")
-                        else:
-                            logger.warning(f"Échec réponse serveur: {response.status}")
-                except Exception as e:
-                    logger.debug(f"Erreur réponse serveur: {e}")
+            from http_server import internal_headers
+            session = self.http.get()
+            try:
+                async with session.post(
+                    f"{self.server_url}/send-message",
+                    json={
+                        "message": "✅ Replit: D'accord Kouamé"
+                    },
+                    headers=internal_headers(),
+                    timeout=aiohttp.ClientTimeout(total=10)
+                ) as response:
+                    if response.status == 200:
+                        logger.info("🌐 Serveur Replit a répondu avec succès")
+                    else:
+                        logger.warning(f"Échec réponse serveur: {response.status}")
+            except Exception as e:
+                logger.debug(f"Erreur réponse serveur: {e}")
         except:
             pass
 
@@ -246,16 +252,16 @@ class KeepAliveSystem:
     async def test_server_connectivity(self):
         """Tester si le serveur répond (sans le réveiller)"""
         try:
-            async with aiohttp.ClientSession() as session:
-                try:
-                    async with session.get(
-                        f"{self.server_url}/ping",
-                        timeout=aiohttp.ClientTimeout(total=3)
-                    ) as response:
-                        if response.status == 200:
-                            return True
-                except:
-                    return False
+            session = self.http.get()
+            try:
+                async with session.get(
+                    f"{self.server_url}/ping",
+                    timeout=aiohttp.ClientTimeout(total=3)
+                ) as response:
+                    if response.status == 200:
+                        return True
+            except:
+                return False
         except:
             return False
         return False
@@ -263,17 +269,17 @@ class KeepAliveSystem:
     async def make_server_request(self):
         """Faire une requête au serveur"""
         try:
-            async with aiohttp.ClientSession() as session:
-                try:
-                    async with session.get(
-                        f"{self.server_url}/wake-up",
-                        timeout=aiohttp.ClientTimeout(total=5)
-                    ) as response:
-                        if response.status == 200:
-                            logger.info("🌐 Serveur contacté avec succès")
-                            self.last_server_activity = time.time()
-                except:
-                    pass  # Ignorer les erreurs de connexion
+            session = self.http.get()
+            try:
+                async with session.get(
+                    f"{self.server_url}/wake-up",
+                    timeout=aiohttp.ClientTimeout(total=5)
+                ) as response:
+                    if response.status == 200:
+                        logger.info("🌐 Serveur contacté avec succès")
+                        self.last_server_activity = time.time()
+            except:
+                pass  # Ignorer les erreurs de connexion
         except:
             pass
 
@@ -330,16 +336,16 @@ class KeepAliveSystem:
     async def ping_server_silent(self):
         """Ping silencieux du serveur - test de connectivité sans log"""
         try:
-            async with aiohttp.ClientSession() as session:
-                try:
-                    async with session.get(
-                        f"{self.server_url}/ping",
-                        timeout=aiohttp.ClientTimeout(total=3)
-                    ) as response:
-                        if response.status == 200:
-                            self.last_server_activity = time.time()
-                except:
-                    pass  # Silence - pas de log d'erreur pour les pings
+            session = self.http.get()
+            try:
+                async with session.get(
+                    f"{self.server_url}/ping",
+                    timeout=aiohttp.ClientTimeout(total=3)
+                ) as response:
+                    if response.status == 200:
+                        self.last_server_activity = time.time()
+            except:
+                pass  # Silence - pas de log d'erreur pour les pings
         except:
             pass
 
@@ -347,21 +353,21 @@ class KeepAliveSystem:
         """Ping serveur avec log"""
         try:
             # Faire une requête HTTP légère
-            async with aiohttp.ClientSession() as session:
-                try:
-                    async with session.get(
-                        f"{self.server_url}/ping",
-                        timeout=aiohttp.ClientTimeout(total=5)
-                    ) as response:
-                        if response.status == 200:
-                            self.last_server_activity = time.time()
-                            logger.info(f"🌐 Serveur ping - {datetime.now().strftime('%H:%M:%S')}")
-                        else:
-                            logger.warning(f"Ping serveur failed: {response.status}")
-                except asyncio.TimeoutError:
-                    logger.warning("Timeout ping serveur")
-                except Exception as e:
-                    logger.debug(f"Erreur ping serveur: {e}")
+            session = self.http.get()
+            try:
+                async with session.get(
+                    f"{self.server_url}/ping",
+                    timeout=aiohttp.ClientTimeout(total=5)
+                ) as response:
+                    if response.status == 200:
+                        self.last_server_activity = time.time()
+                        logger.info(f"🌐 Serveur ping - {datetime.now().strftime('%H:%M:%S')}")
+                    else:
+                        logger.warning(f"Ping serveur failed: {response.status}")
+            except asyncio.TimeoutError:
+                logger.warning("Timeout ping serveur")
+            except Exception as e:
+                logger.debug(f"Erreur ping serveur: {e}")
 
         except Exception as e:
             logger.error(f"Erreur ping serveur: {e}")
@@ -1,10 +1,13 @@
 import os
-from dotenv import load_dotenv
-from bot.handlers import start_bot_sync
-from http_server import start_server_in_background
-import threading
 
 if __name__ == "__main__":
+    # Imports sous le garde : les workers (multiprocessing spawn) réimportent ce module
+    from bot.startup import startup_timer
+
+    with startup_timer.phase("import"):
+        from dotenv import load_dotenv
+        from bot.handlers import start_bot_sync
+
     # Charger les variables d'environnement
     load_dotenv()
     print("✅ Fichier .env chargé")
@@ -14,8 +17,5 @@ if __name__ == "__main__":
     os.environ['PORT'] = str(server_port)
     print("🚀 bot déployé avec succès")
 
-    # Start HTTP server in background
-    server_thread = start_server_in_background()
-    
-    # Start the bot (main process)
-    start_bot_sync()
\ No newline at end of file
+    # Start the bot (main process) - le serveur HTTP tourne dans la boucle du bot
+    start_bot_sync()